@@ -0,0 +1,219 @@
+"""
+Batch runs of the product feature crew over a file of feature requests.
+
+The input is JSONL (one {"feature_request": ..., "id": ...} object per line)
+or CSV (a feature_request column and an optional id column). Requests run
+concurrently on a bounded pool of threads, each crew a clone of the compiled
+template (see crew_product_feature), and each held to the default RunBudget.
+
+Every item writes to its own directory: the crew's output files, one file
+per task output, and result.json with its status, timings and token usage.
+result.json is written last, so an item with a completed result.json is
+finished; a rerun skips those items and retries the rest.
+
+    run_batch features.jsonl --concurrency 4 --output-dir batch_runs
+"""
+
+import argparse
+import contextvars
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from crewai_demo.budget import RunBudget, usage_report
+from crewai_demo.crew_product_feature import new_product_feature_crew
+from crewai_demo.run_context import BudgetExceededError, RunCancelledError, RunContext, current_run
+from crewai_demo.stats import percentile
+
+
+RESULT_FILE = "result.json"
+
+
+def read_requests(path: str) -> List[Dict[str, str]]:
+    """Items of a JSONL or CSV file, each with an id and a feature_request"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{number}: not JSON: {e}")
+                # A bare string is a feature request on its own
+                rows.append({"feature_request": row} if isinstance(row, str) else row)
+
+    items = []
+    seen = set()
+    for number, row in enumerate(rows, 1):
+        feature_request = (row.get("feature_request") or "").strip()
+        if not feature_request:
+            raise ValueError(f"{path}: item {number} has no feature_request")
+        # Stable across reruns of the same file, so finished items can be recognized
+        item_id = str(row.get("id") or "").strip() or hashlib.sha256(feature_request.encode("utf-8")).hexdigest()[:12]
+        item_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in item_id)
+        if item_id in seen:
+            raise ValueError(f"{path}: duplicate id {item_id} (item {number})")
+        seen.add(item_id)
+        items.append({"id": item_id, "feature_request": feature_request})
+    return items
+
+
+def load_result(item_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(item_dir, RESULT_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    """Write through a temporary file, so an interrupted write never leaves a partial result"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(temp_path, path)
+
+
+def run_item(item: Dict[str, str], item_dir: str, run: RunContext) -> Dict[str, Any]:
+    """Run the crew for one item on the calling thread and write its outputs and result.json"""
+    os.makedirs(item_dir, exist_ok=True)
+    crew = new_product_feature_crew()
+    task_names = {}
+    for index, task in enumerate(crew.tasks):
+        task_names[str(task.id)] = task.name or f"task_{index + 1}"
+        if task.output_file:
+            task.output_file = os.path.join(item_dir, os.path.basename(task.output_file))
+
+    result: Dict[str, Any] = {
+        "id": item["id"],
+        "feature_request": item["feature_request"],
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    started = time.monotonic()
+    current_run.set(run)
+    try:
+        output = crew.kickoff(inputs={"feature_request": item["feature_request"]})
+        for index, task_output in enumerate(output.tasks_output):
+            name = task_output.name or f"task_{index + 1}"
+            with open(os.path.join(item_dir, f"{name}.md"), "w", encoding="utf-8") as f:
+                f.write(task_output.raw or "")
+        result["status"] = "completed"
+    except BudgetExceededError as e:
+        result.update(status="stopped", error=str(e))
+    except RunCancelledError:
+        # Interrupted; no result, so the item runs again next time
+        return {**result, "status": "interrupted"}
+    except Exception as e:
+        result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        current_run.set(None)
+
+    result["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    result["duration"] = round(time.monotonic() - started, 3)
+    usage = {}
+    for task_id, task_usage in run.usage_snapshot().items():
+        usage[task_names.get(task_id, task_id)] = task_usage
+    result["token_usage"] = usage_report(usage)
+    _write_json(os.path.join(item_dir, RESULT_FILE), result)
+    return result
+
+
+def run_batch(items: List[Dict[str, str]], output_dir: str, concurrency: int,
+              budget: Optional[RunBudget] = None) -> List[Dict[str, Any]]:
+    """Run the items not already completed in output_dir, at most concurrency at a time"""
+    budget = budget or RunBudget.from_env()
+    pending = []
+    for item in items:
+        previous = load_result(os.path.join(output_dir, item["id"]))
+        if previous and previous.get("status") == "completed":
+            continue
+        pending.append(item)
+    skipped = len(items) - len(pending)
+    print(f"{len(items)} items, {skipped} already completed, {len(pending)} to run with concurrency {concurrency}")
+
+    results: List[Dict[str, Any]] = []
+    runs: Dict[Future, RunContext] = {}
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        for item in pending:
+            run = RunContext(run_id=item["id"], budget=budget)
+            # Each item runs in its own context, so current_run doesn't leak between items of a thread
+            future = pool.submit(contextvars.copy_context().run, run_item, item,
+                                 os.path.join(output_dir, item["id"]), run)
+            runs[future] = run
+        remaining = set(runs)
+        while remaining:
+            done, remaining = wait(remaining, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                print(f"[{len(results)}/{len(pending)}] {result['id']}: {result['status']} "
+                      f"in {result.get('duration', 0):.1f}s" + (f" ({result['error']})" if result.get("error") else ""))
+    except KeyboardInterrupt:
+        print("Interrupted; stopping running items. Rerun the same command to resume.", file=sys.stderr)
+        for run in runs.values():
+            run.cancel()
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return results
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Counts by status, throughput and latency percentiles of finished items"""
+    finished = [result for result in results if result["status"] != "interrupted"]
+    durations = [result["duration"] for result in finished]
+    statuses: Dict[str, int] = {}
+    for result in finished:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    return {
+        "items": len(finished),
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 1),
+        "throughput_per_minute": round(len(finished) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_seconds": {
+            "p50": round(percentile(durations, 50), 1),
+            "p90": round(percentile(durations, 90), 1),
+            "p95": round(percentile(durations, 95), 1),
+            "max": round(max(durations, default=0), 1),
+        },
+        "total_tokens": sum(result["token_usage"]["total_tokens"] for result in finished),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the product feature crew for every request in a JSONL or CSV file")
+    parser.add_argument("requests", help="JSONL or CSV file of feature requests")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                        help="Crews run at the same time (default: 4, or BATCH_CONCURRENCY)")
+    parser.add_argument("--output-dir", default="batch_runs", help="One directory per item is created here")
+    args = parser.parse_args(argv)
+
+    items = read_requests(args.requests)
+    os.makedirs(args.output_dir, exist_ok=True)
+    started = time.monotonic()
+    try:
+        results = run_batch(items, args.output_dir, max(1, args.concurrency))
+    except KeyboardInterrupt:
+        sys.exit(130)
+    summary = summarize(results, time.monotonic() - started)
+    _write_json(os.path.join(args.output_dir, "summary.json"), summary)
+
+    latency = summary["latency_seconds"]
+    print(f"Finished {summary['items']} items in {summary['elapsed_seconds']}s: "
+          + ", ".join(f"{count} {status}" for status, count in sorted(summary["statuses"].items())))
+    print(f"Throughput: {summary['throughput_per_minute']} items/min; latency p50 {latency['p50']}s, "
+          f"p90 {latency['p90']}s, p95 {latency['p95']}s, max {latency['max']}s; {summary['total_tokens']} tokens")
+    if any(result["status"] != "completed" for result in results):
+        sys.exit(1)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the pipeline around the LLM.
+
+- crew: product-feature crew runs through EnhancedCrewExecutor against the
+  mock LLM server, and the time per run not spent waiting on LLM calls
+- logger: AgentOutputLogger._send_message throughput
+- broadcast: ConnectionManager broadcast and fan-out latency at 1 to 1000 clients
+- serialization: encoding run messages in each wire format
+- clean_output: _clean_frontend_output_file on multi-megabyte files
+
+Results are written as JSON. Given a baseline (an earlier results file),
+metrics that got worse by more than the threshold are reported and the
+command exits with status 1.
+
+    benchmark --output bench.json
+    benchmark --baseline bench.json --threshold 0.2 --only logger broadcast
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from crewai_demo.cassette import ReplayPace
+from crewai_demo.mock_llm_server import MockLLMServer
+from crewai_demo.stats import percentile
+
+
+BENCHMARKS = ("crew", "logger", "broadcast", "serialization", "clean_output")
+CLIENT_COUNTS = (1, 10, 100, 1000)
+CLEAN_OUTPUT_SIZES_MB = (1, 4, 16)
+# Stray dots a model puts around the page, as the cleaner removes them one at a time
+STRAY_DOTS = 50
+FEATURE_REQUEST = "Build a login page with username, password and a remember me option."
+
+Results = Dict[str, Dict[str, Any]]
+
+
+def _metric(value: float, unit: str, better: str = "lower") -> Dict[str, Any]:
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+
+def _distribution(results: Results, name: str, samples: Sequence[float], unit: str, scale: float = 1.0):
+    results[f"{name}.p50"] = _metric(percentile(samples, 50) * scale, unit)
+    results[f"{name}.p95"] = _metric(percentile(samples, 95) * scale, unit)
+
+
+def _covered(intervals: List[Tuple[float, float]]) -> float:
+    """Total time covered by possibly overlapping intervals, e.g. LLM calls of parallel tasks"""
+    total = 0.0
+    end = float("-inf")
+    for start, stop in sorted(intervals):
+        if stop <= end:
+            continue
+        total += stop - max(start, end)
+        end = stop
+    return total
+
+
+class _NullWebSocket:
+    """WebSocket stand-in that accepts every frame immediately"""
+
+    def __init__(self):
+        self.scope = {"subprotocols": []}
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def _connect_clients(manager, count: int, topic: str) -> list:
+    connections = []
+    for _ in range(count):
+        connection = await manager.connect(_NullWebSocket())
+        manager.subscribe(connection, topic)
+        connections.append(connection)
+    await _delivered(connections, 1)  # the welcome message
+    return connections
+
+
+async def _delivered(connections: list, count: int):
+    """Wait until every connection has written count messages"""
+    while any(connection.sent < count for connection in connections):
+        await asyncio.sleep(0)
+
+
+def _message(message_type, size: int, seq: int = 0, run_id: str = "bench"):
+    from crewai_demo.web_ui.backend.models import WebSocketMessage
+    return WebSocketMessage(
+        type=message_type,
+        timestamp=datetime.now(),
+        run_id=run_id,
+        seq=seq,
+        agent="Backend Engineer",
+        task="backend_development_task",
+        data={"output": ("lorem ipsum " * (size // 12 + 1))[:size], "output_type": "backend_api"},
+        progress=50,
+    )
+
+
+async def bench_crew(runs: int) -> Results:
+    """Crew runs against the mock LLM, which answers instantly; what remains is our own overhead"""
+    server = MockLLMServer(("127.0.0.1", 0), None, ReplayPace(), fallback_tokens=200)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.update(MODEL="openai/mock", BASE_URL=base_url, OPENAI_API_BASE=base_url,
+                      OPENAI_API_KEY="mock", LLM_CACHE="off", LLM_CASSETTE_MODE="off")
+    for name in ("API_BASE", "AZURE_API_BASE"):
+        os.environ.pop(name, None)
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+    os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+
+    from crewai_demo.budget import RunBudget
+    from crewai_demo.crew_product_feature import compiled_product_feature_crew
+    from crewai_demo.llm import default_llm
+    from crewai_demo.web_ui.backend.crew_executor import EnhancedCrewExecutor
+    from crewai_demo.web_ui.backend.custom_logger import AgentOutputLogger
+    from crewai_demo.web_ui.backend.websocket_handler import ConnectionManager, run_topic
+
+    # The crew template and its LLM are built on first use, now with the mock server's settings
+    default_llm.cache_clear()
+    compiled_product_feature_crew.cache_clear()
+
+    manager = ConnectionManager(max_queue=100000)
+    durations: List[float] = []
+    overheads: List[float] = []
+    llm_calls: List[int] = []
+    try:
+        with tempfile.TemporaryDirectory() as output_root:
+            for i in range(runs):
+                run_id = f"bench-{i}"
+                connections = await _connect_clients(manager, 1, run_topic(run_id))
+                logger = AgentOutputLogger(websocket_send_callback=manager.send_websocket_message, run_id=run_id)
+                executor = EnhancedCrewExecutor(logger, output_dir=os.path.join(output_root, run_id),
+                                                execution_mode="dag", budget=RunBudget())
+                result = await executor.execute_crew(FEATURE_REQUEST)
+                if not result.success:
+                    raise RuntimeError(f"Benchmark crew run failed: {result.error_message}")
+                await _delivered(connections, logger.seq + 1)
+                for connection in connections:
+                    connection.close()
+
+                spans = executor.tracer.spans()
+                run_span = next(span for span in spans if span["kind"] == "run")
+                calls = [(span["start"], span["end"]) for span in spans if span["kind"] == "llm_call"]
+                duration = run_span["end"] - run_span["start"]
+                durations.append(duration)
+                overheads.append(duration - _covered(calls))
+                llm_calls.append(len(calls))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    results: Results = {"crew.first_run_seconds": _metric(durations[0], "s")}
+    # The first run also builds the crew; later runs show the steady state
+    warm = slice(1, None) if runs > 1 else slice(None)
+    _distribution(results, "crew.overhead_ms", overheads[warm], "ms", 1000)
+    _distribution(results, "crew.run_ms", durations[warm], "ms", 1000)
+    results["crew.llm_calls"] = _metric(statistics.mean(llm_calls), "calls")
+    return results
+
+
+async def bench_logger(messages: int = 20000) -> Results:
+    from crewai_demo.web_ui.backend.custom_logger import AgentOutputLogger
+    from crewai_demo.web_ui.backend.models import MessageType
+
+    async def discard(message):
+        pass
+
+    logger = AgentOutputLogger(websocket_send_callback=discard, run_id="bench")
+    batch = [_message(MessageType.AGENT_THINKING, 200) for _ in range(messages)]
+    started = time.perf_counter()
+    for message in batch:
+        await logger._send_message(message)
+    elapsed = time.perf_counter() - started
+    return {
+        "logger.send_message_per_second": _metric(messages / elapsed, "msg/s", "higher"),
+        "logger.send_message_us": _metric(elapsed / messages * 1e6, "us"),
+    }
+
+
+async def bench_broadcast(messages: int = 100) -> Results:
+    from crewai_demo.web_ui.backend.models import MessageType
+    from crewai_demo.web_ui.backend.websocket_handler import ConnectionManager, run_topic
+
+    results: Results = {}
+    for clients in CLIENT_COUNTS:
+        manager = ConnectionManager(max_queue=messages + 16)
+        connections = await _connect_clients(manager, clients, run_topic("bench"))
+        broadcast: List[float] = []
+        fan_out: List[float] = []
+        for seq in range(1, messages + 1):
+            message = _message(MessageType.AGENT_OUTPUT, 2048, seq)
+            started = time.perf_counter()
+            await manager.send_websocket_message(message)
+            broadcast.append(time.perf_counter() - started)
+            # Until the last client has written it
+            await _delivered(connections, seq + 1)
+            fan_out.append(time.perf_counter() - started)
+        for connection in connections:
+            connection.close()
+        _distribution(results, f"broadcast.{clients}_clients.enqueue_us", broadcast, "us", 1e6)
+        _distribution(results, f"broadcast.{clients}_clients.fan_out_ms", fan_out, "ms", 1000)
+    return results
+
+
+async def bench_serialization(iterations: int = 2000) -> Results:
+    from crewai_demo.web_ui.backend.models import MessageType
+    from crewai_demo.web_ui.backend.wire_format import DEFLATE, JSON, EncodedMessage, supported_subprotocols
+
+    results: Results = {}
+    protocols = [JSON] + supported_subprotocols()
+    for label, size in (("200b", 200), ("4kb", 4096), ("64kb", 65536)):
+        message = _message(MessageType.AGENT_OUTPUT, size)
+        for protocol in protocols:
+            name = {JSON: "json", DEFLATE: "deflate"}[protocol]
+            started = time.perf_counter()
+            for _ in range(iterations):
+                # A new EncodedMessage each time, as every broadcast serializes afresh
+                EncodedMessage(message).encode(protocol)
+            results[f"serialization.{name}.{label}_us"] = _metric(
+                (time.perf_counter() - started) / iterations * 1e6, "us"
+            )
+    return results
+
+
+async def bench_clean_output(repeats: int = 3) -> Results:
+    from crewai_demo.web_ui.backend.crew_executor import EnhancedCrewExecutor
+    from crewai_demo.web_ui.backend.custom_logger import AgentOutputLogger
+
+    executor = EnhancedCrewExecutor(AgentOutputLogger(run_id="bench"))
+    results: Results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "frontend_code.html")
+        for size_mb in CLEAN_OUTPUT_SIZES_MB:
+            body = "<div class=\"row\"><p>Lorem ipsum dolor sit amet.</p></div>\n"
+            filler = body * (size_mb * 1024 * 1024 // len(body))
+            content = (". " * STRAY_DOTS + "Here is the page:\n<!DOCTYPE html>\n<html><body>\n"
+                       + filler + "</body></html>\nHope this helps" + " ." * STRAY_DOTS)
+            timings = []
+            for _ in range(repeats):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(content)
+                started = time.perf_counter()
+                executor._clean_frontend_output_file(path)
+                timings.append(time.perf_counter() - started)
+            results[f"clean_output.{size_mb}mb_ms"] = _metric(statistics.median(timings) * 1000, "ms")
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than threshold (0.2 = 20%)"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name, {}).get("value")
+        if not before:
+            continue
+        change = (result["value"] - before) / before
+        if result["better"] == "higher":
+            change = -change
+        if change > threshold:
+            regressions.append(f"{name}: {before:g} -> {result['value']:g} {result['unit']} ({change:+.0%} worse)")
+    return regressions
+
+
+async def run_benchmarks(names: Sequence[str], runs: int) -> Results:
+    suites: Dict[str, Callable[[], Awaitable[Results]]] = {
+        "crew": lambda: bench_crew(runs),
+        "logger": bench_logger,
+        "broadcast": bench_broadcast,
+        "serialization": bench_serialization,
+        "clean_output": bench_clean_output,
+    }
+    results: Results = {}
+    for name in names:
+        print(f"Running {name} benchmark...", file=sys.stderr)
+        results.update(await suites[name]())
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the crew pipeline without LLM latency")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=5, help="Crew runs for the crew benchmark")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Earlier results file to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCHMARK_THRESHOLD", "0.2")),
+                        help="Relative change counted as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    from crewai_demo.web_ui.backend.structured_logging import configure_logging
+    configure_logging(level=os.getenv("LOG_LEVEL", "WARNING"))
+
+    results = asyncio.run(run_benchmarks(args.only, max(1, args.runs)))
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(f"{name:<{width}}  {result['value']:>12.3f} {result['unit']}")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%} against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Token and time budgets for crew runs, usage reports, and dry-run estimates.
+
+CrewLLM.call records the tokens of every call against its task (see
+RunContext.record_usage) and checks the run's RunBudget before and after it.
+A run over budget stops itself like a stopped run, at the next cancellation
+check of each of its tasks, with BudgetExceededError. The run time budget is
+enforced by the executor, which can also stop a crew blocked in a tool.
+
+A task's time is counted from its first LLM call, which is the first thing
+an agent does.
+"""
+
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from crewai_demo.run_context import RunContext
+
+
+# Prompt text CrewAI adds around the role, goal, backstory and task (format instructions, tool list, ...)
+PROMPT_OVERHEAD_CHARS = 1500
+# Completion length assumed for tasks without history
+DEFAULT_COMPLETION_TOKENS = 1000
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class RunBudget:
+    """Limits for one run; 0 means no limit"""
+
+    run_tokens: int = 0
+    task_tokens: int = 0
+    run_seconds: float = 0
+    task_seconds: float = 0
+
+    @classmethod
+    def from_env(cls, **overrides) -> "RunBudget":
+        """Limits from RUN_TOKEN_BUDGET, TASK_TOKEN_BUDGET, RUN_TIME_BUDGET_SECONDS and
+        TASK_TIME_BUDGET_SECONDS, with overrides that are not None taking precedence"""
+        budget = cls(
+            run_tokens=int(os.getenv("RUN_TOKEN_BUDGET", "0")),
+            task_tokens=int(os.getenv("TASK_TOKEN_BUDGET", "0")),
+            run_seconds=float(os.getenv("RUN_TIME_BUDGET_SECONDS", "0")),
+            task_seconds=float(os.getenv("TASK_TIME_BUDGET_SECONDS", "0")),
+        )
+        for name, value in overrides.items():
+            if value is not None:
+                setattr(budget, name, value)
+        return budget
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def check(self, run: RunContext, task_id: Optional[str]):
+        """Stop the run, raising BudgetExceededError, if it or the task is over budget"""
+        usage = run.usage_snapshot()
+        reason = None
+        if self.task_tokens and task_id in usage:
+            used = _tokens(usage[task_id])
+            if used > self.task_tokens:
+                reason = f"Task token budget exceeded: {used} of {self.task_tokens} tokens used"
+        if reason is None and self.run_tokens:
+            used = sum(_tokens(task_usage) for task_usage in usage.values())
+            if used > self.run_tokens:
+                reason = f"Run token budget exceeded: {used} of {self.run_tokens} tokens used"
+        if reason is None and self.task_seconds and task_id:
+            elapsed = run.task_elapsed(task_id)
+            if elapsed > self.task_seconds:
+                reason = f"Task time budget exceeded: {elapsed:.0f}s of {self.task_seconds:g}s"
+        if reason is not None:
+            run.exceed_budget(reason)
+        run.check_cancelled()
+
+
+def _tokens(usage: Dict[str, Any]) -> int:
+    return usage["prompt_tokens"] + usage["completion_tokens"]
+
+
+def usage_report(task_usage: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-task usage with run totals, and cost when LLM_PROMPT_PRICE_PER_1K / LLM_COMPLETION_PRICE_PER_1K are set"""
+    prompt_price = float(os.getenv("LLM_PROMPT_PRICE_PER_1K", "0"))
+    completion_price = float(os.getenv("LLM_COMPLETION_PRICE_PER_1K", "0"))
+
+    def with_cost(usage: Dict[str, Any]) -> Dict[str, Any]:
+        usage = dict(usage, total_tokens=_tokens(usage))
+        if prompt_price or completion_price:
+            usage["cost"] = round(usage["prompt_tokens"] / 1000 * prompt_price
+                                  + usage["completion_tokens"] / 1000 * completion_price, 6)
+        return usage
+
+    tasks = {name: with_cost(usage) for name, usage in task_usage.items()}
+    totals = with_cost({
+        "prompt_tokens": sum(usage["prompt_tokens"] for usage in tasks.values()),
+        "completion_tokens": sum(usage["completion_tokens"] for usage in tasks.values()),
+        "llm_calls": sum(usage["llm_calls"] for usage in tasks.values()),
+    })
+    return {"tasks": tasks, **totals}
+
+
+def estimate_usage(crew: Any, task_names: List[str], inputs: Dict[str, Any],
+                   history: Optional[Dict[str, Dict[str, float]]] = None,
+                   budget: Optional[RunBudget] = None) -> Dict[str, Any]:
+    """Expected and worst-case tokens of a run, without calling an LLM.
+
+    history maps task names to average prompt/completion tokens of past runs
+    and is used where available; otherwise prompts are sized from the agent
+    and task text. The worst case has every agent use all of its max_iter
+    iterations, each resending the growing conversation.
+    """
+    history = history or {}
+    tasks: Dict[str, Dict[str, Any]] = {}
+    completion_by_task: Dict[int, int] = {}
+    for task, name in zip(crew.tasks, task_names):
+        agent = task.agent
+        completion = int(history.get(name, {}).get("completion_tokens") or DEFAULT_COMPLETION_TOKENS)
+        if isinstance(task.context, list):
+            context_tokens = sum(completion_by_task.get(id(context), 0) for context in task.context)
+        elif task.context:
+            # No explicit context: like Process.sequential (and TaskGraph), the outputs of every earlier task
+            context_tokens = sum(completion_by_task.values())
+        else:
+            context_tokens = 0
+        text = " ".join(str(part) for part in (
+            agent.role, agent.goal, agent.backstory,
+            _interpolate(task.description, inputs), task.expected_output,
+        ))
+        prompt = (len(text) + PROMPT_OVERHEAD_CHARS) // CHARS_PER_TOKEN + context_tokens
+        completion_by_task[id(task)] = completion
+
+        max_calls = (getattr(agent, "max_iter", None) or 1) + 1
+        if name in history:
+            expected = int(history[name]["prompt_tokens"] + history[name]["completion_tokens"])
+            source = "history"
+        else:
+            expected = prompt + completion
+            source = "estimate"
+        # Each iteration resends the conversation so far, which grows by one completion per call
+        worst = sum(prompt + i * completion for i in range(max_calls)) + max_calls * completion
+        tasks[name] = {
+            "agent": agent.role,
+            "max_llm_calls": max_calls,
+            "expected_tokens": expected,
+            "max_tokens": worst,
+            "source": source,
+        }
+
+    report = {
+        "tasks": tasks,
+        "expected_tokens": sum(task["expected_tokens"] for task in tasks.values()),
+        "max_tokens": sum(task["max_tokens"] for task in tasks.values()),
+    }
+    if budget is not None:
+        report["budget"] = budget.to_dict()
+        report["within_budget"] = (
+            (not budget.run_tokens or report["expected_tokens"] <= budget.run_tokens)
+            and (not budget.task_tokens
+                 or all(task["expected_tokens"] <= budget.task_tokens for task in tasks.values()))
+        )
+    return report
+
+
+def _interpolate(text: str, inputs: Dict[str, Any]) -> str:
+    try:
+        return text.format(**inputs)
+    except (KeyError, IndexError, ValueError):
+        return text
@@ -0,0 +1,171 @@
+"""
+LLM cassettes: recorded LLM requests and responses, replayed without a provider.
+
+A cassette is a JSONL file with one line per LLM call. The line holds the
+request, the response, its prompt and completion tokens and how long the
+provider took. Record mode (LLM_CASSETTE_MODE=record) appends every call
+CrewLLM sends to the provider. Replay mode answers calls from the cassette,
+paced by a configurable latency and token rate, so a crew runs
+deterministically with no network. The bundled mock server
+(crewai_demo.mock_llm_server) serves the same cassettes over an
+OpenAI-compatible API, for code that builds its own LLM.
+
+Calls are matched on their messages and tools only, so a cassette recorded
+with one model replays with any model name. A request recorded more than
+once is answered with its responses in recorded order, the last one
+repeating.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from crewai_demo.budget import CHARS_PER_TOKEN
+
+
+CASSETTE_MODES = ("record", "replay")
+
+
+class CassetteMissError(LookupError):
+    """A replayed call has no recorded response"""
+
+
+def request_key(messages: Any, tools: Optional[List[dict]] = None) -> str:
+    """Hash of the messages and tools of a call, in the shape an OpenAI-compatible server receives them"""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    payload = json.dumps(
+        {
+            "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+            "tools": tools or None,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Recording:
+    """One recorded LLM call"""
+
+    key: str
+    model: str
+    messages: Any
+    response: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    duration: float = 0.0
+
+
+@dataclass
+class ReplayPace:
+    """Timing of replayed responses: latency before the first token, then tokens_per_second (0 for all at once)"""
+
+    latency_ms: float = 0
+    tokens_per_second: float = 0
+
+    @classmethod
+    def from_env(cls) -> "ReplayPace":
+        return cls(
+            latency_ms=float(os.getenv("LLM_REPLAY_LATENCY_MS", "0")),
+            tokens_per_second=float(os.getenv("LLM_REPLAY_TOKENS_PER_SECOND", "0")),
+        )
+
+    def chunks(self, text: str, completion_tokens: int = 0) -> Iterator[str]:
+        """The text in token-sized chunks, each yielded when it is due"""
+        start = time.monotonic() + self.latency_ms / 1000
+        tokens = completion_tokens or max(1, len(text) // CHARS_PER_TOKEN)
+        if not self.tokens_per_second or not text:
+            _sleep_until(start)
+            yield text
+            return
+        size = max(1, -(-len(text) // tokens))
+        for i, offset in enumerate(range(0, len(text), size)):
+            # Deadlines from the start, so slow consumers don't stretch the whole response
+            _sleep_until(start + i / self.tokens_per_second)
+            yield text[offset:offset + size]
+
+
+def _sleep_until(deadline: float):
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+class Cassette:
+    """Recordings of one JSONL file, appended to in record mode and read in replay mode"""
+
+    def __init__(self, path: str, mode: str = "replay", pace: Optional[ReplayPace] = None):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(CASSETTE_MODES)} or off")
+        self.path = path
+        self.mode = mode
+        self.pace = pace or ReplayPace()
+        self._lock = threading.Lock()
+        self._recordings: Dict[str, List[Recording]] = {}
+        # Key -> index of the recording its next call is answered with
+        self._cursors: Dict[str, int] = {}
+        if mode == "replay":
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """Cassette configured by LLM_CASSETTE_MODE, LLM_CASSETTE_PATH and LLM_REPLAY_*; None when off"""
+        mode = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+        if mode in ("off", "0", "false", "no", ""):
+            return None
+        return cls(
+            path=os.getenv("LLM_CASSETTE_PATH", os.path.join("cassettes", "llm.jsonl")),
+            mode=mode,
+            pace=ReplayPace.from_env(),
+        )
+
+    def _load(self):
+        try:
+            f = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"LLM cassette {self.path} does not exist; record it with LLM_CASSETTE_MODE=record")
+        with f:
+            for line in f:
+                if line.strip():
+                    recording = Recording(**json.loads(line))
+                    self._recordings.setdefault(recording.key, []).append(recording)
+
+    def __len__(self) -> int:
+        return sum(len(recordings) for recordings in self._recordings.values())
+
+    def record(self, model: str, messages: Any, tools: Optional[List[dict]], response: str,
+               prompt_tokens: int = 0, completion_tokens: int = 0, duration: float = 0.0):
+        recording = Recording(request_key(messages, tools), model, messages, response,
+                              prompt_tokens, completion_tokens, round(duration, 4))
+        line = json.dumps(asdict(recording), default=str) + "\n"
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # One write per line in append mode, so worker processes recording together don't interleave lines
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def find(self, messages: Any, tools: Optional[List[dict]] = None) -> Optional[Recording]:
+        """The next recorded response to a call, or None"""
+        key = request_key(messages, tools)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                return None
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = min(index + 1, len(recordings) - 1)
+            return recordings[index]
+
+    def replay(self, messages: Any, tools: Optional[List[dict]] = None) -> Recording:
+        recording = self.find(messages, tools)
+        if recording is None:
+            raise CassetteMissError(
+                f"No response recorded in {self.path} for this LLM call; re-record the cassette "
+                "after changing prompts, inputs or agents"
+            )
+        return recording
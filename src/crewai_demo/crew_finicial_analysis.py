@@ -4,6 +4,8 @@ from crewai.agents.agent_builder.base_agent import BaseAgent
 from typing import List
 from crewai.tools import SerperDevTool, ScrapeWebsiteTool
 
+from crewai_demo.llm import default_llm
+
 @CrewBase
 class CrewFinancialAnalysis():
 
@@ -23,6 +25,7 @@ class CrewFinancialAnalysis():
                 "to provide crucial insights. With a knack for data, "
                 "the Data Analyst Agent is the cornerstone for "
                 "informing trading decisions.",
+        llm=default_llm(),
         verbose=True,
         allow_delegation=True,
         tools = [scrape_tool, search_tool]
@@ -40,6 +43,7 @@ class CrewFinancialAnalysis():
                 "devises and refines trading strategies. It evaluates "
                 "the performance of different approaches to determine "
                 "the most profitable and risk-averse options.",
+            llm=default_llm(),
             verbose=True,
             allow_delegation=True,
             tools = [scrape_tool, search_tool]
@@ -55,6 +59,7 @@ class CrewFinancialAnalysis():
                 "risks of proposed trades. It offers a detailed analysis of "
                 "risk exposure and suggests safeguards to ensure that "
                 "trading activities align with the firm’s risk tolerance.",
+            llm=default_llm(),
             verbose=True,
             allow_delegation=True,
             tools = [scrape_tool, search_tool]
@@ -71,6 +76,7 @@ class CrewFinancialAnalysis():
                 "devises and refines trading strategies. It evaluates "
                 "the performance of different approaches to determine "
                 "the most profitable and risk-averse options.",
+        llm=default_llm(),
         verbose=True,
         allow_delegation=True,
         tools = [scrape_tool, search_tool]
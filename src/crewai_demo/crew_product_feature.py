@@ -1,9 +1,15 @@
+from functools import lru_cache
+
 from crewai import Agent, Task, Crew, Process
+from crewai.project import agent, task
 
+from crewai_demo.llm import default_llm
 
-class CrewFeatureDevelopment():
 
+class CrewFeatureDevelopment():
+    """Product feature crew; @agent/@task memoize, so context lists share Task instances"""
 
+    @agent
     def product_manager_agent(self) -> Agent:
         return Agent(
         role="Product Manager",
@@ -13,9 +19,11 @@ class CrewFeatureDevelopment():
                     "prioritized tasks that align with business objectives. "
                     "You always consider usability, feasibility, and value when writing requirements.",
         verbose=True,
+        llm=default_llm(),
         max_iter=2,  
     )
 
+    @agent
     def uiux_designer_agent(self) -> Agent:
         return Agent(
             role="UI/UX Designer",
@@ -24,8 +32,11 @@ class CrewFeatureDevelopment():
                     "You take product requirements and transform them into user journeys, wireframes, and style notes that engineers "
                     "can build upon. You think like the end-user and aim to maximize clarity and engagement in your designs.",
             verbose=True,
+            llm=default_llm(),
             max_iter=2,  
         )
+
+    @agent
     def backend_engineer_agent(self) -> Agent:
         return Agent(
             role="Backend Engineer",
@@ -34,9 +45,11 @@ class CrewFeatureDevelopment():
                     "You design reliable APIs and efficient data models that ensure features can scale and integrate smoothly "
                     "with existing systems. You anticipate potential bottlenecks and provide developers with clear implementation plans.",
             verbose=True,
+            llm=default_llm(),
             max_iter=2,  
         )
 
+    @agent
     def frontend_engineer_agent(self) -> Agent:
         return Agent(
             role="HTML Code Generator",
@@ -50,9 +63,11 @@ class CrewFeatureDevelopment():
                         "You ALWAYS create modern, responsive designs with proper styling for every element. "
                         "Your output is ALWAYS a complete, working HTML file with no extra characters.",
             verbose=True,
+            llm=default_llm(),
             max_iter=1,  
         )
 
+    @task
     def product_design_task(self) -> Task:
         return Task(
             description="Take the raw feature request {feature_request} and break it into a structured product specification with goals, "
@@ -61,6 +76,7 @@ class CrewFeatureDevelopment():
             agent=self.product_manager_agent()
         )            
 
+    @task
     def uiux_design_task(self) -> Task:
         return Task(
             description="Based on the product spec from the previous task, propose a wireframe/design brief with layout, elements, and style notes.",
@@ -69,6 +85,7 @@ class CrewFeatureDevelopment():
             context=[self.product_design_task()]
         )
 
+    @task
     def backend_development_task(self) -> Task:
         return Task(
             description="Based on the product spec from the first task, define API endpoints, database schema, and backend logic needed.",
@@ -77,6 +94,7 @@ class CrewFeatureDevelopment():
             context=[self.product_design_task()]
         )
 
+    @task
     def frontend_development_task(self) -> Task:
         return Task(
             description="""CRITICAL: You MUST generate ONLY a complete HTML file with embedded CSS and JavaScript.
@@ -134,4 +152,15 @@ class CrewFeatureDevelopment():
                     self.frontend_development_task()],
             process=Process.sequential,
             verbose=True
-        )
\ No newline at end of file
+        )
+
+
+@lru_cache(maxsize=None)
+def compiled_product_feature_crew() -> Crew:
+    """Build the product feature crew once per process; treat it as a read-only template"""
+    return CrewFeatureDevelopment().product_feature_crew()
+
+
+def new_product_feature_crew() -> Crew:
+    """Clone the compiled crew for one run; agents keep the template's LLM clients"""
+    return compiled_product_feature_crew().copy()
@@ -0,0 +1,181 @@
+"""
+Crew that runs tasks as a dependency graph instead of one after another.
+
+Dependencies come from each Task's ``context``: a task starts as soon as every
+task in its context has finished, so independent tasks run concurrently.
+"""
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from crewai import Crew, Process, Task
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.tasks.task_output import TaskOutput
+from crewai.crews.crew_output import CrewOutput
+from crewai.utilities.formatter import aggregate_raw_outputs_from_task_outputs
+from pydantic import Field, PrivateAttr
+
+from crewai_demo.run_context import current_run
+
+
+class TaskGraph:
+    """Dependency graph of a crew's tasks, built from each task's context"""
+
+    def __init__(self, tasks: List[Task]):
+        self.tasks = tasks
+        index_by_key = {task.key: i for i, task in enumerate(tasks)}
+        self.dependencies: List[List[int]] = []
+
+        for i, task in enumerate(tasks):
+            if isinstance(task.context, list):
+                # Match by key so context tasks built as separate instances still resolve
+                deps = {index_by_key[t.key] for t in task.context if t.key in index_by_key}
+                deps.discard(i)
+            elif task.context:
+                # No explicit context: like Process.sequential, depend on every earlier task
+                deps = set(range(i))
+            else:
+                deps = set()
+            if any(dep > i for dep in deps):
+                raise ValueError(f"Task '{task.description[:60]}' depends on a later task")
+            self.dependencies.append(sorted(deps))
+
+    def ready(self, done: set, started: set) -> List[int]:
+        """Indices of tasks whose dependencies are all done and that have not started"""
+        return [
+            i for i, deps in enumerate(self.dependencies)
+            if i not in started and all(dep in done for dep in deps)
+        ]
+
+    def critical_path(self, durations: Dict[int, float]) -> tuple[List[int], float]:
+        """Longest dependency chain by measured task duration"""
+        finish: Dict[int, float] = {}
+        previous: Dict[int, Optional[int]] = {}
+        for i, deps in enumerate(self.dependencies):
+            slowest = max(deps, key=lambda dep: finish[dep], default=None)
+            previous[i] = slowest
+            finish[i] = (finish[slowest] if slowest is not None else 0.0) + durations.get(i, 0.0)
+
+        if not finish:
+            return [], 0.0
+        node = max(finish, key=finish.get)
+        length = finish[node]
+        path = []
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return list(reversed(path)), length
+
+
+class DagCrew(Crew):
+    """Crew that executes independent tasks concurrently"""
+
+    task_start_callback: Optional[Callable[[int, Task], Any]] = Field(
+        default=None,
+        description="Called with (task_index, task) when a task starts running.",
+    )
+    max_parallel_tasks: Optional[int] = Field(
+        default=None,
+        description="Maximum number of tasks running at the same time (default: no limit).",
+    )
+    _schedule_report: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def from_crew(cls, crew: Crew, **kwargs) -> "DagCrew":
+        """Wrap an existing crew's agents and tasks"""
+        return cls(
+            agents=crew.agents,
+            tasks=crew.tasks,
+            process=crew.process,
+            verbose=crew.verbose,
+            step_callback=crew.step_callback,
+            task_callback=crew.task_callback,
+            **kwargs,
+        )
+
+    @property
+    def schedule_report(self) -> Dict[str, Any]:
+        """Timings of the last run: wall time, summed task time and the critical path"""
+        return dict(self._schedule_report)
+
+    def _execute_tasks(
+        self,
+        tasks: List[Task],
+        start_index: Optional[int] = 0,
+        was_replayed: bool = False,
+    ) -> CrewOutput:
+        # Replays, hierarchical crews and conditional tasks keep CrewAI's own ordering
+        if (
+            start_index
+            or self.process != Process.sequential
+            or any(isinstance(task, ConditionalTask) for task in tasks)
+        ):
+            return super()._execute_tasks(tasks, start_index, was_replayed)
+
+        graph = TaskGraph(tasks)
+        outputs: Dict[int, TaskOutput] = {}
+        started_at: Dict[int, float] = {}
+        durations: Dict[int, float] = {}
+        run_start = time.perf_counter()
+
+        max_workers = self.max_parallel_tasks or len(tasks)
+        pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dag-task")
+        running = {}
+        try:
+            while len(outputs) < len(tasks):
+                for i in graph.ready(set(outputs), set(started_at)):
+                    started_at[i] = time.perf_counter()
+                    dep_outputs = [outputs[dep] for dep in graph.dependencies[i]]
+                    # Carry the caller's context (e.g. the current run) into the worker thread
+                    worker_context = contextvars.copy_context()
+                    future = pool.submit(worker_context.run, self._run_graph_task, i, tasks[i], dep_outputs)
+                    running[future] = i
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    # Raises the task's error, including RunCancelledError from a stopped run
+                    output = future.result()
+                    durations[i] = time.perf_counter() - started_at[i]
+                    outputs[i] = output
+                    self._process_task_result(tasks[i], output)
+                    self._store_execution_log(tasks[i], output, i, was_replayed)
+        except BaseException:
+            # Report the failure now rather than after the running siblings' LLM calls: stop the run so
+            # they unwind at their next cancellation check, and drop the tasks not started yet
+            run = current_run.get()
+            if run is not None:
+                run.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+        path, path_time = graph.critical_path(durations)
+        self._schedule_report = {
+            "wall_time": time.perf_counter() - run_start,
+            "total_task_time": sum(durations.values()),
+            "task_durations": durations,
+            "critical_path": path,
+            "critical_path_time": path_time,
+        }
+        return self._create_crew_output([outputs[i] for i in range(len(tasks))])
+
+    def _run_graph_task(self, index: int, task: Task, dep_outputs: List[TaskOutput]) -> TaskOutput:
+        """Execute one task with the outputs of its dependencies as context"""
+        run = current_run.get()
+        if run is not None:
+            run.check_cancelled()
+
+        agent = self._get_agent_to_use(task)
+        if agent is None:
+            raise ValueError(f"No agent available for task: {task.description}")
+
+        tools = self._prepare_tools(agent, task, task.tools or agent.tools or [])
+        self._log_task_start(task, agent.role)
+        if self.task_start_callback:
+            self.task_start_callback(index, task)
+
+        context = aggregate_raw_outputs_from_task_outputs(dep_outputs) if dep_outputs else ""
+        return task.execute_sync(agent=agent, context=context, tools=tools)
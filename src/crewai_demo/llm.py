@@ -0,0 +1,264 @@
+"""
+LLM used by every crew agent.
+
+CrewLLM is CrewAI's LLM with a response cache at the call boundary. Identical
+prompts (same model, parameters and rendered messages, which include the task
+context) are answered from the cache instead of the provider.
+
+Responses are streamed; each token is handed to the token sink of the run that
+made the call (see RunContext.token_sink). A stopped run raises
+RunCancelledError before each call and on the next streamed chunk, which stops
+reading the provider's response.
+
+The tokens of every call are recorded against its task, and the run's budget
+is checked before and after it (see budget). Calls of a traced run get an
+llm_call span with the tokens the call used and the size of its request and
+response (see tracing).
+
+Calls that go to the provider pass the process's LLMRateLimiter first, when
+one is configured (see rate_limit); cache hits and replayed calls don't.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from crewai import LLM
+from crewai.utilities.events import LLMStreamChunkEvent, crewai_event_bus
+
+from crewai_demo.cassette import Cassette
+from crewai_demo.llm_cache import LLMResponseCache, cache_key
+from crewai_demo.rate_limit import CallStats, LLMRateLimiter, estimate_tokens, shared_rate_limiter
+from crewai_demo.run_context import RunContext, current_run
+
+
+# CallStats of the rate limited provider call made by this thread's current call, for its span
+_call_stats = threading.local()
+
+
+class CrewLLM(LLM):
+    """CrewAI LLM with a content-addressed response cache"""
+
+    def __init__(self, model: str, response_cache: Optional[LLMResponseCache] = None,
+                 cassette: Optional[Cassette] = None, rate_limiter: Optional[LLMRateLimiter] = None, **kwargs):
+        super().__init__(model=model, **kwargs)
+        self.response_cache = response_cache
+        self.cassette = cassette
+        self.rate_limiter = rate_limiter
+
+    def _cache_params(self) -> Dict[str, Any]:
+        """Parameters that change the response, as part of the cache key"""
+        response_format = self.response_format
+        if response_format is not None:
+            response_format = getattr(response_format, "__name__", str(response_format))
+        return {
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "n": self.n,
+            "stop": self.stop,
+            "max_tokens": self.max_tokens or self.max_completion_tokens,
+            "presence_penalty": self.presence_penalty,
+            "frequency_penalty": self.frequency_penalty,
+            "seed": self.seed,
+            "response_format": response_format,
+            "reasoning_effort": self.reasoning_effort,
+        }
+
+    def call(
+        self,
+        messages: str | List[Dict[str, str]],
+        tools: Optional[List[dict]] = None,
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ) -> str | Any:
+        run = current_run.get()
+        if run is None:
+            return self._call(None, messages, tools, callbacks, available_functions, **kwargs)[0]
+
+        run.check_cancelled()
+        task = kwargs.get("from_task")
+        task_id = str(task.id) if task is not None else "unattributed"
+        agent = kwargs.get("from_agent") or getattr(task, "agent", None)
+        if run.budget is not None:
+            run.budget.check(run, task_id)
+        run.record_llm_call()
+
+        traced = (
+            run.tracer.span("llm.call", "llm_call", task_id=getattr(task, "id", None), model=self.model,
+                            request_bytes=_payload_bytes(messages))
+            if run.tracer is not None else nullcontext()
+        )
+        with traced as span:
+            prompt_before, completion_before = _token_totals(callbacks)
+            _call_stats.value = None
+            response, cached = self._call(run, messages, tools, callbacks, available_functions, **kwargs)
+            prompt_after, completion_after = _token_totals(callbacks)
+            prompt_tokens = prompt_after - prompt_before
+            completion_tokens = completion_after - completion_before
+            if span is not None:
+                span.attributes.update(cached=cached, prompt_tokens=prompt_tokens,
+                                       completion_tokens=completion_tokens,
+                                       response_bytes=_payload_bytes(response))
+                stats = _call_stats.value
+                if stats is not None:
+                    span.attributes.update(queue_wait=round(stats.queue_wait, 4), rate_limited=stats.rate_limited)
+
+        run.record_usage(task_id, getattr(agent, "role", None), prompt_tokens, completion_tokens)
+        if run.budget is not None:
+            run.budget.check(run, task_id)
+        return response
+
+    def _call(self, run: Optional[RunContext], messages, tools, callbacks, available_functions,
+              **kwargs) -> Tuple[Any, bool]:
+        """The response, from the cache or the provider, and whether it came from the cache"""
+        # Calls that execute functions have side effects and are never cached
+        if self.response_cache is None or available_functions:
+            response = self._provider_call(messages, tools, callbacks, available_functions, **kwargs)
+            if run is not None:
+                run.check_cancelled()
+            return response, False
+
+        key = cache_key(self.model, self._cache_params(), messages, tools)
+        cached = self.response_cache.get(key)
+        if run is not None:
+            run.record_cache(hit=cached is not None)
+        if cached is not None:
+            return cached, True
+
+        response = self._provider_call(messages, tools, callbacks, available_functions, **kwargs)
+        # Don't cache or use a response that arrived after the run was stopped
+        if run is not None:
+            run.check_cancelled()
+        if isinstance(response, str) and response.strip():
+            self.response_cache.put(key, self.model, response)
+        return response, False
+
+    def _provider_call(self, messages, tools, callbacks, available_functions, **kwargs) -> Any:
+        """The provider's response, recorded to or replayed from the cassette if there is one"""
+        if self.cassette is not None and self.cassette.mode == "replay":
+            return self._replay(messages, tools, callbacks, **kwargs)
+
+        send = functools.partial(super().call, messages, tools=tools, callbacks=callbacks,
+                                 available_functions=available_functions, **kwargs)
+        prompt_before, completion_before = _token_totals(callbacks)
+        start = time.monotonic()
+        queue_wait = 0.0
+        if self.rate_limiter is None:
+            response = send()
+        else:
+            stats = _call_stats.value = CallStats()
+            response = self._rate_limited(send, messages, callbacks, stats)
+            queue_wait = stats.queue_wait
+        # Function-call results depend on local state and aren't recorded
+        if self.cassette is not None and isinstance(response, str) and not available_functions:
+            prompt_after, completion_after = _token_totals(callbacks)
+            self.cassette.record(self.model, messages, tools, response,
+                                 prompt_tokens=prompt_after - prompt_before,
+                                 completion_tokens=completion_after - completion_before,
+                                 duration=time.monotonic() - start - queue_wait)
+        return response
+
+    def _rate_limited(self, send, messages, callbacks, stats: CallStats) -> Any:
+        """send() through the rate limiter, counting its queue wait and 429s against the run"""
+        run = current_run.get()
+        prompt_before, completion_before = _token_totals(callbacks)
+
+        def used_tokens() -> Optional[int]:
+            prompt_after, completion_after = _token_totals(callbacks)
+            # 0 when the caller has no token callbacks; the estimate then stands
+            return prompt_after - prompt_before + completion_after - completion_before
+
+        estimated = estimate_tokens(_payload_bytes(messages), self.max_tokens or self.max_completion_tokens)
+        try:
+            return self.rate_limiter.call(send, estimated, stats, used_tokens,
+                                          check=run.check_cancelled if run is not None else None)
+        finally:
+            if run is not None:
+                run.record_rate_limit(stats.queue_wait, stats.rate_limited)
+
+    def _replay(self, messages, tools, callbacks, **kwargs) -> str:
+        recording = self.cassette.replay(messages, tools)
+        for chunk in self.cassette.pace.chunks(recording.response, recording.completion_tokens):
+            if self.stream:
+                crewai_event_bus.emit(self, event=LLMStreamChunkEvent(
+                    chunk=chunk, from_task=kwargs.get("from_task"), from_agent=kwargs.get("from_agent"),
+                ))
+        # Count the recorded usage, as the provider's usage callback would have
+        for callback in callbacks or []:
+            process = getattr(callback, "token_cost_process", None)
+            if process is not None:
+                process.sum_prompt_tokens(recording.prompt_tokens)
+                process.sum_completion_tokens(recording.completion_tokens)
+                process.sum_successful_requests(1)
+        return recording.response
+
+
+def _token_totals(callbacks: Optional[List[Any]]) -> Tuple[int, int]:
+    """Prompt and completion tokens counted so far by the calling agent's token callbacks.
+
+    CrewAI hands each agent's TokenCalcHandler to the LLM call, so the
+    difference across one call is that call's usage.
+    """
+    prompt = completion = 0
+    for callback in callbacks or []:
+        process = getattr(callback, "token_cost_process", None)
+        if process is not None:
+            prompt += process.prompt_tokens
+            completion += process.completion_tokens
+    return prompt, completion
+
+
+def _payload_bytes(payload: Any) -> int:
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, default=str)
+    return len(payload.encode("utf-8"))
+
+
+def _forward_stream_chunk(source: Any, event: LLMStreamChunkEvent):
+    """Event bus handler; runs on the thread making the LLM call, so current_run is the caller's run"""
+    run = current_run.get()
+    if run is not None:
+        # Propagates through the event bus and out of CrewAI's streaming loop
+        run.check_cancelled()
+    if run is not None and run.token_sink is not None and getattr(event, "tool_call", None) is None and event.chunk:
+        run.token_sink(event.task_id, event.chunk)
+
+
+crewai_event_bus.register_handler(LLMStreamChunkEvent, _forward_stream_chunk)
+
+
+def build_llm(**kwargs) -> CrewLLM:
+    """Build a CrewLLM from the same environment variables CrewAI uses for its default LLM"""
+    model = (
+        os.getenv("MODEL")
+        or os.getenv("MODEL_NAME")
+        or os.getenv("OPENAI_MODEL_NAME")
+        or "gpt-4o-mini"
+    )
+    base_url = os.getenv("BASE_URL") or os.getenv("OPENAI_API_BASE") or os.getenv("OPENAI_BASE_URL")
+    api_base = os.getenv("API_BASE") or os.getenv("AZURE_API_BASE")
+
+    kwargs.setdefault("cassette", Cassette.from_env())
+    recording = kwargs["cassette"] is not None and kwargs["cassette"].mode == "record"
+    # Cache hits never reach the provider, so a recording run skips the cache to record every call
+    kwargs.setdefault("response_cache", None if recording else LLMResponseCache.from_env())
+    kwargs.setdefault("rate_limiter", shared_rate_limiter())
+    kwargs.setdefault("stream", os.getenv("LLM_STREAM", "on").lower() not in ("0", "off", "false", "no"))
+    return CrewLLM(
+        model=model,
+        base_url=base_url or api_base,
+        api_base=api_base or base_url,
+        **kwargs,
+    )
+
+
+@lru_cache(maxsize=None)
+def default_llm() -> CrewLLM:
+    """LLM shared by all crew agents in this process"""
+    return build_llm()
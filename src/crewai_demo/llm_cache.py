@@ -0,0 +1,142 @@
+"""
+Content-addressed, SQLite-backed cache for LLM responses
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def cache_key(model: str, params: Dict[str, Any], messages: Any, tools: Optional[List[dict]] = None) -> str:
+    """Hash of everything that determines an LLM response"""
+    payload = json.dumps(
+        {"model": model, "params": params, "messages": messages, "tools": tools},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """LLM response store with a size cap, TTL expiry and least-recently-used eviction"""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_created_at ON llm_responses(created_at)")
+        # Running total of response sizes, kept by triggers so every process sharing the file sees it
+        # and eviction doesn't sum the table on every put
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO llm_cache_size (id, total)
+                VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM llm_responses));
+            CREATE TRIGGER IF NOT EXISTS llm_responses_size_insert AFTER INSERT ON llm_responses
+                BEGIN UPDATE llm_cache_size SET total = total + NEW.size WHERE id = 0; END;
+            CREATE TRIGGER IF NOT EXISTS llm_responses_size_delete AFTER DELETE ON llm_responses
+                BEGIN UPDATE llm_cache_size SET total = total - OLD.size WHERE id = 0; END;
+            CREATE TRIGGER IF NOT EXISTS llm_responses_size_update AFTER UPDATE OF size ON llm_responses
+                BEGIN UPDATE llm_cache_size SET total = total + NEW.size - OLD.size WHERE id = 0; END;
+            """
+        )
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        """Build the cache from LLM_CACHE* environment variables (None when disabled)"""
+        if os.getenv("LLM_CACHE", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        ttl = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3")),
+            max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            ttl_seconds=ttl if ttl > 0 else None,
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, or None when missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE llm_responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            return response
+
+    def put(self, key: str, model: str, response: str):
+        """Store a response and evict entries beyond the size cap"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete wouldn't fire the size trigger
+            self._conn.execute(
+                "INSERT INTO llm_responses (key, model, response, size, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT(key) DO UPDATE SET model = excluded.model, response = excluded.response, "
+                "size = excluded.size, created_at = excluded.created_at, last_access = excluded.last_access, hits = 0",
+                (key, model, response, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        total = self._conn.execute("SELECT total FROM llm_cache_size WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_responses ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and total size of the store"""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
@@ -4,6 +4,7 @@ import warnings
 
 from datetime import datetime
 
+from crewai_demo import batch
 from crewai_demo.crew import CrewaiDemo
 from crewai_demo.crew_product_feature import CrewFeatureDevelopment
 
@@ -29,6 +30,13 @@ def run():
         raise Exception(f"An error occurred while running the crew: {e}")
 
 
+def run_batch():
+    """
+    Run the crew for every feature request in a JSONL or CSV file.
+    """
+    batch.main(sys.argv[1:])
+
+
 def train():
     """
     Train the crew for a given number of iterations.
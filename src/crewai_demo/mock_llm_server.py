@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Local OpenAI-compatible LLM server that answers from an LLM cassette.
+
+Serves POST /v1/chat/completions (streamed or not) and GET /v1/models,
+pacing responses like a provider (see cassette.ReplayPace). Without a
+cassette, or with --fallback-tokens, calls with no recording get a canned
+final answer of that many tokens. This lets crews run offline, and
+measures the pipeline's own overhead with no model latency in it.
+
+    python -m crewai_demo.mock_llm_server --cassette cassettes/llm.jsonl --latency-ms 300 --tokens-per-second 60
+
+Point any crew at it with MODEL=openai/mock OPENAI_API_BASE=http://127.0.0.1:11435/v1
+OPENAI_API_KEY=mock.
+"""
+
+import argparse
+import json
+import logging
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from crewai_demo.budget import CHARS_PER_TOKEN
+from crewai_demo.cassette import Cassette, Recording, ReplayPace, request_key
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORT = 11435
+
+
+def canned_response(tokens: int) -> str:
+    """A final answer CrewAI's output parser accepts, about tokens long"""
+    filler = " ".join(f"Item {i}: placeholder output from the mock LLM server." for i in range(1, tokens // 10 + 2))
+    return "Thought: I now can give a great answer\nFinal Answer: " + filler[:max(1, tokens) * CHARS_PER_TOKEN]
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """HTTP server answering chat completions from a cassette"""
+
+    daemon_threads = True
+
+    def __init__(self, address, cassette: Optional[Cassette], pace: ReplayPace,
+                 fallback_tokens: int = 0, model: str = "mock"):
+        super().__init__(address, _Handler)
+        self.cassette = cassette
+        self.pace = pace
+        self.fallback_tokens = fallback_tokens
+        self.model = model
+
+    def answer(self, body: Dict[str, Any]) -> Optional[Recording]:
+        """The recording to answer a request with, or None when there is none"""
+        messages = body.get("messages") or []
+        recording = self.cassette.find(messages, body.get("tools")) if self.cassette is not None else None
+        if recording is None and self.fallback_tokens:
+            prompt_chars = sum(len(str(message.get("content") or "")) for message in messages)
+            recording = Recording(request_key(messages, body.get("tools")), self.model, messages,
+                                  canned_response(self.fallback_tokens),
+                                  prompt_tokens=prompt_chars // CHARS_PER_TOKEN,
+                                  completion_tokens=self.fallback_tokens)
+        return recording
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockLLMServer
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/v1/models":
+            self._send_json(404, _error("Not found", "not_found"))
+            return
+        self._send_json(200, {"object": "list", "data": [
+            {"id": self.server.model, "object": "model", "created": 0, "owned_by": "mock"},
+        ]})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, _error("Not found", "not_found"))
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, _error("Request body is not JSON", "invalid_json"))
+            return
+
+        recording = self.server.answer(body)
+        if recording is None:
+            log.warning("No recorded response for a chat completion", extra={"messages": len(body.get("messages") or [])})
+            self._send_json(404, _error("No response recorded in the cassette for this request", "cassette_miss"))
+            return
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = body.get("model") or self.server.model
+        usage = {
+            "prompt_tokens": recording.prompt_tokens,
+            "completion_tokens": recording.completion_tokens,
+            "total_tokens": recording.prompt_tokens + recording.completion_tokens,
+        }
+        chunks = self.server.pace.chunks(recording.response, recording.completion_tokens)
+        if body.get("stream"):
+            self._stream(completion_id, model, chunks, usage)
+            return
+        text = "".join(chunks)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id: str, model: str, chunks, usage: Dict[str, int]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def event(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for chunk in chunks:
+                event({"content": chunk})
+            event({}, "stop", usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. its run was stopped
+            pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        log.debug(format, *args)
+
+
+def _error(message: str, code: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": "invalid_request_error", "code": code}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM server replaying an LLM cassette")
+    parser.add_argument("--cassette", help="Cassette to replay (JSONL, recorded with LLM_CASSETTE_MODE=record)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Token rate of responses; 0 for all at once")
+    parser.add_argument("--fallback-tokens", type=int, default=None,
+                        help="Answer requests with no recording with a canned answer of this many tokens "
+                             "(default: 200 without a cassette, otherwise 0, an error)")
+    parser.add_argument("--model", default="mock", help="Model name listed by /v1/models")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    cassette = Cassette(args.cassette, "replay") if args.cassette else None
+    fallback_tokens = args.fallback_tokens if args.fallback_tokens is not None else (0 if cassette else 200)
+    server = MockLLMServer((args.host, args.port), cassette, ReplayPace(args.latency_ms, args.tokens_per_second),
+                           fallback_tokens=fallback_tokens, model=args.model)
+
+    log.info("Mock LLM server listening on http://%s:%d/v1 (%s)", args.host, args.port,
+             f"{len(cassette)} recorded calls from {args.cassette}" if cassette else "canned answers only")
+    print(f"Use it with: MODEL=openai/{args.model} OPENAI_API_BASE=http://{args.host}:{args.port}/v1 OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
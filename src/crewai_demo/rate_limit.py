@@ -0,0 +1,327 @@
+"""
+Rate limiting of the LLM calls of every crew in a process, or across processes.
+
+Every CrewLLM call that goes to the provider first passes LLMRateLimiter:
+
+- Token buckets hold it to LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE.
+  A call takes its request and its estimated tokens (the prompt's size plus
+  max_tokens) up front, and the estimate is corrected with the tokens the
+  call actually used. With LLM_RATE_LIMIT_PATH the buckets live in a SQLite
+  file, so worker processes and batch runs on one machine share them.
+- An AIMD concurrency limit caps calls in flight in this process: it grows
+  by one per limit's worth of calls that succeed in time, and is cut by
+  LLM_CONCURRENCY_BACKOFF on a 429 or a call slower than
+  LLM_LATENCY_TARGET_SECONDS, at most once per call duration so a burst of
+  429s from the same moment counts once.
+- A 429 is retried here, after the provider's Retry-After or an exponential
+  backoff, instead of failing the agent's whole step.
+
+The time a call waited before it was sent is its queue wait; it is added to
+the call's llm_call span and to the run (see RunContext.record_rate_limit).
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Optional, Tuple, TypeVar
+
+from crewai_demo.budget import CHARS_PER_TOKEN
+
+
+T = TypeVar("T")
+
+# Longest sleep between cancellation checks while waiting
+POLL_SECONDS = 0.25
+# Completion tokens reserved for a call with no max_tokens, until its usage is known
+DEFAULT_COMPLETION_TOKENS = 512
+
+
+class RateLimitedError(Exception):
+    """A call still rate limited by the provider after its retries"""
+
+
+@dataclass
+class CallStats:
+    """What rate limiting cost one call"""
+
+    queue_wait: float = 0.0
+    # 429 responses the call got before it went through (or gave up)
+    rate_limited: int = 0
+
+
+def estimate_tokens(request_bytes: int, max_tokens: Optional[int] = None) -> int:
+    """Tokens a call is expected to use: its prompt and the most it may generate"""
+    return request_bytes // CHARS_PER_TOKEN + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an error is a provider's 429, also when CrewAI re-raised it as a plain Exception"""
+    return _rate_limit_cause(error) is not None
+
+
+def _rate_limit_cause(error: Optional[BaseException]) -> Optional[BaseException]:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError":
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked to wait in its Retry-After header, if it did"""
+    cause = _rate_limit_cause(error)
+    headers = getattr(getattr(cause, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class TokenBucket:
+    """Allowance of a unit (requests or tokens) refilled at per_minute, holding up to one minute's worth"""
+
+    def __init__(self, name: str, per_minute: float):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float) -> float:
+        """Take amount if the bucket holds it and return 0, otherwise the seconds until it will"""
+        # More than a minute's worth would never fit; it waits for a full bucket instead
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.time()
+            self._tokens = _refill(self._tokens, self._updated_at, now, self.rate, self.capacity)
+            self._updated_at = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def adjust(self, amount: float):
+        """Take amount more (or give back a negative amount) without waiting; the bucket may go below zero"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """TokenBucket whose level is kept in a SQLite file shared by processes"""
+
+    def __init__(self, name: str, per_minute: float, path: str):
+        super().__init__(name, per_minute)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+            (name, self.capacity, time.time()),
+        )
+
+    def _update(self, change: Callable[[float], Tuple[float, float]]) -> float:
+        """Apply change(level) -> (new level, result) to the refilled level in one write transaction"""
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two processes can't take the same tokens
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated_at = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                tokens, result = change(_refill(tokens, updated_at, now, self.rate, self.capacity))
+                self._conn.execute(
+                    "UPDATE rate_buckets SET tokens = ?, updated_at = ? WHERE name = ?", (tokens, now, self.name)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def take(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+
+        def change(tokens: float) -> Tuple[float, float]:
+            if tokens >= amount:
+                return tokens - amount, 0.0
+            return tokens, (amount - tokens) / self.rate
+
+        return self._update(change)
+
+    def adjust(self, amount: float):
+        self._update(lambda tokens: (min(self.capacity, tokens - amount), 0.0))
+
+
+class AdaptiveConcurrency:
+    """Cap on calls in flight, raised additively and cut multiplicatively (AIMD)"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, latency_target: float = 0.0, backoff: float = 0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    def acquire(self, check: Optional[Callable[[], None]] = None):
+        """Wait for a free slot, calling check (which may raise) while waiting"""
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait(POLL_SECONDS)
+                    if check is not None:
+                        check()
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self, latency: float, rate_limited: bool = False):
+        """Free a slot and adjust the limit by how the call went"""
+        with self._cond:
+            self.in_flight -= 1
+            slow = bool(self.latency_target) and latency > self.latency_target
+            if rate_limited or slow:
+                now = time.monotonic()
+                if now - self._last_decrease >= max(latency, 1.0):
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                # Grows by one after a whole limit's worth of good calls
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class LLMRateLimiter:
+    """Request and token buckets, an adaptive concurrency limit and 429 retries around provider calls"""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_concurrency: int = 0,
+                 min_concurrency: int = 1, latency_target: float = 0.0, backoff: float = 0.5,
+                 retries: int = 3, path: Optional[str] = None):
+        def bucket(name: str, per_minute: float) -> Optional[TokenBucket]:
+            if per_minute <= 0:
+                return None
+            return SQLiteTokenBucket(name, per_minute, path) if path else TokenBucket(name, per_minute)
+
+        self.requests = bucket("requests", requests_per_minute)
+        self.tokens = bucket("tokens", tokens_per_minute)
+        self.concurrency = (
+            AdaptiveConcurrency(max_concurrency, min_concurrency, latency_target, backoff)
+            if max_concurrency > 0 else None
+        )
+        self.retries = retries
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMRateLimiter"]:
+        """Limiter configured by the LLM_* rate limit variables; None when no limit is set"""
+        requests_per_minute = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+        tokens_per_minute = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+        max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+        if requests_per_minute <= 0 and tokens_per_minute <= 0 and max_concurrency <= 0:
+            return None
+        return cls(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_concurrency=max_concurrency,
+            min_concurrency=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+            latency_target=float(os.getenv("LLM_LATENCY_TARGET_SECONDS", "0")),
+            backoff=float(os.getenv("LLM_CONCURRENCY_BACKOFF", "0.5")),
+            retries=int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3")),
+            path=os.getenv("LLM_RATE_LIMIT_PATH") or None,
+        )
+
+    def call(self, send: Callable[[], T], estimated_tokens: int, stats: CallStats,
+             used_tokens: Optional[Callable[[], Optional[int]]] = None,
+             check: Optional[Callable[[], None]] = None) -> T:
+        """send() once the limits allow it, retrying 429s; stats is filled in even when it raises.
+
+        used_tokens() gives the tokens the call used, or None when they aren't known.
+        """
+        attempt = 0
+        while True:
+            stats.queue_wait += self._admit(estimated_tokens, check)
+            start = time.monotonic()
+            rate_limited = False
+            try:
+                response = send()
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                if not rate_limited:
+                    raise
+                stats.rate_limited += 1
+                if attempt == self.retries:
+                    raise RateLimitedError(f"LLM provider still rate limiting after {self.retries} retries: {e}") from e
+                delay = retry_after(e) or min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            finally:
+                if self.concurrency is not None:
+                    self.concurrency.release(time.monotonic() - start, rate_limited)
+
+            if rate_limited:
+                # The provider turned the request away, so its tokens weren't used
+                if self.tokens is not None:
+                    self.tokens.adjust(-estimated_tokens)
+                self._sleep(delay, check)
+                attempt += 1
+                continue
+            used = used_tokens() if used_tokens is not None else None
+            if self.tokens is not None and used:
+                self.tokens.adjust(used - estimated_tokens)
+            return response
+
+    def _admit(self, estimated_tokens: int, check: Optional[Callable[[], None]]) -> float:
+        """Wait until the buckets and the concurrency limit let a call through; the seconds waited"""
+        start = time.monotonic()
+        for bucket, amount in ((self.requests, 1), (self.tokens, estimated_tokens)):
+            if bucket is None:
+                continue
+            while True:
+                delay = bucket.take(amount)
+                if not delay:
+                    break
+                self._sleep(delay, check)
+        if self.concurrency is not None:
+            self.concurrency.acquire(check)
+        return time.monotonic() - start
+
+    @staticmethod
+    def _sleep(seconds: float, check: Optional[Callable[[], None]]):
+        deadline = time.monotonic() + seconds
+        while True:
+            if check is not None:
+                check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, POLL_SECONDS))
+
+
+@lru_cache(maxsize=None)
+def shared_rate_limiter() -> Optional[LLMRateLimiter]:
+    """The limiter every CrewLLM of this process uses, built from the environment on first use"""
+    return LLMRateLimiter.from_env()
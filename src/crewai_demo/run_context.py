@@ -0,0 +1,127 @@
+"""
+Per-run state shared between the executor and the code running inside a crew.
+
+The executor sets ``current_run`` before kicking off a crew and runs the crew
+inside a copy of its context, so LLM calls made on crew worker threads can
+find the run they belong to.
+
+Stopping a run is cooperative: code running inside the crew calls
+``check_cancelled`` at safe points (LLM calls, streamed chunks, agent steps,
+task starts) and unwinds with RunCancelledError, or BudgetExceededError when
+the run stopped itself for going over budget.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+class RunCancelledError(BaseException):
+    """Raised inside a run that has been stopped.
+
+    A BaseException, like asyncio.CancelledError, so that CrewAI's retry loops
+    and event handlers, which catch Exception, let it through.
+    """
+
+
+class BudgetExceededError(RunCancelledError):
+    """Raised inside a run that went over its token or time budget (see budget.RunBudget)"""
+
+
+@dataclass
+class RunContext:
+    """Counters and settings for a single crew run"""
+
+    run_id: Optional[str] = None
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # LLM calls made by the run's agents, cache hits included
+    llm_calls: int = 0
+    # Seconds each provider call waited for the rate limiter (see rate_limit), and 429s it got
+    queue_waits: List[float] = field(default_factory=list)
+    rate_limited: int = 0
+    # Task ID -> agent, prompt/completion tokens and LLM calls of that task
+    task_usage: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # budget.RunBudget the run is held to, if any
+    budget: Any = field(default=None, repr=False)
+    # Why the run went over budget, once it has
+    budget_exceeded: Optional[str] = None
+    # Called with (task_id, text) for every token streamed by an LLM call of this run
+    token_sink: Optional[Callable[[str, str], None]] = field(default=None, repr=False)
+    # tracing.RunTracer recording the run's spans, if it is traced
+    tracer: Any = field(default=None, repr=False)
+    # Set when the run is stopped; a multiprocessing.Event for runs in a worker process
+    cancel_event: Any = field(default_factory=threading.Event, repr=False)
+    _task_started: Dict[str, float] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def cancel(self):
+        """Ask the run to stop at its next cancellation check"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def exceed_budget(self, reason: str):
+        """Stop the run because it went over budget"""
+        self.budget_exceeded = self.budget_exceeded or reason
+        self.cancel()
+
+    def check_cancelled(self):
+        """Raise RunCancelledError if the run has been stopped"""
+        if self.cancel_event.is_set():
+            if self.budget_exceeded:
+                raise BudgetExceededError(self.budget_exceeded)
+            raise RunCancelledError(f"Run {self.run_id} was stopped")
+
+    def record_llm_call(self):
+        with self._lock:
+            self.llm_calls += 1
+
+    def record_rate_limit(self, queue_wait: float, rate_limited: int):
+        with self._lock:
+            self.queue_waits.append(queue_wait)
+            self.rate_limited += rate_limited
+
+    def record_cache(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def task_elapsed(self, task_id: str) -> float:
+        """Seconds since the task was first seen, i.e. since its first LLM call"""
+        with self._lock:
+            started = self._task_started.setdefault(task_id, time.monotonic())
+        return time.monotonic() - started
+
+    def record_usage(self, task_id: str, agent: Optional[str], prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            usage = self.task_usage.get(task_id)
+            if usage is None:
+                usage = self.task_usage[task_id] = {
+                    "agent": agent, "prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0
+                }
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["llm_calls"] += 1
+
+    def usage_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {task_id: dict(usage) for task_id, usage in self.task_usage.items()}
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            }
+
+
+current_run: ContextVar[Optional[RunContext]] = ContextVar("current_run", default=None)
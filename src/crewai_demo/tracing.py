@@ -0,0 +1,243 @@
+"""
+Span-based tracing of crew runs.
+
+A run is one trace: a run span containing a span per task, which contains the
+agent's iterations, which contain the LLM and tool calls made during them.
+The tracer of a run lives on its RunContext, so code running on any crew
+thread records into the right trace. Tasks start on the thread that executes
+them, so LLM and tool calls are attributed to the task of their thread when
+CrewAI doesn't say which task made them.
+
+Agent iterations have no start event in CrewAI: an iteration runs from the
+start of its task, or the end of the previous iteration, to the agent's next
+step callback.
+"""
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from crewai.utilities.events import (
+    TaskCompletedEvent,
+    TaskFailedEvent,
+    TaskStartedEvent,
+    ToolUsageErrorEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageStartedEvent,
+    crewai_event_bus,
+)
+
+from crewai_demo.run_context import RunCancelledError, current_run
+
+
+@dataclass
+class Span:
+    """A timed operation within a run"""
+
+    name: str
+    kind: str  # run, task, agent_iteration, llm_call, tool_call
+    trace_id: str
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    status: str = "ok"  # ok, error, cancelled
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class RunTracer:
+    """Spans of one run.
+
+    Finished spans are kept, or handed to on_end when the run executes in a
+    worker process and its spans have to be sent back to the API server.
+    """
+
+    def __init__(self, trace_id: str, parent_id: Optional[str] = None,
+                 on_end: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.trace_id = trace_id
+        # Task spans are children of this span, normally the run span
+        self.parent_id = parent_id
+        self.on_end = on_end
+        self.task_names: Dict[str, str] = {}
+        self._finished: List[Dict[str, Any]] = []
+        self._tasks: Dict[str, Span] = {}
+        # Task ID -> its current iteration, and how many spans that iteration contains
+        self._iterations: Dict[str, Span] = {}
+        self._iteration_children: Dict[str, int] = {}
+        self._thread = threading.local()
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, kind: str, parent_id: Optional[str] = None, **attributes) -> Span:
+        return Span(name, kind, self.trace_id, parent_id=parent_id, attributes=attributes)
+
+    def end_span(self, span: Span, status: str = "ok", **attributes):
+        span.end = time.time()
+        span.status = status
+        span.attributes.update(attributes)
+        self.add(span.to_dict())
+
+    def add(self, span: Dict[str, Any]):
+        """Record a finished span"""
+        if self.on_end is not None:
+            self.on_end(span)
+            return
+        with self._lock:
+            self._finished.append(span)
+
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._finished)
+
+    @contextmanager
+    def span(self, name: str, kind: str, task_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+        """Span around a block, nested under the current iteration of the task (the thread's by default)"""
+        span = self.start_span(name, kind, parent_id=self._parent_for(task_id), **attributes)
+        try:
+            yield span
+        except RunCancelledError:
+            self.end_span(span, "cancelled")
+            raise
+        except BaseException as e:
+            self.end_span(span, "error", error=f"{type(e).__name__}: {e}")
+            raise
+        else:
+            self.end_span(span)
+
+    def _parent_for(self, task_id: Optional[str]) -> Optional[str]:
+        task_id = str(task_id) if task_id else getattr(self._thread, "task_id", None)
+        with self._lock:
+            iteration = self._iterations.get(task_id) if task_id else None
+            if iteration is not None:
+                self._iteration_children[task_id] += 1
+                return iteration.span_id
+            task = self._tasks.get(task_id) if task_id else None
+        return task.span_id if task is not None else self.parent_id
+
+    def start_task(self, task: Any):
+        """Open the span of a task, on the thread that executes it"""
+        task_id = str(task.id)
+        self._thread.task_id = task_id
+        name = self.task_names.get(task_id) or getattr(task, "name", None) or str(task.description)[:60]
+        agent = getattr(getattr(task, "agent", None), "role", None)
+        span = self.start_span(name, "task", parent_id=self.parent_id, task_id=task_id, agent=agent)
+        with self._lock:
+            self._tasks[task_id] = span
+        self._start_iteration(task_id, 1)
+
+    def end_task(self, task: Any, status: str = "ok", **attributes):
+        task_id = str(task.id)
+        with self._lock:
+            span = self._tasks.pop(task_id, None)
+            iteration = self._iterations.pop(task_id, None)
+            children = self._iteration_children.pop(task_id, 0)
+        # The iteration opened after the last step only counts if it did anything
+        if iteration is not None and children:
+            self.end_span(iteration, status)
+        if span is not None:
+            self.end_span(span, status, **attributes)
+        if getattr(self._thread, "task_id", None) == task_id:
+            self._thread.task_id = None
+
+    def end_iteration(self, **attributes):
+        """Close the current iteration of the thread's task and open the next one"""
+        task_id = getattr(self._thread, "task_id", None)
+        with self._lock:
+            iteration = self._iterations.pop(task_id, None) if task_id else None
+            self._iteration_children.pop(task_id, None)
+        if iteration is None:
+            return
+        self.end_span(iteration, **attributes)
+        self._start_iteration(task_id, iteration.attributes["iteration"] + 1)
+
+    def finish(self, status: str):
+        """End the spans of tasks still open when the run ended, e.g. ones unwound by a stop"""
+        with self._lock:
+            tasks = list(self._tasks.values())
+            iterations = [(span, self._iteration_children.get(task_id, 0))
+                          for task_id, span in self._iterations.items()]
+            self._tasks.clear()
+            self._iterations.clear()
+            self._iteration_children.clear()
+        for span, children in iterations:
+            if children:
+                self.end_span(span, status)
+        for span in tasks:
+            self.end_span(span, status)
+
+    def _start_iteration(self, task_id: str, number: int):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return
+            self._iterations[task_id] = self.start_span(
+                f"iteration {number}", "agent_iteration", parent_id=task.span_id, iteration=number
+            )
+            self._iteration_children[task_id] = 0
+
+
+def current_tracer() -> Optional[RunTracer]:
+    run = current_run.get()
+    return run.tracer if run is not None else None
+
+
+# Event bus handlers run on the thread that emitted the event, inside the run's context
+
+def _on_task_started(source: Any, event: TaskStartedEvent):
+    tracer = current_tracer()
+    if tracer is not None and event.task is not None:
+        tracer.start_task(event.task)
+
+
+def _on_task_completed(source: Any, event: TaskCompletedEvent):
+    tracer = current_tracer()
+    if tracer is not None and event.task is not None:
+        tracer.end_task(event.task, output_chars=len(getattr(event.output, "raw", "") or ""))
+
+
+def _on_task_failed(source: Any, event: TaskFailedEvent):
+    tracer = current_tracer()
+    if tracer is not None and event.task is not None:
+        tracer.end_task(event.task, "error", error=event.error)
+
+
+# Tool calls of one thread run one at a time; the open ones are stacked per thread
+_tool_spans = threading.local()
+
+
+def _on_tool_started(source: Any, event: ToolUsageStartedEvent):
+    tracer = current_tracer()
+    if tracer is None:
+        return
+    span = tracer.start_span(event.tool_name, "tool_call", parent_id=tracer._parent_for(event.task_id),
+                             tool=event.tool_name, agent=event.agent_role,
+                             input_bytes=len(str(event.tool_args).encode("utf-8")))
+    _tool_spans.__dict__.setdefault("stack", []).append(span)
+
+
+def _end_tool_span(status: str, **attributes):
+    tracer = current_tracer()
+    stack = getattr(_tool_spans, "stack", None)
+    if tracer is not None and stack:
+        tracer.end_span(stack.pop(), status, **attributes)
+
+
+def _on_tool_finished(source: Any, event: ToolUsageFinishedEvent):
+    _end_tool_span("ok", from_cache=event.from_cache, output_bytes=len(str(event.output).encode("utf-8")))
+
+
+def _on_tool_error(source: Any, event: ToolUsageErrorEvent):
+    _end_tool_span("error", error=str(event.error))
+
+
+crewai_event_bus.register_handler(TaskStartedEvent, _on_task_started)
+crewai_event_bus.register_handler(TaskCompletedEvent, _on_task_completed)
+crewai_event_bus.register_handler(TaskFailedEvent, _on_task_failed)
+crewai_event_bus.register_handler(ToolUsageStartedEvent, _on_tool_started)
+crewai_event_bus.register_handler(ToolUsageFinishedEvent, _on_tool_finished)
+crewai_event_bus.register_handler(ToolUsageErrorEvent, _on_tool_error)
@@ -3,10 +3,13 @@ Enhanced crew executor with detailed output capture and real-time logging
 """
 
 import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
 import time
-import json
-from typing import Dict, Any, Optional
-from datetime import datetime
+from typing import Dict, Any, Callable, Optional
 
 from crewai import Crew
 import sys
@@ -16,45 +19,311 @@ from pathlib import Path
 src_path = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(src_path))
 
-from crewai_demo.crew_product_feature import CrewFeatureDevelopment
+from crewai_demo.crew_product_feature import new_product_feature_crew
+from crewai_demo.dag_crew import DagCrew
+from crewai_demo.budget import RunBudget, usage_report
+from crewai_demo.run_context import BudgetExceededError, RunCancelledError, RunContext, current_run
+from crewai_demo.tracing import RunTracer
+from . import metrics
 from .custom_logger import AgentOutputLogger
+from .token_batcher import TokenBatcher
+from .trace_export import TraceExporter
 from .models import CrewExecutionResult, AgentOutput
 
 
+log = logging.getLogger(__name__)
+
+# UI metadata for the crew's tasks, in the order they appear in the crew
+TASK_SEQUENCE = [
+    {
+        "name": "product_design_task",
+        "agent": "Product Manager",
+        "output_type": "product_spec"
+    },
+    {
+        "name": "uiux_design_task",
+        "agent": "UI/UX Designer",
+        "output_type": "wireframe"
+    },
+    {
+        "name": "backend_development_task",
+        "agent": "Backend Engineer",
+        "output_type": "backend_api"
+    },
+    {
+        "name": "frontend_development_task",
+        "agent": "Frontend Engineer",
+        "output_type": "html"
+    }
+]
+
+
+class CrewEventRelay:
+    """Turns the CrewAI callbacks of one crew into AgentOutputLogger calls.
+
+    Callbacks fire on crew worker threads; each logger call is handed to
+    post_event as (method, args), in order. Used in the API process by the
+    thread backend and inside worker processes by the process backend.
+    """
+
+    def __init__(self, post_event: Callable[[str, tuple], None], execution_mode: str):
+        self.post_event = post_event
+        self.execution_mode = execution_mode
+        self.reported_tasks: set = set()
+        self._reported_lock = threading.Lock()
+        # Streamed tokens, batched per task into agent_thinking deltas
+        self.token_batcher = TokenBatcher(self._post_stream_delta)
+        self._task_info_by_id: Dict[str, Dict[str, str]] = {}
+        self._task_ids: Dict[str, str] = {}
+
+    def attach(self, crew: Crew):
+        """Hook CrewAI task and step callbacks; crew tasks follow TASK_SEQUENCE order"""
+        self._task_info_by_id = {}
+        for task, task_info in zip(crew.tasks, TASK_SEQUENCE):
+            self._task_info_by_id[str(task.id)] = task_info
+            self._task_ids[task_info["name"]] = str(task.id)
+            task.callback = functools.partial(self._on_task_complete, task_info)
+            if task.agent is not None:
+                task.agent.step_callback = functools.partial(self._on_agent_step, task_info)
+
+        if isinstance(crew, DagCrew):
+            crew.task_start_callback = self._on_task_start
+
+        run = current_run.get()
+        if run is not None and run.tracer is not None:
+            run.tracer.task_names = {task_id: info["name"] for task_id, info in self._task_info_by_id.items()}
+
+    def on_token(self, task_id: str, token: str):
+        """RunContext token sink, called from crew worker threads for every streamed token"""
+        task_info = self._task_info_by_id.get(str(task_id))
+        if task_info:
+            self.token_batcher.add(task_info["name"], token)
+
+    def named_usage(self, task_usage: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """RunContext.task_usage keyed by task name instead of task ID"""
+        return {
+            self._task_info_by_id[task_id]["name"] if task_id in self._task_info_by_id else task_id: usage
+            for task_id, usage in task_usage.items()
+        }
+
+    def _post(self, method: str, *args):
+        self.post_event(method, args)
+
+    def _on_task_start(self, index: int, task: Any):
+        """DagCrew start callback, called from the task's worker thread"""
+        if index < len(TASK_SEQUENCE):
+            task_info = TASK_SEQUENCE[index]
+            self._post("log_agent_start", task_info["agent"], task_info["name"])
+
+    def _on_task_complete(self, task_info: Dict[str, str], task_output: Any):
+        """CrewAI task callback, called from the task's worker thread"""
+        with self._reported_lock:
+            self.reported_tasks.add(task_info["name"])
+            progress = round(len(self.reported_tasks) * 100 / len(TASK_SEQUENCE))
+        output_text = _task_output_text(task_output)
+        # Streamed text of this task goes out before its final output
+        self.token_batcher.flush(task_info["name"])
+        log.info("Task finished", extra={"agent": task_info["agent"], "task": task_info["name"], "chars": len(output_text)})
+
+        self._post("log_agent_output", task_info["agent"], task_info["name"],
+                   output_text, task_info["output_type"])
+        run = current_run.get()
+        usage = run.usage_snapshot().get(self._task_ids.get(task_info["name"])) if run is not None else None
+        if usage:
+            usage = usage_report({task_info["name"]: usage})["tasks"][task_info["name"]]
+        self._post("log_task_complete", task_info["name"], task_info["agent"], progress, usage)
+
+        # Under Process.sequential the next task starts right away;
+        # DagCrew reports starts itself through _on_task_start
+        if self.execution_mode == "dag":
+            return
+        index = TASK_SEQUENCE.index(task_info)
+        if index + 1 < len(TASK_SEQUENCE):
+            next_task = TASK_SEQUENCE[index + 1]
+            self._post("log_agent_start", next_task["agent"], next_task["name"])
+
+    def _on_agent_step(self, task_info: Dict[str, str], step: Any):
+        """CrewAI step callback, called after every agent iteration"""
+        run = current_run.get()
+        if run is not None:
+            run.check_cancelled()
+        thought = (getattr(step, "thought", None) or "").strip()
+        tool = getattr(step, "tool", None)
+        if run is not None and run.tracer is not None:
+            run.tracer.end_iteration(tool=tool, final=not tool)
+        if tool:
+            thought = f"{thought}\nUsing tool: {tool}".strip()
+        if not thought:
+            thought = f"Working on {task_info['output_type']} generation..."
+        self._post("log_agent_thinking", task_info["agent"], thought[:500], task_info["name"])
+
+    def _post_stream_delta(self, task_name: str, text: str):
+        task_info = next(info for info in TASK_SEQUENCE if info["name"] == task_name)
+        self._post("log_agent_stream", task_info["agent"], task_name, text)
+
+
+def _build_run_crew(execution_mode: str, output_dir: Optional[str]) -> Crew:
+    """Clone the compiled crew template for one run, writing output files into output_dir"""
+    crew = new_product_feature_crew()
+    if execution_mode == "dag":
+        crew = DagCrew.from_crew(crew)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        for task in crew.tasks:
+            if task.output_file:
+                task.output_file = os.path.join(output_dir, os.path.basename(task.output_file))
+    return crew
+
+
+def _kickoff(crew: Crew, inputs: Dict[str, Any]):
+    """Run the crew to completion on the calling thread"""
+    log.debug("CrewAI kickoff", extra={"process": crew.process.value, "tasks": len(crew.tasks)})
+    # CrewAI will print verbose output here since verbose=True
+    return crew.kickoff(inputs=inputs)
+
+
+def _crew_summary(crew: Crew, result: Any, run_context: RunContext, relay: CrewEventRelay) -> Dict[str, Any]:
+    """Plain-data result of a crew run, the same for both backends"""
+    return {
+        "final_result": str(result),
+        "tasks_output": [_task_output_text(output) for output in getattr(result, "tasks_output", None) or []],
+        "schedule": _schedule_summary(crew),
+        "cache_stats": run_context.cache_stats(),
+        "llm_calls": run_context.llm_calls,
+        "queue_waits": run_context.queue_waits,
+        "rate_limited": run_context.rate_limited,
+        "token_usage": _token_usage(result),
+        "task_usage": usage_report(relay.named_usage(run_context.usage_snapshot())),
+    }
+
+
+def _token_usage(result: Any) -> Dict[str, int]:
+    """Token counts from a CrewOutput's UsageMetrics"""
+    usage = getattr(result, "token_usage", None)
+    return {
+        kind: getattr(usage, f"{kind}_tokens", 0) or 0
+        for kind in ("prompt", "completion", "cached_prompt")
+    }
+
+
+def _schedule_summary(crew: Crew) -> Optional[Dict[str, Any]]:
+    """Critical path report of a DagCrew run, with task names instead of indices"""
+    if not isinstance(crew, DagCrew) or not crew.schedule_report:
+        return None
+    report = crew.schedule_report
+    names = [task_info["name"] for task_info in TASK_SEQUENCE]
+    return {
+        "wall_time": report["wall_time"],
+        "total_task_time": report["total_task_time"],
+        "critical_path_time": report["critical_path_time"],
+        "critical_path": [names[i] for i in report["critical_path"]],
+        "task_durations": {names[i]: duration for i, duration in report["task_durations"].items()},
+    }
+
+
+def _task_output_text(task_output: Any) -> str:
+    """Get the text of a CrewAI TaskOutput"""
+    if isinstance(task_output, str):
+        return task_output
+    for attr in ("raw", "output"):
+        value = getattr(task_output, attr, None)
+        if value:
+            return str(value)
+    return str(task_output)
+
+
+def run_crew_in_worker(job: Dict[str, Any], post_event: Callable[[str, tuple], None],
+                       cancel_event: Any) -> Dict[str, Any]:
+    """Run one crew job inside a process backend worker (see process_pool)"""
+    relay = CrewEventRelay(post_event, job["execution_mode"])
+    # Spans are sent back as they end and recorded by the API server's tracer of the run
+    tracer = RunTracer(job["run_id"], parent_id=job["trace_parent"],
+                       on_end=lambda span: post_event("record_span", (span,)))
+    run_context = RunContext(run_id=job["run_id"], token_sink=relay.on_token, cancel_event=cancel_event,
+                             tracer=tracer, budget=RunBudget(**job["budget"]))
+
+    def run():
+        current_run.set(run_context)
+        run_context.check_cancelled()
+        crew = _build_run_crew(job["execution_mode"], job["output_dir"])
+        relay.attach(crew)
+        result = _kickoff(crew, {"feature_request": job["feature_request"]})
+        return _crew_summary(crew, result, run_context, relay)
+
+    # Send batches whose stream paused before they filled up
+    done = threading.Event()
+
+    def flush_tokens_periodically():
+        while not done.wait(relay.token_batcher.interval):
+            relay.token_batcher.flush_stale()
+
+    threading.Thread(target=flush_tokens_periodically, name="token-flush", daemon=True).start()
+    trace_status = "error"
+    try:
+        summary = contextvars.copy_context().run(run)
+        trace_status = "ok"
+        return summary
+    except RunCancelledError:
+        trace_status = "cancelled"
+        raise
+    finally:
+        done.set()
+        relay.token_batcher.flush()
+        tracer.finish(trace_status)
+
+
 class EnhancedCrewExecutor:
     """Enhanced crew executor with detailed output capture"""
     
-    def __init__(self, logger: AgentOutputLogger):
+    def __init__(self, logger: AgentOutputLogger, output_dir: Optional[str] = None,
+                 execution_mode: Optional[str] = None, process_pool: Optional[Any] = None,
+                 trace_exporter: Optional[TraceExporter] = None, budget: Optional[RunBudget] = None):
         self.logger = logger
-        self.crew_instance = None
+        self.output_dir = output_dir
+        # "dag" runs independent tasks concurrently, "sequential" uses CrewAI's Process.sequential
+        self.execution_mode = execution_mode or os.getenv("CREW_EXECUTION_MODE", "dag")
+        # CrewProcessPool to run the crew in a worker process; None runs it on a thread here
+        self.process_pool = process_pool
         self.is_running = False
+        # How long a stopped crew gets to reach a cancellation point before it is abandoned (or killed)
+        self.stop_grace_period = float(os.getenv("CREW_STOP_GRACE_SECONDS", "1.5"))
+        self._relay = CrewEventRelay(self._post_event, self.execution_mode)
+        # Spans of the run, written to trace_exporter when it ends
+        self.tracer = RunTracer(self.logger.run_id)
+        self.trace_exporter = trace_exporter
+        # Token and time limits; the run stops itself when it goes over them
+        self.budget = budget or RunBudget.from_env()
+        self.run_context = RunContext(run_id=self.logger.run_id, token_sink=self._relay.on_token,
+                                      tracer=self.tracer, budget=self.budget)
+        self._stop_requested = asyncio.Event()
+        self._start_time = time.time()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._events: Optional[asyncio.Queue] = None
         
     async def execute_crew(self, feature_request: str) -> CrewExecutionResult:
         """Execute the crew with detailed logging"""
-        start_time = time.time()
+        start_time = self._start_time = time.time()
         self.is_running = True
+        current_run.set(self.run_context)
+        backend = "process" if self.process_pool is not None else "thread"
+        run_span = self.tracer.start_span("crew.run", "run", execution_mode=self.execution_mode, backend=backend,
+                                          feature_request=feature_request[:200])
+        self.tracer.parent_id = run_span.span_id
+        trace_status = "error"
         
-        print("\n" + "="*80)
-        print("🚀 CREW EXECUTION STARTED")
-        print("="*80)
-        print(f"📋 Feature Request: {feature_request[:100]}...")
-        print(f"⏰ Start Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("-"*80)
+        log.info("Crew execution started", extra={
+            "feature_request": feature_request[:100],
+            "execution_mode": self.execution_mode,
+            "backend": backend
+        })
         
         try:
-            # Initialize crew
-            print("🔧 Initializing crew agents...")
-            self.crew_instance = CrewFeatureDevelopment()
-            crew = self.crew_instance.product_feature_crew()
-            print("✅ Crew initialized successfully")
-            
-            # Prepare inputs
-            inputs = {
-                'feature_request': feature_request
-            }
+            # Stopped before it got a slot thread
+            self.run_context.check_cancelled()
             
             # Execute crew with custom logging
-            result = await self._execute_with_logging(crew, inputs)
+            summary = await self._execute_with_logging(feature_request)
+            result = summary["final_result"]
             
             execution_time = time.time() - start_time
             
@@ -64,328 +333,266 @@ class EnhancedCrewExecutor:
             # Get generated files
             generated_files = self._get_generated_files()
             
-            print(f"\n{'='*80}")
-            print("✅ CREW EXECUTION COMPLETED SUCCESSFULLY")
-            print(f"{'='*80}")
-            print(f"⏱️  Total Execution Time: {execution_time:.2f} seconds ({execution_time/60:.2f} minutes)")
-            print(f"📊 Total Outputs Captured: {len(outputs)}")
-            print(f"📁 Generated Files: {len(generated_files)}")
-            if generated_files:
-                print(f"   Files: {', '.join(generated_files)}")
-            print(f"{'='*80}\n")
+            schedule = summary["schedule"]
+            cache_stats = summary["cache_stats"]
+            
+            log.info("Crew execution completed", extra={
+                "execution_time": round(execution_time, 2),
+                "outputs": len(outputs),
+                "generated_files": generated_files,
+                "critical_path": schedule["critical_path"] if schedule else None,
+                "critical_path_time": round(schedule["critical_path_time"], 2) if schedule else None,
+                "cache_hits": cache_stats["hits"],
+                "cache_misses": cache_stats["misses"]
+            })
+            
+            self._record_metrics("completed", execution_time, summary["token_usage"])
+            trace_status = "ok"
             
             # Log crew completion with final result (update execution time in the message)
-            await self.logger.log_crew_complete(True, execution_time, str(result))
+            await self.logger.log_crew_complete(True, execution_time, str(result), schedule=schedule,
+                                                cache_stats=cache_stats, token_usage=summary["task_usage"])
             
             return CrewExecutionResult(
                 success=True,
                 outputs=outputs,
                 execution_time=execution_time,
                 generated_files=generated_files,
-                final_result=str(result)
+                final_result=str(result),
+                critical_path=schedule["critical_path"] if schedule else [],
+                critical_path_time=schedule["critical_path_time"] if schedule else None,
+                cache_stats=cache_stats,
+                token_usage=summary["task_usage"]
+            )
+            
+        except RunCancelledError as e:
+            execution_time = time.time() - start_time
+            budget_exceeded = self.run_context.budget_exceeded or (
+                str(e) if isinstance(e, BudgetExceededError) else None
+            )
+            token_usage = self._partial_usage()
+            
+            log.info("Crew execution stopped", extra={"execution_time": round(execution_time, 2),
+                                                      "budget_exceeded": budget_exceeded})
+            self._record_metrics("stopped", execution_time)
+            trace_status = "cancelled"
+            
+            await self.logger.log_crew_complete(False, execution_time, "Crew execution stopped",
+                                                cache_stats=self.run_context.cache_stats(), stopped=True,
+                                                token_usage=token_usage, budget_exceeded=budget_exceeded)
+            
+            return CrewExecutionResult(
+                success=False,
+                outputs=self._extract_outputs(),
+                error_message=budget_exceeded or "Crew execution stopped",
+                execution_time=execution_time,
+                token_usage=token_usage,
+                budget_exceeded=budget_exceeded
             )
             
         except Exception as e:
             execution_time = time.time() - start_time
             error_message = str(e)
             
-            print(f"\n{'='*80}")
-            print("❌ CREW EXECUTION FAILED")
-            print(f"{'='*80}")
-            print(f"⏱️  Execution Time Before Failure: {execution_time:.2f} seconds")
-            print(f"❌ Error: {error_message}")
-            print(f"{'='*80}\n")
-            import traceback
-            traceback.print_exc()
+            log.exception("Crew execution failed", extra={"execution_time": round(execution_time, 2)})
+            self._record_metrics("failed", execution_time)
             
+            token_usage = self._partial_usage()
             await self.logger.log_error(error_message)
-            await self.logger.log_crew_complete(False, execution_time, error_message)
+            await self.logger.log_crew_complete(False, execution_time, error_message,
+                                                cache_stats=self.run_context.cache_stats(),
+                                                token_usage=token_usage)
             
             return CrewExecutionResult(
                 success=False,
                 outputs=[],
                 error_message=error_message,
-                execution_time=execution_time
+                execution_time=execution_time,
+                token_usage=token_usage
             )
         finally:
             self.is_running = False
+            self.tracer.finish(trace_status)
+            self.tracer.end_span(run_span, trace_status, llm_calls=self.run_context.llm_calls)
+            if self.trace_exporter:
+                try:
+                    await asyncio.to_thread(self.trace_exporter.export, self.tracer.spans())
+                except Exception:
+                    log.exception("Error exporting trace", extra={"path": self.trace_exporter.path})
             
-    async def _execute_with_logging(self, crew: Crew, inputs: Dict[str, Any]):
-        """Execute crew with detailed logging for each task"""
-        
-        # Define task sequence with expected outputs
-        task_sequence = [
-            {
-                "name": "product_design_task",
-                "agent": "Product Manager",
-                "output_type": "product_spec"
-            },
-            {
-                "name": "uiux_design_task", 
-                "agent": "UI/UX Designer",
-                "output_type": "wireframe"
-            },
-            {
-                "name": "backend_development_task",
-                "agent": "Backend Engineer", 
-                "output_type": "backend_api"
-            },
-            {
-                "name": "frontend_development_task",
-                "agent": "Frontend Engineer",
-                "output_type": "html"
-            }
-        ]
+    def _partial_usage(self) -> Dict[str, Any]:
+        """Token usage of a run that did not finish"""
+        if self.process_pool is not None:
+            # Only the tasks that completed reported their usage from the worker
+            return usage_report(self.logger.task_usage)
+        return usage_report(self._relay.named_usage(self.run_context.usage_snapshot()))
+        
+    def _record_metrics(self, status: str, execution_time: float, token_usage: Optional[Dict[str, int]] = None):
+        """Add this run's duration, LLM calls, tokens, cache lookups and rate limiting to the /metrics counters"""
+        metrics.RUNS_TOTAL.inc(status=status)
+        metrics.RUN_DURATION.observe(execution_time, status=status)
+        cache_stats = self.run_context.cache_stats()
+        metrics.LLM_CALLS.inc(self.run_context.llm_calls)
+        metrics.LLM_CACHE_LOOKUPS.inc(cache_stats["hits"], result="hit")
+        metrics.LLM_CACHE_LOOKUPS.inc(cache_stats["misses"], result="miss")
+        for queue_wait in self.run_context.queue_waits:
+            metrics.LLM_QUEUE_WAIT.observe(queue_wait)
+        metrics.LLM_RATE_LIMITED.inc(self.run_context.rate_limited)
+        for kind, count in (token_usage or {}).items():
+            metrics.LLM_TOKENS.inc(count, type=kind)
+            
+    async def _execute_with_logging(self, feature_request: str) -> Dict[str, Any]:
+        """Execute crew, streaming each task's events as soon as the task finishes"""
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
         
         # Log crew start and send initial progress
-        print("\n📊 Starting sequential task execution...")
-        print("   Task sequence: Product Manager → UI/UX Designer → Backend Engineer → Frontend Engineer")
         await self.logger.log_agent_start("Crew", "product_feature_crew")
-        await self.logger.log_agent_thinking("Crew", "Starting sequential task execution...")
-        await asyncio.sleep(0.1)  # Brief pause to ensure message is sent
-        
-        # Send initial progress update (0%)
         await self.logger.log_task_complete("crew_start", "Crew", 0)
         
-        # Send progress updates during execution
-        async def send_progress_updates():
-            """Send periodic progress updates during execution"""
-            # Simulate progress updates as tasks are being worked on
-            progress_steps = [5, 12, 25, 35, 50, 60, 75, 85, 95]
-            for progress in progress_steps:
-                await asyncio.sleep(10)  # Wait 10 seconds between updates
-                if self.is_running:  # Only send if still running
-                    await self.logger.log_agent_thinking("Crew", f"Execution in progress... ({progress}% estimated)")
-                    await self.logger.log_task_complete("crew_progress", "Crew", progress)
+        if self.execution_mode != "dag":
+            first_task = TASK_SEQUENCE[0]
+            await self.logger.log_agent_start(first_task["agent"], first_task["name"])
         
-        # Execute crew in a thread to avoid blocking
-        import concurrent.futures
+        # Forward task events to the logger while the crew runs
+        pump_task = asyncio.create_task(self._pump_events())
+        flush_task = asyncio.create_task(self._flush_tokens_periodically())
         
-        def run_crew():
-            print(f"\n{'='*80}")
-            print("🔥 CREWAI EXECUTION STARTING (this may take several minutes)")
-            print(f"{'='*80}\n")
-            try:
-                # CrewAI will print verbose output here since verbose=True
-                result = crew.kickoff(inputs=inputs)
-                print(f"\n{'='*80}")
-                print("✅ CREWAI EXECUTION COMPLETED")
-                print(f"{'='*80}\n")
-                return result
-            except Exception as e:
-                print(f"\n{'='*80}")
-                print(f"❌ CREWAI EXECUTION FAILED: {e}")
-                print(f"{'='*80}")
-                import traceback
-                traceback.print_exc()
-                raise
-        
-        # Start progress update task (don't await, let it run in background)
-        progress_task = asyncio.create_task(send_progress_updates())
-        
-        # Start crew execution in thread pool
-        loop = asyncio.get_event_loop()
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                result = await loop.run_in_executor(executor, run_crew)
-            # Cancel progress updates since execution is done
-            progress_task.cancel()
+            if self.process_pool is not None:
+                summary = await self._run_in_process(feature_request)
+            else:
+                summary = await self._run_in_thread(feature_request)
+        except RunCancelledError:
+            await self._finish_events(pump_task, flush_task)
+            raise
         except Exception as e:
-            progress_task.cancel()
-            print(f"DEBUG: Exception during crew execution: {e}")
+            await self._finish_events(pump_task, flush_task)
             await self.logger.log_error(f"Crew execution failed: {str(e)}")
             raise
         
-        # Parse the actual crew result to extract task outputs
-        print(f"\n📦 Parsing crew execution results...")
-        print(f"   Result type: {type(result).__name__}")
-        
-        # Debug: Inspect result structure
-        print(f"   Result attributes: {dir(result)}")
-        if hasattr(result, 'tasks_output'):
-            print(f"   ✅ Has tasks_output: {len(result.tasks_output) if result.tasks_output else 0} tasks")
-            for i, task_out in enumerate(result.tasks_output):
-                print(f"      Task {i}: {type(task_out).__name__}, has 'output': {hasattr(task_out, 'output')}")
-        if hasattr(result, 'raw'):
-            print(f"   ✅ Has raw: {type(result.raw).__name__}")
-        if hasattr(result, 'tasks'):
-            print(f"   ✅ Has tasks: {len(result.tasks) if result.tasks else 0} tasks")
-        
-        result_preview = str(result)[:300] if result else "No result"
-        print(f"   Result preview: {result_preview}...")
-        
-        # Extract individual task outputs from the result
-        task_outputs = {}
-        
-        # Method 1: Try tasks_output attribute (CrewAI standard)
-        if hasattr(result, 'tasks_output') and result.tasks_output:
-            print(f"   📋 Extracting from tasks_output ({len(result.tasks_output)} tasks)...")
-            for i, task_output in enumerate(result.tasks_output):
-                if i < len(task_sequence):
-                    task_info = task_sequence[i]
-                    # Try different ways to get the output
-                    output_text = None
-                    if hasattr(task_output, 'output'):
-                        output_text = str(task_output.output)
-                    elif hasattr(task_output, 'raw'):
-                        output_text = str(task_output.raw)
-                    elif isinstance(task_output, str):
-                        output_text = task_output
-                    else:
-                        output_text = str(task_output)
-                    
-                    if output_text and len(output_text.strip()) > 0:
-                        task_outputs[task_info["name"]] = output_text
-                        print(f"      ✓ Extracted output for {task_info['agent']}: {len(output_text)} chars")
-                    else:
-                        print(f"      ⚠ Empty output for {task_info['agent']}")
-        
-        # Method 2: Try raw attribute
-        elif hasattr(result, 'raw'):
-            print(f"   📋 Extracting from raw attribute...")
-            try:
-                import json
-                raw_data = result.raw
-                if isinstance(raw_data, dict):
-                    # Try to match keys to task names
-                    for key, value in raw_data.items():
-                        for task_info in task_sequence:
-                            if (task_info["name"] in key.lower() or 
-                                task_info["agent"].lower() in key.lower() or
-                                task_info["output_type"] in key.lower()):
-                                task_outputs[task_info["name"]] = str(value)
-                                print(f"      ✓ Matched '{key}' to {task_info['agent']}")
-                                break
-                elif isinstance(raw_data, str) and len(raw_data) > 0:
-                    # If raw is a string, might be the final output
-                    task_outputs[task_sequence[-1]["name"]] = raw_data
-                    print(f"      ✓ Using raw string as final output")
-            except Exception as e:
-                print(f"      ❌ Error parsing raw: {e}")
-        
-        # Method 3: Try direct string conversion
-        if not task_outputs:
-            result_str = str(result)
-            if result_str and len(result_str.strip()) > 50:  # Only if substantial content
-                print(f"   📋 Using string representation as fallback...")
-                # Split by common delimiters or use as final output
-                task_outputs[task_sequence[-1]["name"]] = result_str
-                print(f"      ✓ Using full result for final task ({len(result_str)} chars)")
-        
-        # Report what we extracted
-        print(f"\n   📊 Extraction Summary:")
-        for task_info in task_sequence:
-            if task_info["name"] in task_outputs:
-                output_len = len(task_outputs[task_info["name"]])
-                print(f"      ✅ {task_info['agent']}: {output_len} chars")
-            else:
-                print(f"      ❌ {task_info['agent']}: NO OUTPUT EXTRACTED")
-        
-        # Log task progression with actual or placeholder outputs
-        # Send updates with realistic delays to show incremental progress
-        print(f"\n📋 Processing task outputs and sending updates to UI...")
-        for i, task_info in enumerate(task_sequence):
-            # Calculate progress: 25%, 50%, 75%, 100%
-            base_progress = i * 25
-            progress = base_progress + 25
-            
-            print(f"\n   [{i+1}/4] {task_info['agent']} - {task_info['name']}")
-            
-            # Send task start (with base progress)
-            await self.logger.log_agent_start(
-                task_info["agent"], 
-                task_info["name"]
-            )
-            
-            # Send initial progress for this task starting
-            await self.logger.log_task_complete(
-                task_info["name"] + "_start",
-                task_info["agent"],
-                base_progress
-            )
-            
-            await asyncio.sleep(0.5)  # Small delay to show task starting
-            
-            # Send thinking status
-            await self.logger.log_agent_thinking(
-                task_info["agent"],
-                f"Working on {task_info['output_type']} generation..."
-            )
-            
-            # Send intermediate progress (task in progress)
-            intermediate_progress = base_progress + 10
-            await self.logger.log_task_complete(
-                task_info["name"] + "_progress",
-                task_info["agent"],
-                intermediate_progress
-            )
-            
-            await asyncio.sleep(1.0)  # Delay to show intermediate progress
-            
-            # Get the actual output for this task
-            task_output = task_outputs.get(task_info["name"])
-            
-            if task_output and len(task_output.strip()) > 0:
-                # Show output preview in terminal
-                output_preview = task_output[:150] + "..." if len(task_output) > 150 else task_output
-                print(f"      Output: {output_preview}")
-                print(f"      Progress: {progress}%")
-                
-                # Log completion with actual output
-                await self.logger.log_agent_output(
-                    task_info["agent"],
-                    task_info["name"], 
-                    task_output,
-                    task_info["output_type"]
-                )
-            else:
-                # No output extracted - this might indicate the task didn't complete or output wasn't captured
-                warning_msg = f"⚠️  WARNING: No output extracted for {task_info['agent']}. Task may have failed or output structure is unexpected."
-                print(f"      {warning_msg}")
-                
-                # Try to get output from the full result string as a fallback
-                result_str = str(result)
-                if task_info["output_type"] in result_str.lower() or task_info["agent"].lower() in result_str.lower():
-                    # Extract a portion of the result that might contain this task's output
-                    task_output = f"[Output not individually captured - may be in full result]\n\nFull crew result:\n{result_str[:500]}..."
-                else:
-                    task_output = f"⚠️ Output not captured for {task_info['agent']}. The task may have completed but the output format is not recognized. Check CrewAI execution logs above for details."
-                
+        await self._finish_events(pump_task, flush_task)
+        
+        # Report any task whose callback did not fire from the final result
+        reported = self.logger.get_all_outputs()
+        for task_info, output_text in zip(TASK_SEQUENCE, summary["tasks_output"]):
+            if task_info["name"] not in reported:
+                log.warning("No callback received, using crew result", extra={"task": task_info["name"]})
                 await self.logger.log_agent_output(
                     task_info["agent"],
-                    task_info["name"], 
-                    task_output,
+                    task_info["name"],
+                    output_text,
                     task_info["output_type"]
                 )
-            
-            # Send final completion for this task
-            await self.logger.log_task_complete(
-                task_info["name"],
-                task_info["agent"],
-                progress
+        
+        return summary
+        
+    async def _run_in_thread(self, feature_request: str) -> Dict[str, Any]:
+        """Run the crew on a thread of this process"""
+        # Clone the compiled crew template for this run
+        crew = _build_run_crew(self.execution_mode, self.output_dir)
+        self._relay.attach(crew)
+        
+        # Execute crew in a thread to avoid blocking
+        import concurrent.futures
+        
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="crew")
+        try:
+            # Run inside a copy of this context so crew threads see current_run
+            crew_context = contextvars.copy_context()
+            crew_future = self._loop.run_in_executor(
+                executor, crew_context.run, _kickoff, crew, {"feature_request": feature_request}
             )
-            
-            # Longer delay between tasks to show progression
-            await asyncio.sleep(1.5)
+            result = await self._wait_for_crew(crew_future)
+        finally:
+            # Never block the event loop on a crew thread that is still unwinding
+            executor.shutdown(wait=False)
+        return _crew_summary(crew, result, self.run_context, self._relay)
         
-        # Note: Final completion message will be sent in execute_crew with correct execution time
-        print("DEBUG: Crew execution finished, parsing results...")
-            
-        return result
-        
-    def _extract_task_output(self, result: Any, task_name: str) -> str:
-        """Extract output from crew result for a specific task"""
-        # This is a simplified extraction. In practice, you might need
-        # to modify the crew execution to capture individual task outputs
-        
-        if hasattr(result, 'tasks_output'):
-            # Try to get task output
-            for task in result.tasks_output:
-                if hasattr(task, 'output'):
-                    return str(task.output)
-                    
-        # Fallback to a generic message
-        return f"Output generated for {task_name}"
+    async def _run_in_process(self, feature_request: str) -> Dict[str, Any]:
+        """Run the crew in a worker process; its logger events arrive through the pool"""
+        job = {
+            "run_id": self.logger.run_id,
+            "feature_request": feature_request,
+            "output_dir": self.output_dir,
+            "execution_mode": self.execution_mode,
+            "trace_parent": self.tracer.parent_id,
+            "budget": self.budget.to_dict(),
+        }
+        on_event = lambda method, args: self._events.put_nowait((method, args))
+        crew_future = asyncio.ensure_future(self.process_pool.run(job, on_event))
+        # A worker that doesn't stop in time is killed and replaced
+        summary = await self._wait_for_crew(crew_future, kill=functools.partial(self.process_pool.kill, self.logger.run_id))
+        
+        # The worker counted this run's cache lookups and LLM calls
+        self.run_context.cache_hits = summary["cache_stats"]["hits"]
+        self.run_context.cache_misses = summary["cache_stats"]["misses"]
+        self.run_context.llm_calls = summary["llm_calls"]
+        self.run_context.queue_waits = summary["queue_waits"]
+        self.run_context.rate_limited = summary["rate_limited"]
+        return summary
+        
+    async def _wait_for_crew(self, crew_future: asyncio.Future, kill: Optional[Callable[[], None]] = None):
+        """Wait for the crew, or give up on it shortly after a stop request or when its time budget runs out"""
+        timeout = None
+        if self.budget.run_seconds:
+            timeout = max(0.0, self.budget.run_seconds - (time.time() - self._start_time))
+        stop_task = asyncio.create_task(self._stop_requested.wait())
+        try:
+            done, _ = await asyncio.wait({crew_future, stop_task}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_task.cancel()
+        
+        if not done:
+            self.run_context.exceed_budget(f"Run time budget exceeded: {self.budget.run_seconds:g}s")
+            self.stop_execution()
+        
+        if not crew_future.done():
+            # Usually enough for the crew to hit a cancellation check and unwind
+            await asyncio.wait({crew_future}, timeout=self.stop_grace_period)
+        if not crew_future.done():
+            # Blocked in a non-streaming LLM call or a tool; a thread stops at its next check
+            log.warning("Crew still busy after stop, abandoning it", extra={"grace_period": self.stop_grace_period})
+            if kill:
+                kill()
+            crew_future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            raise RunCancelledError(f"Run {self.logger.run_id} was stopped")
+        return crew_future.result()
+        
+    async def _flush_tokens_periodically(self):
+        """Send batches whose stream paused before they filled up"""
+        while True:
+            await asyncio.sleep(self._relay.token_batcher.interval)
+            self._relay.token_batcher.flush_stale()
+        
+    def _post_event(self, method: str, args: tuple):
+        """Queue a logger call from a crew worker thread, keeping event order"""
+        self._loop.call_soon_threadsafe(self._events.put_nowait, (method, args))
+        
+    async def _pump_events(self):
+        """Forward queued events to the logger in the order they were posted"""
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            method, args = event
+            if method == "record_span":
+                # A span from a worker process
+                self.tracer.add(*args)
+                continue
+            try:
+                await getattr(self.logger, method)(*args)
+            except Exception:
+                log.exception("Error forwarding %s event", method)
+        
+    async def _finish_events(self, pump_task: asyncio.Task, flush_task: asyncio.Task):
+        """Flush remaining events and stop the event pump"""
+        flush_task.cancel()
+        self._relay.token_batcher.flush()
+        # Queued behind the deltas just posted with call_soon_threadsafe
+        self._loop.call_soon(self._events.put_nowait, None)
+        await pump_task
         
     def _extract_outputs(self) -> list[AgentOutput]:
         """Extract all agent outputs from the logger"""
@@ -403,15 +610,19 @@ class EnhancedCrewExecutor:
                 
         return outputs
         
+    def _output_path(self, filename: str) -> str:
+        """Get the path of a generated file for this run"""
+        return os.path.join(self.output_dir, filename) if self.output_dir else filename
+        
     def _get_generated_files(self) -> list[str]:
         """Get list of generated files"""
         files = []
         
         # Check for common output files
-        import os
-        if os.path.exists("frontend_code.html"):
+        html_path = self._output_path("frontend_code.html")
+        if os.path.exists(html_path):
             # Clean the frontend code file to remove any dots at beginning/end
-            self._clean_frontend_output_file("frontend_code.html")
+            self._clean_frontend_output_file(html_path)
             files.append("frontend_code.html")
             
         return files
@@ -419,7 +630,6 @@ class EnhancedCrewExecutor:
     def _clean_frontend_output_file(self, file_path: str):
         """Clean the frontend output file to remove dots at beginning and end"""
         try:
-            import os
             if os.path.exists(file_path):
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
@@ -448,16 +658,25 @@ class EnhancedCrewExecutor:
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(content)
                     
-                print(f"DEBUG: Cleaned frontend output file: {file_path}")
+                log.debug("Cleaned frontend output file", extra={"path": file_path})
                 
         except Exception as e:
-            print(f"Warning: Could not clean frontend output file {file_path}: {e}")
+            log.warning("Could not clean frontend output file %s: %s", file_path, e)
+        
+    def stop_execution(self, force: bool = False):
+        """Stop the crew execution.
         
-    def stop_execution(self):
-        """Stop the crew execution"""
+        The crew unwinds at its next LLM call, streamed chunk, agent step or task
+        start; execute_crew returns within stop_grace_period either way. With
+        force, a run in a worker process is killed right away.
+        """
         self.is_running = False
-        # Note: CrewAI doesn't have a built-in stop mechanism
-        # This would need to be implemented based on your specific needs
+        self.run_context.cancel()
+        if self.process_pool is not None:
+            self.process_pool.cancel(self.logger.run_id)
+            if force:
+                self.process_pool.kill(self.logger.run_id)
+        self._stop_requested.set()
         
     def get_status(self) -> Dict[str, Any]:
         """Get current execution status"""
@@ -4,28 +4,54 @@ Custom logger for capturing CrewAI agent outputs and streaming them via WebSocke
 
 import asyncio
 import json
+import logging
+import os
+import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, Any, Optional, Callable
-from .models import WebSocketMessage, MessageType
+from typing import Dict, Any, Optional, Callable, List
+from . import metrics
+from .models import WebSocketMessage, MessageType, AgentOutput
+from .output_refs import output_ref
+
+
+log = logging.getLogger(__name__)
 
 
 class AgentOutputLogger:
     """Custom logger that captures agent outputs and sends them via WebSocket"""
     
-    def __init__(self, websocket_send_callback: Optional[Callable] = None):
+    def __init__(self, websocket_send_callback: Optional[Callable] = None, run_id: Optional[str] = None,
+                 output_callback: Optional[Callable[[AgentOutput], Any]] = None):
         self.websocket_send = websocket_send_callback
+        self.run_id = run_id
+        # Called with each AgentOutput as it is captured, e.g. to persist it
+        self.output_callback = output_callback
         self.agent_outputs: Dict[str, Dict[str, Any]] = {}
         self.current_task = None
         self.current_agent = None
+        # Every message of the run gets the next sequence number; recent ones are kept for resuming clients
+        self.seq = 0
+        self.recent_messages: deque = deque(maxlen=int(os.getenv("WS_EVENT_BUFFER_SIZE", "500")))
+        self.evicted_seq = 0
+        self.completed_tasks: List[Dict[str, str]] = []
+        # Task name -> tokens used, as reported when the task completed
+        self.task_usage: Dict[str, Dict[str, Any]] = {}
+        self.progress = 0
+        self.crew_complete: Optional[WebSocketMessage] = None
+        # Task name -> when its agent started, for the task duration metric
+        self._task_started: Dict[str, float] = {}
         
     async def log_agent_start(self, agent_name: str, task_name: str):
         """Log when an agent starts working on a task"""
         self.current_agent = agent_name
         self.current_task = task_name
+        self._task_started[task_name] = time.perf_counter()
         
         message = WebSocketMessage(
             type=MessageType.AGENT_START,
             timestamp=datetime.now(),
+            run_id=self.run_id,
             agent=agent_name,
             task=task_name,
             data={
@@ -36,13 +62,14 @@ class AgentOutputLogger:
         
         await self._send_message(message)
         
-    async def log_agent_thinking(self, agent_name: str, thought: str):
+    async def log_agent_thinking(self, agent_name: str, thought: str, task_name: Optional[str] = None):
         """Log agent's thinking process"""
         message = WebSocketMessage(
             type=MessageType.AGENT_THINKING,
             timestamp=datetime.now(),
+            run_id=self.run_id,
             agent=agent_name,
-            task=self.current_task,
+            task=task_name or self.current_task,
             data={
                 "message": f"{agent_name} is thinking: {thought}",
                 "thought": thought
@@ -51,26 +78,56 @@ class AgentOutputLogger:
         
         await self._send_message(message)
         
+    async def log_agent_stream(self, agent_name: str, task_name: str, delta: str):
+        """Log a batch of tokens streamed by the agent's LLM"""
+        message = WebSocketMessage(
+            type=MessageType.AGENT_THINKING,
+            timestamp=datetime.now(),
+            run_id=self.run_id,
+            agent=agent_name,
+            task=task_name,
+            data={
+                "message": f"{agent_name} is writing",
+                "delta": delta,
+                "stream": True
+            }
+        )
+        
+        await self._send_message(message)
+        
     async def log_agent_output(self, agent_name: str, task_name: str, output: str, output_type: str = "text"):
         """Log agent's output"""
         # Store the output
         if task_name not in self.agent_outputs:
             self.agent_outputs[task_name] = {}
             
+        timestamp = datetime.now()
         self.agent_outputs[task_name][agent_name] = {
             "output": output,
             "output_type": output_type,
-            "timestamp": datetime.now()
+            "timestamp": timestamp
         }
+        started = self._task_started.pop(task_name, None)
+        if started is not None:
+            metrics.TASK_DURATION.observe(time.perf_counter() - started, task=task_name, agent=agent_name)
+        if self.output_callback:
+            self.output_callback(AgentOutput(
+                agent_name=agent_name,
+                task_name=task_name,
+                output=output,
+                timestamp=timestamp,
+                output_type=output_type
+            ))
         
         message = WebSocketMessage(
             type=MessageType.AGENT_OUTPUT,
             timestamp=datetime.now(),
+            run_id=self.run_id,
             agent=agent_name,
             task=task_name,
             data={
                 "message": f"{agent_name} completed {task_name}",
-                "output": output,
+                **self._output_payload(task_name, output),
                 "output_type": output_type,
                 "preview": self._get_output_preview(output, output_type)
             }
@@ -78,33 +135,75 @@ class AgentOutputLogger:
         
         await self._send_message(message)
         
-    async def log_task_complete(self, task_name: str, agent_name: str, progress: int):
-        """Log when a task is completed"""
+    async def log_task_complete(self, task_name: str, agent_name: str, progress: int,
+                                usage: Optional[Dict[str, Any]] = None):
+        """Log when a task is completed, with the tokens it used"""
+        self.progress = progress
+        if task_name != "crew_start":
+            self.completed_tasks.append({"task": task_name, "agent": agent_name})
+        if usage:
+            self.task_usage[task_name] = {
+                key: usage[key] for key in ("agent", "prompt_tokens", "completion_tokens", "llm_calls")
+            }
+        
         message = WebSocketMessage(
             type=MessageType.TASK_COMPLETE,
             timestamp=datetime.now(),
+            run_id=self.run_id,
             agent=agent_name,
             task=task_name,
             data={
                 "message": f"Task {task_name} completed by {agent_name}",
-                "status": "completed"
+                "status": "completed",
+                "usage": usage
             },
             progress=progress
         )
         
         await self._send_message(message)
         
-    async def log_crew_complete(self, success: bool, execution_time: float, final_result: str = None):
+    async def log_crew_complete(self, success: bool, execution_time: float, final_result: str = None,
+                                schedule: Optional[Dict[str, Any]] = None,
+                                cache_stats: Optional[Dict[str, Any]] = None, stopped: bool = False,
+                                token_usage: Optional[Dict[str, Any]] = None,
+                                budget_exceeded: Optional[str] = None):
         """Log when the entire crew execution is complete"""
+        # Large outputs were already announced by reference; don't resend them here
+        outputs = {
+            task_name: {
+                agent_name: {
+                    **self._output_payload(task_name, output["output"]),
+                    "output_type": output["output_type"],
+                    "timestamp": output["timestamp"]
+                }
+                for agent_name, output in agents.items()
+            }
+            for task_name, agents in self.agent_outputs.items()
+        }
+        final_result_ref = None
+        if final_result:
+            for task_name, agents in self.agent_outputs.items():
+                if any(output["output"] == final_result for output in agents.values()):
+                    final_result_ref = self._output_ref(task_name, final_result)
+            if final_result_ref:
+                final_result = None
+        
         message = WebSocketMessage(
             type=MessageType.CREW_COMPLETE,
             timestamp=datetime.now(),
+            run_id=self.run_id,
             data={
-                "message": "Crew execution completed",
+                "message": budget_exceeded or ("Crew execution stopped" if stopped else "Crew execution completed"),
                 "success": success,
+                "stopped": stopped,
                 "execution_time": execution_time,
                 "final_result": final_result,
-                "outputs": self.agent_outputs
+                "final_result_ref": final_result_ref,
+                "outputs": outputs,
+                "schedule": schedule,
+                "cache": cache_stats,
+                "usage": token_usage,
+                "budget_exceeded": budget_exceeded
             },
             progress=100
         )
@@ -116,6 +215,7 @@ class AgentOutputLogger:
         message = WebSocketMessage(
             type=MessageType.ERROR,
             timestamp=datetime.now(),
+            run_id=self.run_id,
             agent=agent_name,
             task=task_name,
             data={
@@ -140,36 +240,73 @@ class AgentOutputLogger:
             # Return first 100 characters
             return output[:100] + "..." if len(output) > 100 else output
             
+    def _output_ref(self, task_name: str, output: str) -> Optional[Dict[str, Any]]:
+        return output_ref(self.run_id, task_name, output) if self.run_id else None
+    
+    def _output_payload(self, task_name: str, output: str) -> Dict[str, Any]:
+        """The output itself when small, otherwise a reference to fetch it by"""
+        ref = self._output_ref(task_name, output)
+        return {"output_ref": ref} if ref else {"output": output}
+        
     async def _send_message(self, message: WebSocketMessage):
         """Send message via WebSocket"""
-        # Show WebSocket updates in terminal
-        timestamp = message.timestamp.strftime('%H:%M:%S')
-        
-        if message.type.value == "agent_start":
-            print(f"   🔵 [{timestamp}] Agent Started: {message.agent} → {message.task}")
-        elif message.type.value == "agent_output":
-            print(f"   ✅ [{timestamp}] Agent Output: {message.agent} completed {message.task}")
-        elif message.type.value == "task_complete":
-            print(f"   ✓  [{timestamp}] Task Complete: {message.task} ({message.progress}%)")
-        elif message.type.value == "crew_complete":
-            success = "✅ SUCCESS" if message.data.get("success") else "❌ FAILED"
-            exec_time = message.data.get("execution_time", 0)
-            print(f"   {success} [{timestamp}] Crew Complete in {exec_time:.2f}s")
+        self.seq += 1
+        message.seq = self.seq
+        # Streamed deltas are not replayed; the agent_output that follows has the full text
+        if not message.data.get("stream"):
+            if len(self.recent_messages) == self.recent_messages.maxlen:
+                self.evicted_seq = self.recent_messages[0].seq
+            self.recent_messages.append(message)
+        if message.type == MessageType.CREW_COMPLETE:
+            self.crew_complete = message
+        metrics.RUN_MESSAGES.inc(type=message.type.value)
+        
+        # One record per message, only written at DEBUG
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Run message %s", message.type.value, extra={
+                "run_id": self.run_id, "seq": message.seq, "agent": message.agent,
+                "task": message.task, "progress": message.progress
+            })
         
         if self.websocket_send:
             try:
                 # Pass the WebSocketMessage object directly (not JSON string)
                 # The websocket_handler will handle serialization
-                print(f"   📤 Sending WebSocket message: {message.type.value}")
                 await self.websocket_send(message)
-                print(f"   ✅ WebSocket message sent successfully")
-            except Exception as e:
-                print(f"   ❌ Error sending WebSocket message: {e}")
-                import traceback
-                traceback.print_exc()
+            except Exception:
+                log.exception("Error sending WebSocket message", extra={"run_id": self.run_id, "seq": message.seq})
         else:
-            print("   ⚠️  No WebSocket send callback available")
+            log.debug("No WebSocket send callback available", extra={"run_id": self.run_id})
                 
+    def messages_since(self, last_seq: int) -> Optional[List[WebSocketMessage]]:
+        """Messages after last_seq, or None when some of them are no longer buffered"""
+        if last_seq >= self.seq:
+            return []
+        if last_seq < self.evicted_seq:
+            return None
+        return [message for message in self.recent_messages if message.seq > last_seq]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Compact state of the run for clients too far behind to replay messages"""
+        return {
+            "seq": self.seq,
+            "progress": self.progress,
+            "current_task": self.current_task,
+            "current_agent": self.current_agent,
+            "completed_tasks": list(self.completed_tasks),
+            "outputs": {
+                task_name: {
+                    agent_name: {
+                        **self._output_payload(task_name, output["output"]),
+                        "output_type": output["output_type"]
+                    }
+                    for agent_name, output in agents.items()
+                }
+                for task_name, agents in self.agent_outputs.items()
+            },
+            "crew_complete": self.crew_complete.model_dump(mode="json") if self.crew_complete else None
+        }
+        
     def get_all_outputs(self) -> Dict[str, Dict[str, Any]]:
         """Get all captured outputs"""
         return self.agent_outputs.copy()
@@ -3,17 +3,26 @@ FastAPI backend for Feature Development Crew Web UI
 """
 
 import asyncio
+import logging
 import os
-from typing import Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
+import time
+from typing import Dict, Any, Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Header, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+from . import metrics
+from .crew_executor import TASK_SEQUENCE
 from .models import FeatureRequest, CrewStatus, WebSocketMessage
 from .websocket_handler import WebSocketHandler
-from .custom_logger import AgentOutputLogger
-from .crew_executor import EnhancedCrewExecutor
+from .run_manager import RunManager, RunQueueFullError, CrewRun, feature_request_hash
+from .run_store import RunStore
+from .output_refs import output_response
+from .trace_export import waterfall
+from .structured_logging import configure_logging
+from crewai_demo.budget import RunBudget, estimate_usage
+from crewai_demo.crew_product_feature import compiled_product_feature_crew
 
 
 # Initialize FastAPI app
@@ -32,22 +41,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Console output goes through a queue so the event loop never blocks on it
+configure_logging()
+log = logging.getLogger(__name__)
+
 # Global instances
 websocket_handler = WebSocketHandler()
-crew_executor = None
-current_execution = None
+run_manager = None
+loop_lag_monitor = None
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
-    global crew_executor
+    global run_manager, loop_lag_monitor
+    
+    # Initialize run manager; every run gets its own executor and logger
+    run_store = RunStore.from_env(os.getenv("CREW_RUNS_DIR", "runs"))
+    interrupted = await asyncio.to_thread(run_store.mark_interrupted)
+    run_manager = RunManager(websocket_handler.send_message_to_all, store=run_store)
+    run_manager.start()
+    websocket_handler.set_run_lookup(run_manager.get)
+    loop_lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
     
-    # Initialize crew executor with WebSocket callback
-    logger = AgentOutputLogger(websocket_handler.send_message_to_all)
-    crew_executor = EnhancedCrewExecutor(logger)
+    # Build the crew template (agents, LLM clients, task graph) once, off the event loop
+    await asyncio.to_thread(compiled_product_feature_crew)
     
-    print("🚀 Feature Development Crew API started")
+    log.info("Feature Development Crew API started", extra={
+        "max_concurrent_runs": run_manager.max_concurrent_runs,
+        "max_queued_runs": run_manager.max_queued_runs,
+        "execution_backend": run_manager.execution_backend,
+        "run_history": run_store.path,
+        "interrupted_runs": interrupted
+    })
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop worker processes and write out pending run history"""
+    if loop_lag_monitor:
+        loop_lag_monitor.cancel()
+    if run_manager:
+        await run_manager.close()
+
+
+def _get_run(run_id: Optional[str]) -> CrewRun:
+    """Look up a run by ID, defaulting to the most recent run"""
+    run = run_manager.get(run_id) if run_manager else None
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Run not found: {run_id}" if run_id else "No runs yet")
+    return run
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -79,112 +122,272 @@ async def websocket_endpoint(websocket: WebSocket):
 
 
 @app.post("/api/start-crew")
-async def start_crew(feature_request: FeatureRequest, background_tasks: BackgroundTasks):
-    """Start the crew execution"""
-    global current_execution
+async def start_crew(
+    feature_request: FeatureRequest,
+    wait: bool = False,
+    idempotency_key: Optional[str] = Header(default=None)
+):
+    """Start a crew run, or attach to an identical run that is already in flight.
     
-    if crew_executor and crew_executor.is_running:
-        raise HTTPException(status_code=400, detail="Crew is already running")
+    With wait=true the response is sent once the run has finished and includes its result.
+    """
+    key = feature_request.idempotency_key or idempotency_key
+    queued = run_manager.running_count() + run_manager.queued_count() >= run_manager.max_concurrent_runs
     
     try:
-        # Clear previous outputs
-        if crew_executor:
-            crew_executor.logger.clear_outputs()
-        
-        # Start execution in background
-        background_tasks.add_task(
-            execute_crew_background,
-            feature_request.feature_request
-        )
-        
-        return {
-            "message": "Crew execution started",
-            "status": "started",
-            "feature_request": feature_request.feature_request
-        }
-        
+        run, attached = run_manager.submit(feature_request.feature_request, idempotency_key=key,
+                                           budget=_budget(feature_request))
+    except RunQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    # Subscribe before the run gets a chance to emit anything; attached clients get its earlier messages
+    subscribed = bool(feature_request.subscriber_id) and websocket_handler.subscribe_connection(
+        feature_request.subscriber_id, run.run_id, last_seq=0 if attached else None
+    )
+    
+    if attached:
+        response = {
+            "message": "Attached to a matching crew run already in progress",
+            "status": run.status,
+            "attached": True
+        }
+    else:
+        response = {
+            "message": "Crew execution queued" if queued else "Crew execution started",
+            "status": "queued" if queued else "started",
+            "attached": False
+        }
+    response.update({"run_id": run.run_id, "feature_request": run.feature_request, "subscribed": subscribed})
+    
+    if wait:
+        await run_manager.wait(run.run_id)
+        response["status"] = run.status
+        response["result"] = run.result
+    return response
+
+
+def _budget(feature_request: FeatureRequest) -> RunBudget:
+    """The default budget with the request's overrides"""
+    overrides = feature_request.budget.model_dump() if feature_request.budget else {}
+    return RunBudget.from_env(**overrides)
+
+
+@app.post("/api/estimate-crew")
+async def estimate_crew(feature_request: FeatureRequest):
+    """Dry run: expected and worst-case tokens of a run of this request, checked against its budget"""
+    history = {}
+    if run_manager and run_manager.store:
+        history = await asyncio.to_thread(run_manager.store.task_usage_history)
+    return estimate_usage(
+        compiled_product_feature_crew(),
+        [task_info["name"] for task_info in TASK_SEQUENCE],
+        {"feature_request": feature_request.feature_request},
+        history=history,
+        budget=_budget(feature_request)
+    )
 
 
 @app.post("/api/stop-crew")
-async def stop_crew():
-    """Stop the crew execution"""
-    global current_execution
+async def stop_crew(run_id: Optional[str] = None, force: bool = False):
+    """Stop a crew run (defaults to the most recent active run).
+    
+    With force=true a run in a worker process is killed instead of asked to stop.
+    """
+    run = _get_run(run_id) if run_id else run_manager.latest_active()
     
-    if not crew_executor or not crew_executor.is_running:
+    if not run or not run.is_active:
         raise HTTPException(status_code=400, detail="No crew is currently running")
     
     try:
-        crew_executor.stop_execution()
-        return {"message": "Crew execution stopped", "status": "stopped"}
+        run_manager.stop(run.run_id, force=force)
+        return {"message": "Crew execution stopped", "status": "stopped", "run_id": run.run_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/status")
-async def get_status():
-    """Get current crew execution status"""
-    if not crew_executor:
+async def get_status(run_id: Optional[str] = None):
+    """Get crew run status (defaults to the most recent run)"""
+    run = run_manager.get(run_id) if run_manager else None
+    if not run:
+        if run_id:
+            raise HTTPException(status_code=404, detail=f"Run not found: {run_id}")
         return CrewStatus(is_running=False)
     
-    status = crew_executor.get_status()
-    return CrewStatus(**status)
+    return CrewStatus(**run.to_status())
 
 
 @app.get("/api/outputs")
-async def get_outputs():
-    """Get all agent outputs"""
-    if not crew_executor:
+async def get_outputs(run_id: Optional[str] = None):
+    """Get all agent outputs of a run (defaults to the most recent run)"""
+    run = run_manager.get(run_id) if run_manager else None
+    if not run:
+        if run_id and run_manager and run_manager.store:
+            # Older runs are only kept in the run history
+            outputs = await asyncio.to_thread(run_manager.store.get_outputs, run_id)
+            if outputs:
+                return {"run_id": run_id, "outputs": outputs, "count": len(outputs)}
+        if run_id:
+            raise HTTPException(status_code=404, detail=f"Run not found: {run_id}")
         return {"outputs": []}
     
+    outputs = run.logger.get_all_outputs()
     return {
-        "outputs": crew_executor.logger.get_all_outputs(),
-        "count": len(crew_executor.logger.get_all_outputs())
+        "run_id": run.run_id,
+        "outputs": outputs,
+        "count": len(outputs)
     }
 
 
 @app.get("/api/files/{filename}")
-async def get_generated_file(filename: str):
-    """Serve generated files"""
+async def get_generated_file(filename: str, run_id: Optional[str] = None):
+    """Serve generated files of a run (defaults to the most recent run)"""
     # Security check - only allow specific files
     allowed_files = ["frontend_code.html"]
     
     if filename not in allowed_files:
         raise HTTPException(status_code=404, detail="File not found")
     
-    if os.path.exists(filename):
-        return FileResponse(
-            filename,
-            media_type="text/html" if filename.endswith(".html") else "application/octet-stream"
+    media_type = "text/html" if filename.endswith(".html") else "application/octet-stream"
+    run = run_manager.get(run_id) if run_manager else None
+    if run:
+        file_path = os.path.join(run.output_dir, filename)
+        if os.path.exists(file_path):
+            return FileResponse(file_path, media_type=media_type)
+    
+    # Fall back to the copy kept in the run history
+    if run_id and run_manager and run_manager.store:
+        content = await asyncio.to_thread(run_manager.store.get_file, run_id, filename)
+        if content is not None:
+            return Response(content, media_type=media_type)
+    raise HTTPException(status_code=404, detail="File not found")
+
+
+@app.get("/api/runs")
+async def list_runs(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    feature_request: Optional[str] = None
+):
+    """Page through the run history, newest first.
+    
+    Pass next_cursor from a response as cursor to get the next page. feature_request
+    matches runs of the same request, ignoring case and whitespace.
+    """
+    if not run_manager or not run_manager.store:
+        raise HTTPException(status_code=503, detail="Run history is not available")
+    limit = max(1, min(limit, 100))
+    feature_hash = feature_request_hash(feature_request) if feature_request else None
+    
+    try:
+        runs, next_cursor = await asyncio.to_thread(
+            run_manager.store.list_runs, limit, cursor, status, feature_hash
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"runs": runs, "next_cursor": next_cursor, "count": len(runs)}
+
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: str):
+    """Get a run from the history with its outputs and generated files"""
+    if not run_manager or not run_manager.store:
+        raise HTTPException(status_code=503, detail="Run history is not available")
+    
+    run = await asyncio.to_thread(run_manager.store.get_run, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Run not found: {run_id}")
+    return run
+
+
+@app.get("/api/runs/{run_id}/outputs/{task_name}")
+async def get_run_output(run_id: str, task_name: str, request: Request):
+    """Get the full text of one task's output (supports ETag, gzip and Range)"""
+    run = run_manager.get(run_id) if run_manager else None
+    if run:
+        agents = run.logger.get_all_outputs().get(task_name)
+    elif run_manager and run_manager.store:
+        agents = (await asyncio.to_thread(run_manager.store.get_outputs, run_id)).get(task_name)
     else:
-        raise HTTPException(status_code=404, detail="File not found")
+        agents = None
+    
+    if not agents:
+        raise HTTPException(status_code=404, detail=f"No output for task {task_name} in run {run_id}")
+    output = next(iter(agents.values()))["output"]
+    return output_response(request, output)
+
+
+@app.get("/api/runs/{run_id}/trace")
+async def get_run_trace(run_id: str):
+    """Waterfall of a run's spans: the run, its tasks, agent iterations, LLM and tool calls"""
+    run = run_manager.get(run_id) if run_manager else None
+    if run:
+        # Spans still open in a running run are not included yet
+        spans = run.executor.tracer.spans()
+    elif run_manager and run_manager.trace_exporter:
+        spans = await asyncio.to_thread(run_manager.trace_exporter.load, run_id)
+    else:
+        spans = []
+    
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"No trace for run {run_id}")
+    return waterfall(run_id, spans)
+
+
+@app.get("/api/search")
+async def search_outputs(
+    q: str,
+    limit: int = 20,
+    output_type: Optional[str] = None,
+    run_id: Optional[str] = None
+):
+    """Search past agent outputs (product specs, wireframes, API designs, HTML)"""
+    if not run_manager or not run_manager.store:
+        raise HTTPException(status_code=503, detail="Run history is not available")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    limit = max(1, min(limit, 100))
+    
+    start = time.perf_counter()
+    results = await asyncio.to_thread(run_manager.store.search, q, limit, output_type, run_id)
+    return {
+        "query": q,
+        "results": results,
+        "count": len(results),
+        "took_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
 
 
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
+    ws_stats = websocket_handler.get_stats()
     return {
         "status": "healthy",
         "websocket_connections": websocket_handler.get_connection_count(),
-        "crew_running": crew_executor.is_running if crew_executor else False
+        "websocket_queued_messages": ws_stats["queued"],
+        "websocket_dropped_messages": ws_stats["dropped"],
+        "crew_running": run_manager.running_count() > 0 if run_manager else False,
+        "running_runs": run_manager.running_count() if run_manager else 0,
+        "queued_runs": run_manager.queued_count() if run_manager else 0,
+        "execution_backend": run_manager.execution_backend if run_manager else None,
+        "process_workers": run_manager.process_pool.get_stats() if run_manager and run_manager.process_pool else None
     }
 
 
-async def execute_crew_background(feature_request: str):
-    """Execute crew in background task"""
-    global current_execution
-    
-    try:
-        print(f"DEBUG: Starting crew execution for: {feature_request}")
-        current_execution = await crew_executor.execute_crew(feature_request)
-        print(f"DEBUG: Crew execution completed: {current_execution.success}")
-    except Exception as e:
-        print(f"DEBUG: Crew execution failed: {e}")
-        import traceback
-        traceback.print_exc()
-        current_execution = None
+@app.get("/api/websocket/stats")
+async def websocket_stats():
+    """Send queue depths and drop/coalesce counters of the WebSocket connections"""
+    return websocket_handler.get_stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Run, LLM, WebSocket and event loop metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 # Mount static files (for serving frontend assets)
@@ -0,0 +1,211 @@
+"""
+Metrics in the Prometheus text exposition format, served at /metrics
+
+Counters, gauges and histograms are module-level objects that the executor,
+logger, connection manager and run manager update directly; updates are
+thread-safe, so crew threads can record too. Gauges whose value is cheap to
+read at scrape time (queue depths, connection counts) are set with a function
+instead of being kept up to date.
+"""
+
+import asyncio
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Seconds; tasks take from seconds to tens of minutes
+TASK_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+# LLM calls held back by the rate limiter (seconds)
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Seconds; in-process latencies
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric"):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 registry: MetricsRegistry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Any]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], Any]):
+        """Read the value at scrape time: a number, or (label values, number) pairs for a labelled gauge"""
+        self._function = function
+
+    def samples(self) -> Iterable[str]:
+        if self._function is not None:
+            result = self._function()
+            values = [((), result)] if not self.label_names else list(result)
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        for key, value in sorted(values):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (count per bucket, sum, count)
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+# Crew runs (EnhancedCrewExecutor, RunManager)
+RUNS_TOTAL = Counter("crew_runs_total", "Finished crew runs by final status", ["status"])
+RUN_DURATION = Histogram("crew_run_duration_seconds", "Wall time of crew runs", ["status"], buckets=TASK_BUCKETS)
+RUNS_ACTIVE = Gauge("crew_runs_active", "Crew runs currently executing")
+RUNS_QUEUED = Gauge("crew_runs_queued", "Crew runs waiting for a free slot")
+TASK_DURATION = Histogram("crew_task_duration_seconds", "Time from a task's start to its output",
+                          ["task", "agent"], buckets=TASK_BUCKETS)
+
+# LLM usage, counted per run (EnhancedCrewExecutor)
+LLM_CALLS = Counter("crew_llm_calls_total", "LLM calls made by crew agents, including cache hits")
+LLM_TOKENS = Counter("crew_llm_tokens_total", "Tokens used by crew LLM calls", ["type"])
+LLM_CACHE_LOOKUPS = Counter("crew_llm_cache_lookups_total", "LLM response cache lookups", ["result"])
+LLM_QUEUE_WAIT = Histogram("crew_llm_queue_wait_seconds", "Time provider calls waited for the LLM rate limiter",
+                           buckets=QUEUE_WAIT_BUCKETS)
+LLM_RATE_LIMITED = Counter("crew_llm_rate_limited_total", "429 responses from the LLM provider")
+
+# LLM rate limiter of the thread backend (RunManager)
+LLM_CONCURRENCY_LIMIT = Gauge("crew_llm_concurrency_limit", "Adaptive limit on LLM calls in flight")
+LLM_IN_FLIGHT = Gauge("crew_llm_calls_in_flight", "LLM calls sent to the provider and not yet answered")
+
+# Run messages (AgentOutputLogger)
+RUN_MESSAGES = Counter("crew_run_messages_total", "Messages emitted by crew runs", ["type"])
+
+# WebSocket fan-out (ConnectionManager)
+WS_CONNECTIONS = Gauge("websocket_connections", "Open WebSocket connections")
+WS_QUEUE_DEPTH = Gauge("websocket_send_queue_depth", "Messages waiting in a connection's send queue", ["connection_id"])
+WS_BROADCAST_DURATION = Histogram("websocket_broadcast_duration_seconds",
+                                  "Time to queue a run message for every subscriber")
+WS_SEND_LATENCY = Histogram("websocket_send_latency_seconds",
+                            "Time from queueing a message to writing it to a connection")
+WS_DROPPED = Counter("websocket_dropped_messages_total", "Messages shed for slow clients", ["reason"])
+WS_SLOW_DISCONNECTS = Counter("websocket_slow_disconnects_total", "Connections closed for falling too far behind")
+
+# Event loop
+EVENT_LOOP_LAG = Histogram("event_loop_lag_seconds", "How late the event loop ran a timer")
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late the loop wakes up from sleep(interval), until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
@@ -20,18 +20,35 @@ class MessageType(str, Enum):
 class WebSocketMessage(BaseModel):
     type: MessageType
     timestamp: datetime
+    run_id: Optional[str] = None
+    # Increases by one with every message of a run
+    seq: Optional[int] = None
     agent: Optional[str] = None
     task: Optional[str] = None
     data: Dict[str, Any]
     progress: Optional[int] = None
 
 
+class Budget(BaseModel):
+    """Overrides of the run's default budget (RUN_TOKEN_BUDGET etc.); 0 means no limit"""
+    run_tokens: Optional[int] = None
+    task_tokens: Optional[int] = None
+    run_seconds: Optional[float] = None
+    task_seconds: Optional[float] = None
+
+
 class FeatureRequest(BaseModel):
     feature_request: str
+    idempotency_key: Optional[str] = None
+    # WebSocket connection to subscribe to the run's events
+    subscriber_id: Optional[str] = None
+    budget: Optional[Budget] = None
 
 
 class CrewStatus(BaseModel):
     is_running: bool
+    run_id: Optional[str] = None
+    status: Optional[str] = None
     current_task: Optional[str] = None
     current_agent: Optional[str] = None
     progress: int = 0
@@ -54,3 +71,10 @@ class CrewExecutionResult(BaseModel):
     execution_time: float
     generated_files: List[str] = []
     final_result: Optional[str] = None
+    critical_path: List[str] = []
+    critical_path_time: Optional[float] = None
+    cache_stats: Optional[Dict[str, Any]] = None
+    # Tokens per task and in total (see budget.usage_report)
+    token_usage: Optional[Dict[str, Any]] = None
+    # Set when the run stopped itself for going over budget
+    budget_exceeded: Optional[str] = None
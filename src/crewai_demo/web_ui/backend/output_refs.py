@@ -0,0 +1,116 @@
+"""
+Large task outputs travel by reference: WebSocket messages carry an ID, size
+and hash, and clients fetch the text over HTTP with caching, gzip and ranges.
+"""
+
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Outputs up to this size are still sent inline
+OUTPUT_INLINE_MAX_BYTES = int(os.getenv("OUTPUT_INLINE_MAX_BYTES", "4096"))
+
+# Compressed bodies by sha256, so popular outputs are gzipped once
+_gzip_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_GZIP_CACHE_SIZE = 64
+
+
+def output_ref(run_id: str, task_name: str, output: str) -> Optional[Dict[str, Any]]:
+    """Reference to an output, or None when it is small enough to send inline"""
+    body = output.encode("utf-8")
+    if len(body) <= OUTPUT_INLINE_MAX_BYTES:
+        return None
+    return {
+        "id": f"{run_id}:{task_name}",
+        "size": len(body),
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "url": f"/api/runs/{run_id}/outputs/{task_name}",
+    }
+
+
+def output_response(request: Request, output: str) -> Response:
+    """Serve an output with ETag revalidation, gzip and single byte ranges"""
+    body = output.encode("utf-8")
+    digest = hashlib.sha256(body).hexdigest()
+    # The gzip representation has different bytes, so it gets an ETag of its own
+    identity_etag = f'"{digest}"'
+    gzip_etag = f'"{digest}-gzip"'
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "") and len(body) > 1024
+    headers = {
+        "ETag": gzip_etag if use_gzip else identity_etag,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        # Outputs of a run never change once written
+        "Cache-Control": "private, max-age=86400, immutable",
+        # Generated HTML is served as text, never rendered from this origin
+        "X-Content-Type-Options": "nosniff",
+    }
+    media_type = "text/plain; charset=utf-8"
+
+    if headers["ETag"] in _parse_etags(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+
+    # Ranges are offsets into the identity body, so If-Range only matches its ETag
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == identity_etag):
+        byte_range = _parse_range(range_header, len(body))
+        if byte_range is None:
+            headers["ETag"] = identity_etag
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            return Response(status_code=416, headers=headers)
+        if byte_range != (0, len(body) - 1):
+            start, end = byte_range
+            headers["ETag"] = identity_etag
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            return Response(body[start:end + 1], status_code=206, headers=headers, media_type=media_type)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(_gzipped(digest, body), headers=headers, media_type=media_type)
+    return Response(body, headers=headers, media_type=media_type)
+
+
+def _gzipped(digest: str, body: bytes) -> bytes:
+    if digest in _gzip_cache:
+        _gzip_cache.move_to_end(digest)
+        return _gzip_cache[digest]
+    compressed = gzip.compress(body, compresslevel=6)
+    _gzip_cache[digest] = compressed
+    if len(_gzip_cache) > _GZIP_CACHE_SIZE:
+        _gzip_cache.popitem(last=False)
+    return compressed
+
+
+def _parse_etags(header: str) -> set:
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' range into inclusive offsets; None when unsatisfiable.
+
+    Multiple ranges are answered with the whole body.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec or size == 0:
+        return (0, size - 1) if size else None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return 0, size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
@@ -0,0 +1,240 @@
+"""
+Process backend: runs crews in worker processes instead of API server threads
+
+Workers are started ahead of time and import crewai and build the crew template
+before taking a job, so runs start without import cost and CrewAI's prompt
+templating and verbose printing don't compete with the event loop for the GIL.
+Each worker runs one crew at a time. Logger events come back over the worker's
+pipe as the same (method, args) pairs the thread backend posts.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from crewai_demo.run_context import BudgetExceededError, RunCancelledError
+from .structured_logging import configure_logging
+
+
+log = logging.getLogger(__name__)
+
+
+class CrewWorkerError(Exception):
+    """A crew run failed inside a worker process, or the worker died"""
+
+
+def _worker_main(jobs, events, cancel_event):
+    """Entry point of a worker process"""
+    configure_logging()
+    # Importing the executor imports crewai; building the template warms its caches
+    from crewai_demo.crew_product_feature import compiled_product_feature_crew
+    from .crew_executor import run_crew_in_worker
+
+    compiled_product_feature_crew()
+    # Crew threads post events concurrently; a Connection is not thread-safe
+    send_lock = threading.Lock()
+
+    def send(kind: str, payload: Any):
+        with send_lock:
+            events.send((kind, payload))
+
+    send("ready", None)
+    while True:
+        job = jobs.recv()
+        if job is None:
+            return
+        try:
+            summary = run_crew_in_worker(job, lambda method, args: send("event", (method, args)), cancel_event)
+        except BudgetExceededError as e:
+            send("over_budget", str(e))
+        except RunCancelledError:
+            send("cancelled", None)
+        except Exception as e:
+            log.exception("Crew run failed in worker", extra={"run_id": job["run_id"]})
+            send("error", f"{type(e).__name__}: {e}")
+        else:
+            send("result", summary)
+
+
+class _Worker:
+    """A worker process and the pipes to it"""
+
+    def __init__(self, worker_id: int, process, jobs, events, cancel_event):
+        self.worker_id = worker_id
+        self.process = process
+        self.jobs = jobs
+        self.events = events
+        self.cancel_event = cancel_event
+        self.run_id: Optional[str] = None
+        self.ready = False
+
+
+class CrewProcessPool:
+    """Fixed number of pre-warmed worker processes, each running one crew at a time.
+
+    Every worker has its own pipes, so killing one never corrupts a queue the
+    others use. A worker that exits is replaced, unless it never finished
+    starting, which would only fail again.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        # A forked child would inherit the event loop and every server thread
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: Dict[int, _Worker] = {}
+        self._runs: Dict[str, tuple] = {}  # run_id -> (worker, future, on_event)
+        self._next_worker_id = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing = False
+
+    def start(self):
+        """Start the workers; call from the event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._spawn()
+
+    def _spawn(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        jobs_recv, jobs_send = self._context.Pipe(duplex=False)
+        events_recv, events_send = self._context.Pipe(duplex=False)
+        cancel_event = self._context.Event()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(jobs_recv, events_send, cancel_event),
+            name=f"crew-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # Close our copies of the child's ends so a dead worker shows up as EOF
+        jobs_recv.close()
+        events_send.close()
+
+        worker = _Worker(worker_id, process, jobs_send, events_recv, cancel_event)
+        self._workers[worker_id] = worker
+        threading.Thread(target=self._read_events, args=(worker,),
+                         name=f"crew-worker-{worker_id}-events", daemon=True).start()
+
+    def _read_events(self, worker: _Worker):
+        """Hand a worker's messages to the event loop until the worker exits"""
+        try:
+            while True:
+                try:
+                    kind, payload = worker.events.recv()
+                except (EOFError, OSError):
+                    break
+                self._loop.call_soon_threadsafe(self._on_message, worker, kind, payload)
+            worker.process.join()
+            self._loop.call_soon_threadsafe(self._on_exit, worker)
+        except RuntimeError:
+            # Event loop closed during shutdown
+            pass
+
+    def _on_message(self, worker: _Worker, kind: str, payload: Any):
+        if kind == "ready":
+            worker.ready = True
+            self._idle.put_nowait(worker)
+            return
+        run = self._runs.get(worker.run_id) if worker.run_id else None
+        if run is None:
+            return
+        _, future, on_event = run
+        if kind == "event":
+            on_event(*payload)
+        elif future.done():
+            return
+        elif kind == "result":
+            future.set_result(payload)
+        elif kind == "cancelled":
+            future.set_exception(RunCancelledError(f"Run {worker.run_id} was stopped"))
+        elif kind == "over_budget":
+            future.set_exception(BudgetExceededError(payload))
+        else:
+            future.set_exception(CrewWorkerError(payload))
+
+    def _on_exit(self, worker: _Worker):
+        self._workers.pop(worker.worker_id, None)
+        run = self._runs.get(worker.run_id) if worker.run_id else None
+        if run and not run[1].done():
+            run[1].set_exception(CrewWorkerError(f"Crew worker exited with code {worker.process.exitcode}"))
+        if self._closing:
+            return
+        if worker.ready:
+            self._spawn()
+            return
+        log.error("Crew worker failed to start", extra={"worker_id": worker.worker_id, "exit_code": worker.process.exitcode})
+        if not self._workers:
+            # Wake runs waiting for a worker; there won't be one
+            self._idle.put_nowait(None)
+
+    async def run(self, job: Dict[str, Any], on_event: Callable[[str, tuple], None]) -> Dict[str, Any]:
+        """Run a crew job on an idle worker and return its summary.
+
+        on_event is called on the event loop with (method, args) for every
+        logger event of the run. Raises RunCancelledError if the run was
+        stopped and CrewWorkerError if it failed.
+        """
+        while True:
+            worker = await self._idle.get()
+            if worker is None:
+                self._idle.put_nowait(None)
+                raise CrewWorkerError("No crew worker processes are running")
+            if worker.worker_id in self._workers:
+                break
+
+        run_id = job["run_id"]
+        future = self._loop.create_future()
+        worker.run_id = run_id
+        worker.cancel_event.clear()
+        self._runs[run_id] = (worker, future, on_event)
+        try:
+            worker.jobs.send(job)
+            return await future
+        finally:
+            del self._runs[run_id]
+            worker.run_id = None
+            if worker.worker_id in self._workers:
+                self._idle.put_nowait(worker)
+
+    def cancel(self, run_id: str):
+        """Ask the worker running run_id to stop at its next cancellation check"""
+        run = self._runs.get(run_id)
+        if run:
+            run[0].cancel_event.set()
+
+    def kill(self, run_id: str):
+        """Kill the worker running run_id right away; a new worker takes its place"""
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        worker, future, _ = run
+        # Never hand this worker another job, even before its exit is noticed
+        self._workers.pop(worker.worker_id, None)
+        worker.process.kill()
+        if not future.done():
+            future.set_exception(RunCancelledError(f"Run {run_id} was killed"))
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle else 0,
+            "busy": len(self._runs),
+        }
+
+    def close(self, timeout: float = 5.0):
+        """Stop all workers; blocks, so call it off the event loop"""
+        self._closing = True
+        workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.jobs.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
@@ -0,0 +1,304 @@
+"""
+Run manager for executing several crew runs concurrently
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Dict, Any, Optional, Callable, List, Set
+
+from crewai_demo.budget import RunBudget
+from crewai_demo.rate_limit import shared_rate_limiter
+from . import metrics
+from .custom_logger import AgentOutputLogger
+from .crew_executor import EnhancedCrewExecutor
+from .models import CrewExecutionResult, AgentOutput
+from .process_pool import CrewProcessPool
+from .run_store import RunStore
+from .trace_export import TraceExporter
+
+
+log = logging.getLogger(__name__)
+
+class RunQueueFullError(Exception):
+    """Raised when both the run slots and the wait queue are full"""
+
+
+def feature_request_hash(feature_request: str) -> str:
+    """Hash of a feature request with case and whitespace normalized"""
+    normalized = " ".join(feature_request.split()).casefold()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class CrewRun:
+    """State of a single crew run"""
+
+    def __init__(self, run_id: str, feature_request: str, logger: AgentOutputLogger,
+                 executor: EnhancedCrewExecutor, output_dir: str,
+                 idempotency_key: Optional[str] = None):
+        self.run_id = run_id
+        self.feature_request = feature_request
+        self.request_hash = feature_request_hash(feature_request)
+        self.idempotency_key = idempotency_key
+        self.logger = logger
+        self.executor = executor
+        self.output_dir = output_dir
+        self.status = "queued"  # queued, running, completed, failed, stopped
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[CrewExecutionResult] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Compact state of this run for clients that missed too many messages"""
+        snapshot = self.logger.snapshot()
+        snapshot["status"] = self.status
+        return snapshot
+
+    def to_status(self) -> Dict[str, Any]:
+        """Get the status of this run"""
+        status = self.executor.get_status()
+        status.update({
+            "run_id": self.run_id,
+            "status": self.status,
+            "start_time": self.started_at,
+        })
+        return status
+
+
+class RunManager:
+    """Gives each crew run its own executor and logger and runs them concurrently"""
+
+    def __init__(self, websocket_send_callback: Optional[Callable] = None,
+                 max_concurrent_runs: Optional[int] = None,
+                 max_queued_runs: Optional[int] = None,
+                 max_finished_runs: int = 50,
+                 runs_dir: Optional[str] = None,
+                 store: Optional[RunStore] = None,
+                 execution_backend: Optional[str] = None):
+        self.websocket_send = websocket_send_callback
+        self.max_concurrent_runs = max_concurrent_runs or int(os.getenv("MAX_CONCURRENT_RUNS", "4"))
+        self.max_queued_runs = max_queued_runs if max_queued_runs is not None else int(os.getenv("MAX_QUEUED_RUNS", "16"))
+        self.max_finished_runs = max_finished_runs
+        self.runs_dir = runs_dir or os.getenv("CREW_RUNS_DIR", "runs")
+        self.runs: Dict[str, CrewRun] = {}
+        # Idempotency keys and request hashes of queued/running runs -> run ID
+        self._inflight: Dict[str, str] = {}
+        self._slots = asyncio.Semaphore(self.max_concurrent_runs)
+        # Runs holding a slot; a stopped run keeps its slot until its crew has unwound
+        self._slot_holders: Set[str] = set()
+        # Run history; one writer thread keeps writes off the event loop and in order
+        self.store = store
+        self._store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-store")
+        # "process" runs each crew in a pre-warmed worker process, "thread" in this process
+        self.execution_backend = execution_backend or os.getenv("CREW_EXECUTION_BACKEND", "thread")
+        self.process_pool = (
+            CrewProcessPool(self.max_concurrent_runs) if self.execution_backend == "process" else None
+        )
+        # Where finished runs' traces are written; None when TRACE_EXPORT is off
+        self.trace_exporter = TraceExporter.from_env(self.runs_dir)
+        metrics.RUNS_ACTIVE.set_function(self.running_count)
+        metrics.RUNS_QUEUED.set_function(self.queued_count)
+        # Worker processes each have a limiter of their own, so only the thread backend's is in this process
+        limiter = shared_rate_limiter()
+        if self.process_pool is None and limiter is not None and limiter.concurrency is not None:
+            metrics.LLM_CONCURRENCY_LIMIT.set_function(lambda: int(limiter.concurrency.limit))
+            metrics.LLM_IN_FLIGHT.set_function(lambda: limiter.concurrency.in_flight)
+
+    def start(self):
+        """Start the worker processes of the process backend; call from the event loop"""
+        if self.process_pool:
+            self.process_pool.start()
+
+    async def close(self):
+        """Stop the worker processes and write out pending run history"""
+        if self.process_pool:
+            await asyncio.to_thread(self.process_pool.close)
+        if self.store:
+            await self.flush_store()
+            self.store.close()
+
+    def submit(self, feature_request: str, idempotency_key: Optional[str] = None,
+               budget: Optional[RunBudget] = None) -> tuple[CrewRun, bool]:
+        """Create and schedule a run, or attach to a matching in-flight run.
+
+        Returns the run and whether it was an existing one. Raises
+        RunQueueFullError when a new run is needed but there is no capacity.
+        """
+        existing = self.find_inflight(feature_request, idempotency_key)
+        if existing:
+            return existing, True
+        
+        if self.running_count() + self.queued_count() >= self.max_concurrent_runs + self.max_queued_runs:
+            raise RunQueueFullError(
+                f"Too many runs: {self.running_count()} running, {self.queued_count()} queued"
+            )
+
+        run_id = uuid.uuid4().hex[:12]
+        output_dir = os.path.join(self.runs_dir, run_id)
+        logger = AgentOutputLogger(self.websocket_send, run_id=run_id,
+                                   output_callback=partial(self._persist_output, run_id))
+        executor = EnhancedCrewExecutor(logger, output_dir=output_dir, process_pool=self.process_pool,
+                                        trace_exporter=self.trace_exporter, budget=budget)
+
+        run = CrewRun(run_id, feature_request, logger, executor, output_dir, idempotency_key)
+        self.runs[run_id] = run
+        if self.store:
+            self._persist(self.store.create_run, run_id, feature_request, run.request_hash,
+                          run.created_at, output_dir)
+        for key in self._inflight_keys(run):
+            self._inflight[key] = run_id
+        run.task = asyncio.create_task(self._execute(run))
+        return run, False
+
+    def find_inflight(self, feature_request: str, idempotency_key: Optional[str] = None) -> Optional[CrewRun]:
+        """Find a queued or running run with the same idempotency key or normalized request"""
+        keys = [f"request:{feature_request_hash(feature_request)}"]
+        if idempotency_key:
+            keys.insert(0, f"idempotency:{idempotency_key}")
+        for key in keys:
+            run = self.runs.get(self._inflight.get(key, ""))
+            if run and run.is_active:
+                return run
+        return None
+
+    @staticmethod
+    def _inflight_keys(run: CrewRun) -> List[str]:
+        keys = [f"request:{run.request_hash}"]
+        if run.idempotency_key:
+            keys.append(f"idempotency:{run.idempotency_key}")
+        return keys
+
+    def _release_inflight(self, run: CrewRun):
+        """Stop coalescing new requests into a finished run"""
+        for key in self._inflight_keys(run):
+            if self._inflight.get(key) == run.run_id:
+                del self._inflight[key]
+
+    async def wait(self, run_id: str) -> CrewRun:
+        """Wait until a run has finished"""
+        run = self.runs[run_id]
+        if run.task:
+            # Unlike awaiting the task, neither cancels it nor raises when a queued run's task was cancelled
+            await asyncio.wait([run.task])
+        return run
+
+    def _persist(self, write: Callable, *args) -> asyncio.Future:
+        """Queue a store write on the writer thread"""
+        future = asyncio.get_running_loop().run_in_executor(self._store_writer, write, *args)
+        future.add_done_callback(self._report_store_error)
+        return future
+
+    def _persist_output(self, run_id: str, output: AgentOutput):
+        if self.store:
+            self._persist(self.store.save_output, run_id, output)
+
+    @staticmethod
+    def _report_store_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            log.error("Run store write failed: %s", future.exception())
+
+    async def flush_store(self):
+        """Wait until every queued store write has been applied"""
+        if self.store:
+            await asyncio.get_running_loop().run_in_executor(self._store_writer, lambda: None)
+
+    async def _execute(self, run: CrewRun):
+        """Wait for a free slot, then execute the run"""
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            if run.status == "stopped":
+                # Stopped while waiting in the queue (see stop)
+                return
+            raise
+        try:
+            if run.status != "queued":
+                return
+
+            run.status = "running"
+            run.started_at = datetime.now()
+            if self.store:
+                self._persist(self.store.update_status, run.run_id, "running", run.started_at)
+            self._slot_holders.add(run.run_id)
+            try:
+                log.info("Starting crew run", extra={"run_id": run.run_id, "feature_request": run.feature_request[:100]})
+                run.result = await run.executor.execute_crew(run.feature_request)
+                if run.status == "running":
+                    if run.result.success:
+                        run.status = "completed"
+                    else:
+                        run.status = "stopped" if run.result.budget_exceeded else "failed"
+                log.info("Crew run finished", extra={"run_id": run.run_id, "status": run.status})
+            except Exception:
+                log.exception("Crew run failed", extra={"run_id": run.run_id})
+                run.status = "failed"
+            finally:
+                self._slot_holders.discard(run.run_id)
+                run.finished_at = datetime.now()
+                self._release_inflight(run)
+                if self.store:
+                    self._persist(self.store.save_result, run.run_id, run.status, run.result,
+                                  run.finished_at, run.output_dir)
+                self._prune_finished()
+        finally:
+            self._slots.release()
+
+    def stop(self, run_id: str, force: bool = False) -> CrewRun:
+        """Stop a queued or running run; force kills a run in a worker process right away"""
+        run = self.runs[run_id]
+        if run.status == "running":
+            run.executor.stop_execution(force=force)
+        elif run.status == "queued" and run.task:
+            # Don't leave it waiting for a slot only to find it was stopped
+            run.task.cancel()
+        if run.is_active:
+            run.status = "stopped"
+            run.finished_at = run.finished_at or datetime.now()
+            self._release_inflight(run)
+            if self.store:
+                self._persist(self.store.update_status, run.run_id, "stopped", None, run.finished_at)
+        return run
+
+    def get(self, run_id: Optional[str] = None) -> Optional[CrewRun]:
+        """Get a run by ID, or the most recently created run"""
+        if run_id:
+            return self.runs.get(run_id)
+        if not self.runs:
+            return None
+        return next(reversed(self.runs.values()))
+
+    def latest_active(self) -> Optional[CrewRun]:
+        """Get the most recently created run that is still queued or running"""
+        for run in reversed(self.runs.values()):
+            if run.is_active:
+                return run
+        return None
+
+    def list_runs(self) -> List[CrewRun]:
+        return list(self.runs.values())
+
+    def running_count(self) -> int:
+        """Runs holding a slot, including stopped runs whose crew is still unwinding"""
+        return len(self._slot_holders)
+
+    def queued_count(self) -> int:
+        return sum(1 for run in self.runs.values() if run.status == "queued")
+
+    def _prune_finished(self):
+        """Forget the oldest finished runs beyond max_finished_runs"""
+        # A stopped run whose crew is still unwinding holds a slot and stays visible until it lets go
+        finished = [run_id for run_id, run in self.runs.items()
+                    if not run.is_active and run_id not in self._slot_holders]
+        for run_id in finished[:max(0, len(finished) - self.max_finished_runs)]:
+            del self.runs[run_id]
@@ -0,0 +1,401 @@
+"""
+SQLite store for run history: runs, their agent outputs and generated files
+"""
+
+import base64
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from .models import AgentOutput, CrewExecutionResult
+
+
+class RunStore:
+    """Persists every run so past runs can be queried without keeping them in memory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id TEXT PRIMARY KEY,
+                feature_request TEXT NOT NULL,
+                feature_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                execution_time REAL,
+                success INTEGER,
+                error_message TEXT,
+                final_result TEXT,
+                critical_path TEXT,
+                critical_path_time REAL,
+                cache_stats TEXT,
+                output_dir TEXT,
+                token_usage TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status, created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_runs_feature_hash ON runs(feature_hash, created_at DESC, id DESC);
+
+            CREATE TABLE IF NOT EXISTS outputs (
+                run_id TEXT NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                task_name TEXT NOT NULL,
+                agent_name TEXT NOT NULL,
+                output_type TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (run_id, task_name, agent_name)
+            );
+
+            CREATE TABLE IF NOT EXISTS files (
+                run_id TEXT NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                filename TEXT NOT NULL,
+                content BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (run_id, filename)
+            );
+            """
+        )
+        self._add_missing_columns()
+        self._create_search_index()
+
+    def _add_missing_columns(self):
+        """Add columns introduced after a store was created"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(runs)")}
+        if "token_usage" not in columns:
+            self._conn.execute("ALTER TABLE runs ADD COLUMN token_usage TEXT")
+
+    def _create_search_index(self):
+        """Full-text index over outputs, kept current by triggers on the outputs table"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'outputs_fts'"
+        ).fetchone()
+        self._conn.executescript(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS outputs_fts USING fts5(
+                task_name, agent_name, output_type, output,
+                content='outputs', content_rowid='rowid', tokenize='porter unicode61'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS outputs_fts_insert AFTER INSERT ON outputs BEGIN
+                INSERT INTO outputs_fts (rowid, task_name, agent_name, output_type, output)
+                VALUES (new.rowid, new.task_name, new.agent_name, new.output_type, new.output);
+            END;
+            CREATE TRIGGER IF NOT EXISTS outputs_fts_delete AFTER DELETE ON outputs BEGIN
+                INSERT INTO outputs_fts (outputs_fts, rowid, task_name, agent_name, output_type, output)
+                VALUES ('delete', old.rowid, old.task_name, old.agent_name, old.output_type, old.output);
+            END;
+            CREATE TRIGGER IF NOT EXISTS outputs_fts_update AFTER UPDATE ON outputs BEGIN
+                INSERT INTO outputs_fts (outputs_fts, rowid, task_name, agent_name, output_type, output)
+                VALUES ('delete', old.rowid, old.task_name, old.agent_name, old.output_type, old.output);
+                INSERT INTO outputs_fts (rowid, task_name, agent_name, output_type, output)
+                VALUES (new.rowid, new.task_name, new.agent_name, new.output_type, new.output);
+            END;
+            """
+        )
+        if not exists:
+            # Index outputs stored before the index existed
+            self._conn.execute("INSERT INTO outputs_fts (outputs_fts) VALUES ('rebuild')")
+
+    @classmethod
+    def from_env(cls, runs_dir: str = "runs") -> "RunStore":
+        """Build the store from RUN_STORE_PATH (default: <runs_dir>/runs.sqlite3)"""
+        return cls(os.getenv("RUN_STORE_PATH", os.path.join(runs_dir, "runs.sqlite3")))
+
+    def create_run(self, run_id: str, feature_request: str, feature_hash: str,
+                   created_at: datetime, output_dir: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (id, feature_request, feature_hash, status, created_at, output_dir) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (run_id, feature_request, feature_hash, created_at.timestamp(), output_dir),
+            )
+
+    def update_status(self, run_id: str, status: str,
+                      started_at: Optional[datetime] = None, finished_at: Optional[datetime] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET status = ?, started_at = COALESCE(?, started_at), "
+                "finished_at = COALESCE(?, finished_at) WHERE id = ?",
+                (status, _timestamp(started_at), _timestamp(finished_at), run_id),
+            )
+
+    def save_output(self, run_id: str, output: AgentOutput):
+        """Store one agent output as soon as its task completes"""
+        with self._lock:
+            # Upsert rather than REPLACE so the update trigger keeps the search index in step
+            self._conn.execute(
+                "INSERT INTO outputs (run_id, task_name, agent_name, output_type, output, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, task_name, agent_name) DO UPDATE SET "
+                "output_type = excluded.output_type, output = excluded.output, created_at = excluded.created_at",
+                (run_id, output.task_name, output.agent_name, output.output_type,
+                 output.output, output.timestamp.timestamp()),
+            )
+
+    def save_result(self, run_id: str, status: str, result: Optional[CrewExecutionResult],
+                    finished_at: datetime, output_dir: Optional[str] = None):
+        """Store the final status, timings and generated files of a run"""
+        files = []
+        if result and output_dir:
+            for filename in result.generated_files:
+                path = os.path.join(output_dir, filename)
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        content = f.read()
+                    files.append((run_id, filename, content, len(content)))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "UPDATE runs SET status = ?, finished_at = ?, execution_time = ?, success = ?, "
+                    "error_message = ?, final_result = ?, critical_path = ?, critical_path_time = ?, "
+                    "cache_stats = ?, token_usage = ? WHERE id = ?",
+                    (
+                        status,
+                        finished_at.timestamp(),
+                        result.execution_time if result else None,
+                        int(result.success) if result else None,
+                        result.error_message if result else None,
+                        result.final_result if result else None,
+                        json.dumps(result.critical_path) if result else None,
+                        result.critical_path_time if result else None,
+                        json.dumps(result.cache_stats) if result and result.cache_stats else None,
+                        json.dumps(result.token_usage) if result and result.token_usage else None,
+                        run_id,
+                    ),
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (run_id, filename, content, size) VALUES (?, ?, ?, ?)", files
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def mark_interrupted(self) -> int:
+        """Fail runs left queued or running by a previous server process"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE runs SET status = 'failed', error_message = 'Server stopped before the run finished' "
+                "WHERE status IN ('queued', 'running')"
+            )
+            return cursor.rowcount
+
+    def list_runs(self, limit: int = 20, cursor: Optional[str] = None, status: Optional[str] = None,
+                  feature_hash: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Page through runs, newest first. Returns the runs and the cursor of the next page."""
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if feature_hash:
+            where.append("feature_hash = ?")
+            params.append(feature_hash)
+        if cursor:
+            created_at, run_id = _decode_cursor(cursor)
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([created_at, created_at, run_id])
+
+        query = (
+            "SELECT id, feature_request, feature_hash, status, created_at, started_at, finished_at, "
+            "execution_time, success FROM runs"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY created_at DESC, id DESC LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, (*params, limit + 1)).fetchall()
+
+        runs = [_run_summary(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = _encode_cursor(last["created_at"], last["id"])
+        return runs, next_cursor
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """A run with its outputs and the names of its generated files"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+            if row is None:
+                return None
+            outputs = self._conn.execute(
+                "SELECT task_name, agent_name, output_type, output, created_at FROM outputs "
+                "WHERE run_id = ? ORDER BY created_at", (run_id,)
+            ).fetchall()
+            files = self._conn.execute(
+                "SELECT filename, size FROM files WHERE run_id = ? ORDER BY filename", (run_id,)
+            ).fetchall()
+
+        run = _run_summary(row)
+        run.update({
+            "error_message": row["error_message"],
+            "final_result": row["final_result"],
+            "critical_path": json.loads(row["critical_path"]) if row["critical_path"] else [],
+            "critical_path_time": row["critical_path_time"],
+            "cache_stats": json.loads(row["cache_stats"]) if row["cache_stats"] else None,
+            "token_usage": json.loads(row["token_usage"]) if row["token_usage"] else None,
+            "outputs": [
+                {
+                    "agent_name": output["agent_name"],
+                    "task_name": output["task_name"],
+                    "output_type": output["output_type"],
+                    "output": output["output"],
+                    "timestamp": datetime.fromtimestamp(output["created_at"]),
+                }
+                for output in outputs
+            ],
+            "generated_files": [{"filename": f["filename"], "size": f["size"]} for f in files],
+        })
+        return run
+
+    def task_usage_history(self, limit: int = 20) -> Dict[str, Dict[str, float]]:
+        """Average prompt and completion tokens per task over the last completed runs"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT token_usage FROM runs WHERE status = 'completed' AND token_usage IS NOT NULL "
+                "ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+        totals: Dict[str, Dict[str, float]] = {}
+        for row in rows:
+            for task_name, usage in json.loads(row["token_usage"]).get("tasks", {}).items():
+                total = totals.setdefault(task_name, {"prompt_tokens": 0, "completion_tokens": 0, "runs": 0})
+                total["prompt_tokens"] += usage["prompt_tokens"]
+                total["completion_tokens"] += usage["completion_tokens"]
+                total["runs"] += 1
+        return {
+            task_name: {
+                "prompt_tokens": total["prompt_tokens"] / total["runs"],
+                "completion_tokens": total["completion_tokens"] / total["runs"],
+            }
+            for task_name, total in totals.items()
+        }
+
+    def get_outputs(self, run_id: str) -> Dict[str, Dict[str, Any]]:
+        """Outputs of a run keyed by task and agent, like AgentOutputLogger.get_all_outputs()"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_name, agent_name, output_type, output, created_at FROM outputs WHERE run_id = ?",
+                (run_id,),
+            ).fetchall()
+        outputs: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            outputs.setdefault(row["task_name"], {})[row["agent_name"]] = {
+                "output": row["output"],
+                "output_type": row["output_type"],
+                "timestamp": datetime.fromtimestamp(row["created_at"]),
+            }
+        return outputs
+
+    def search(self, query: str, limit: int = 20, output_type: Optional[str] = None,
+               run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Outputs matching a query, best match first, with highlighted snippets.
+
+        Words must all match; "quoted text" matches as a phrase.
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+
+        where, params = ["outputs_fts MATCH ?"], [match]
+        if output_type:
+            where.append("o.output_type = ?")
+            params.append(output_type)
+        if run_id:
+            where.append("o.run_id = ?")
+            params.append(run_id)
+
+        # \x02 and \x03 mark the matches so the snippet can be HTML-escaped before adding <mark>
+        sql = (
+            "SELECT o.run_id, o.task_name, o.agent_name, o.output_type, o.created_at, "
+            "r.feature_request, snippet(outputs_fts, 3, char(2), char(3), '…', 24) AS snippet, "
+            "rank FROM outputs_fts "
+            "JOIN outputs o ON o.rowid = outputs_fts.rowid "
+            "JOIN runs r ON r.id = o.run_id "
+            "WHERE " + " AND ".join(where) + " ORDER BY rank LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit)).fetchall()
+
+        return [
+            {
+                "run_id": row["run_id"],
+                "feature_request": row["feature_request"],
+                "task_name": row["task_name"],
+                "agent_name": row["agent_name"],
+                "output_type": row["output_type"],
+                "timestamp": datetime.fromtimestamp(row["created_at"]),
+                "snippet": html.escape(row["snippet"]).replace("\x02", "<mark>").replace("\x03", "</mark>"),
+                "score": -row["rank"],
+            }
+            for row in rows
+        ]
+
+    def get_file(self, run_id: str, filename: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM files WHERE run_id = ? AND filename = ?", (run_id, filename)
+            ).fetchone()
+        return row["content"] if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value else None
+
+
+def _run_summary(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "run_id": row["id"],
+        "feature_request": row["feature_request"],
+        "feature_hash": row["feature_hash"],
+        "status": row["status"],
+        "created_at": datetime.fromtimestamp(row["created_at"]),
+        "started_at": datetime.fromtimestamp(row["started_at"]) if row["started_at"] else None,
+        "finished_at": datetime.fromtimestamp(row["finished_at"]) if row["finished_at"] else None,
+        "execution_time": row["execution_time"],
+        "success": bool(row["success"]) if row["success"] is not None else None,
+    }
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query of quoted terms, so punctuation can't break the syntax"""
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|([^\s"]+)', query):
+        text = (phrase or word).strip()
+        if text:
+            terms.append('"' + text.replace('"', '""') + '"')
+    return " ".join(terms)
+
+
+def _encode_cursor(created_at: float, run_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{run_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Raises ValueError for a malformed cursor"""
+    try:
+        created_at, run_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return float(created_at), run_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,119 @@
+"""
+Structured logging for the backend
+
+Modules log through standard loggers (logging.getLogger(__name__)) under the
+"crewai_demo" namespace. configure_logging() gives that namespace a queue
+handler, so the event loop and crew threads only enqueue records; a listener
+thread formats and writes them. Every record carries the run_id of the run it
+was logged from (see run_context.current_run) plus any fields passed with extra=.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Any, Dict, Optional
+
+from crewai_demo.run_context import current_run
+
+
+LOGGER_NAMESPACE = "crewai_demo"
+
+# Attributes every LogRecord has; anything else on a record is a structured field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "run_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class RunContextFilter(logging.Filter):
+    """Adds the run_id of the current run to every record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "run_id", None) is None:
+            run = current_run.get()
+            record.run_id = run.run_id if run is not None else None
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """time LEVEL logger [run_id] message key=value ..."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(run)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.run = f" [{record.run_id}]" if getattr(record, "run_id", None) else ""
+        line = super().format(record)
+        del record.run
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps records structured instead of pre-formatting them"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks can't cross to the listener thread reliably; send the text
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level: Optional[str] = None, log_format: Optional[str] = None):
+    """Route the crewai_demo loggers through a queue to stderr; safe to call more than once.
+
+    level defaults to LOG_LEVEL (INFO), log_format to LOG_FORMAT ("text" or "json").
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    log_format = (log_format or os.getenv("LOG_FORMAT", "text")).lower()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(RunContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAMESPACE)
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
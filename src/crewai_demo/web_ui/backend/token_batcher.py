@@ -0,0 +1,55 @@
+"""
+Batches streamed LLM tokens so the UI updates live without a message per token
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class TokenBatcher:
+    """Collects tokens per key and flushes them after an interval or a number of tokens.
+
+    add() is called from crew worker threads; flush_stale() from a timer so a
+    pause in the stream doesn't hold back the tail of a batch.
+    """
+
+    def __init__(self, flush_callback: Callable[[str, str], None],
+                 interval: Optional[float] = None, max_tokens: Optional[int] = None):
+        self.flush_callback = flush_callback
+        self.interval = interval if interval is not None else float(os.getenv("LLM_STREAM_FLUSH_MS", "50")) / 1000
+        self.max_tokens = max_tokens or int(os.getenv("LLM_STREAM_FLUSH_TOKENS", "32"))
+        self._buffers: Dict[str, List[str]] = {}
+        self._started: Dict[str, float] = {}
+        # Held while flushing too, so batches of a key reach the callback in order
+        self._lock = threading.Lock()
+
+    def add(self, key: str, token: str):
+        with self._lock:
+            buffer = self._buffers.setdefault(key, [])
+            if not buffer:
+                self._started[key] = time.monotonic()
+            buffer.append(token)
+            if len(buffer) >= self.max_tokens or time.monotonic() - self._started[key] >= self.interval:
+                self._flush_locked(key)
+
+    def flush_stale(self):
+        """Flush batches that have waited for at least the interval"""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, buffer in self._buffers.items() if buffer]:
+                if now - self._started[key] >= self.interval:
+                    self._flush_locked(key)
+
+    def flush(self, key: Optional[str] = None):
+        """Flush one key, or every key"""
+        with self._lock:
+            for flush_key in [key] if key is not None else list(self._buffers):
+                self._flush_locked(flush_key)
+
+    def _flush_locked(self, key: str):
+        buffer = self._buffers.get(key)
+        if buffer:
+            self._buffers[key] = []
+            self.flush_callback(key, "".join(buffer))
@@ -0,0 +1,190 @@
+"""
+Local trace sink, and the waterfall view served by /api/runs/{run_id}/trace
+
+Finished traces are appended to a file, so no collector is needed:
+"jsonl" writes one span per line, "otlp" one OTLP/JSON ResourceSpans object
+per trace, the format of the OpenTelemetry Collector's file exporter, which
+other OpenTelemetry tools can import.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+
+log = logging.getLogger(__name__)
+
+TRACE_FORMATS = ("jsonl", "otlp")
+SERVICE_NAME = "crewai-demo"
+
+# OTLP status codes
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+
+class TraceExporter:
+    """Appends finished traces to a local file"""
+
+    def __init__(self, path: str, trace_format: str = "jsonl"):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"TRACE_EXPORT must be one of {', '.join(TRACE_FORMATS)} or off")
+        self.path = path
+        self.format = trace_format
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, runs_dir: str) -> Optional["TraceExporter"]:
+        """Exporter configured by TRACE_EXPORT and TRACE_EXPORT_PATH; None when tracing export is off"""
+        trace_format = os.getenv("TRACE_EXPORT", "jsonl").lower()
+        if trace_format in ("off", "0", "false", "no", ""):
+            return None
+        default_name = "traces.otlp.jsonl" if trace_format == "otlp" else "traces.jsonl"
+        return cls(os.getenv("TRACE_EXPORT_PATH") or os.path.join(runs_dir, default_name), trace_format)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        """Append the spans of one trace; blocks, so call it off the event loop"""
+        if not spans:
+            return
+        if self.format == "otlp":
+            lines = [json.dumps(_to_otlp(spans))]
+        else:
+            lines = [json.dumps(span, default=str) for span in spans]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def load(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans of an exported trace, by scanning the file; blocks"""
+        spans: List[Dict[str, Any]] = []
+        try:
+            f = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return spans
+        with f:
+            for line in f:
+                # Cheap filter before parsing; the run ID appears verbatim in each matching line
+                if trace_id not in line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    log.warning("Skipping unreadable trace line", extra={"path": self.path})
+                    continue
+                if self.format == "otlp":
+                    spans.extend(span for span in _from_otlp(entry) if span["trace_id"] == trace_id)
+                elif entry.get("trace_id") == trace_id:
+                    spans.append(entry)
+        return spans
+
+
+def _otlp_trace_id(trace_id: str) -> str:
+    # OTLP trace IDs are 16 bytes; run IDs are shorter
+    return hashlib.md5(trace_id.encode("utf-8")).hexdigest()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("boolValue", "doubleValue", "stringValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def _to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    trace_id = spans[0]["trace_id"]
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+            {"key": "crew.run_id", "value": {"stringValue": trace_id}},
+        ]},
+        "scopeSpans": [{
+            "scope": {"name": "crewai_demo.tracing"},
+            "spans": [{
+                "traceId": _otlp_trace_id(trace_id),
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent_id"] or "",
+                "name": span["name"],
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(int(span["start"] * 1e9)),
+                "endTimeUnixNano": str(int((span["end"] or span["start"]) * 1e9)),
+                "attributes": [{"key": "crew.span_kind", "value": {"stringValue": span["kind"]}}] + [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in span["attributes"].items() if value is not None
+                ],
+                "status": {"code": _STATUS_OK} if span["status"] == "ok"
+                          else {"code": _STATUS_ERROR, "message": span["status"]},
+            } for span in spans],
+        }],
+    }]}
+
+
+def _from_otlp(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    spans = []
+    for resource_spans in entry.get("resourceSpans", []):
+        resource = {item["key"]: _from_otlp_value(item["value"])
+                    for item in resource_spans.get("resource", {}).get("attributes", [])}
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                attributes = {item["key"]: _from_otlp_value(item["value"]) for item in span.get("attributes", [])}
+                status = span.get("status", {})
+                spans.append({
+                    "name": span["name"],
+                    "kind": attributes.pop("crew.span_kind", "internal"),
+                    "trace_id": resource.get("crew.run_id"),
+                    "parent_id": span.get("parentSpanId") or None,
+                    "span_id": span["spanId"],
+                    "start": int(span["startTimeUnixNano"]) / 1e9,
+                    "end": int(span["endTimeUnixNano"]) / 1e9,
+                    "status": "ok" if status.get("code") != _STATUS_ERROR else status.get("message", "error"),
+                    "attributes": attributes,
+                })
+    return spans
+
+
+def waterfall(trace_id: str, spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Spans in tree order, each with its depth and its start offset from the start of the trace"""
+    if not spans:
+        return {"run_id": trace_id, "duration": 0.0, "spans": []}
+    trace_start = min(span["start"] for span in spans)
+    trace_end = max(span["end"] or span["start"] for span in spans)
+    span_ids = {span["span_id"] for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for span in spans:
+        # Spans whose parent was never exported (a killed worker, say) are shown at the top
+        parent = span["parent_id"] if span["parent_id"] in span_ids else None
+        children.setdefault(parent, []).append(span)
+
+    rows: List[Dict[str, Any]] = []
+
+    def visit(parent: Optional[str], depth: int):
+        for span in sorted(children.get(parent, []), key=lambda s: s["start"]):
+            end = span["end"] or span["start"]
+            rows.append({
+                "span_id": span["span_id"],
+                "parent_id": span["parent_id"],
+                "name": span["name"],
+                "kind": span["kind"],
+                "depth": depth,
+                "offset": round(span["start"] - trace_start, 4),
+                "duration": round(end - span["start"], 4),
+                "status": span["status"],
+                "attributes": span["attributes"],
+            })
+            visit(span["span_id"], depth + 1)
+
+    visit(None, 0)
+    return {"run_id": trace_id, "duration": round(trace_end - trace_start, 4), "spans": rows}
@@ -4,79 +4,305 @@ WebSocket handler for real-time communication with frontend
 
 import asyncio
 import json
-from typing import Dict, Set, Optional
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Callable, Deque, Set, Tuple
 from fastapi import WebSocket, WebSocketDisconnect
-from .models import WebSocketMessage
+from . import metrics
+from .models import WebSocketMessage, MessageType
+from .wire_format import EncodedMessage, negotiate
+
+
+log = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("coalesce", "drop_thinking", "disconnect")
+
+# Subscribers of this topic get the events of every run
+ALL_RUNS_TOPIC = "runs"
+MAX_SUBSCRIPTIONS = 64
+
+
+def run_topic(run_id: str) -> str:
+    """Topic carrying the events of one run"""
+    return f"run:{run_id}"
+
+
+@dataclass
+class OutboundMessage:
+    """A message waiting in a connection's send queue, shared by all recipients"""
+    payload: EncodedMessage
+    # Can be dropped when the client falls behind
+    droppable: bool = False
+    # A newer message with the same key replaces this one when the client falls behind
+    coalesce_key: Optional[Tuple] = None
+    # For the send latency metric
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class ClientConnection:
+    """A WebSocket with its own bounded send queue and writer task"""
+    
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str, send_timeout: float,
+                 on_close: Callable[["ClientConnection"], None], protocol: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:8]
+        self.websocket = websocket
+        self.protocol = protocol
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        self.queue: Deque[OutboundMessage] = deque()
+        self.topics: Set[str] = set()
+        self.closed = False
+        self.too_slow = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+        
+    def enqueue(self, message: OutboundMessage) -> bool:
+        """Queue a message without waiting; applies the slow-consumer policy when the queue is full"""
+        if self.closed:
+            return False
+        
+        if len(self.queue) >= self.max_queue and not self._make_room(message):
+            return False
+        
+        self.queue.append(message)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+        return True
+        
+    def _make_room(self, message: OutboundMessage) -> bool:
+        """Handle a full queue. Returns whether the message should still be appended."""
+        if self.policy == "coalesce" and message.coalesce_key is not None:
+            for i, queued in enumerate(self.queue):
+                if queued.coalesce_key == message.coalesce_key:
+                    # Replace the stale message in place; the client only needs the latest one
+                    self.queue[i] = message
+                    self.coalesced += 1
+                    metrics.WS_DROPPED.inc(reason="coalesced")
+                    return False
+        
+        if self.policy in ("coalesce", "drop_thinking"):
+            if message.droppable:
+                self.dropped += 1
+                metrics.WS_DROPPED.inc(reason="dropped")
+                return False
+            for queued in self.queue:
+                if queued.droppable:
+                    self.queue.remove(queued)
+                    self.dropped += 1
+                    metrics.WS_DROPPED.inc(reason="dropped")
+                    return True
+        
+        # Nothing left to shed: the client is too slow to keep
+        log.warning("WebSocket client too slow, disconnecting", extra={"connection_id": self.id, "queued": len(self.queue)})
+        self.too_slow = True
+        self.close(code=1013, reason="Client too slow")
+        return False
+        
+    async def _write_loop(self):
+        """Send queued messages in order"""
+        try:
+            while True:
+                while not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                message = self.queue.popleft()
+                data = message.payload.encode(self.protocol)
+                send = self.websocket.send_bytes(data) if isinstance(data, bytes) else self.websocket.send_text(data)
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+                self.sent += 1
+                metrics.WS_SEND_LATENCY.observe(time.perf_counter() - message.queued_at)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            log.warning("WebSocket send timed out, disconnecting", extra={"connection_id": self.id})
+            self.too_slow = True
+            self.close(code=1013, reason="Send timed out")
+        except Exception as e:
+            log.info("Error sending to WebSocket: %s", e, extra={"connection_id": self.id})
+            self.close()
+            
+    def close(self, code: int = 1000, reason: str = ""):
+        """Stop the writer and close the socket"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        asyncio.create_task(self._close_socket(code, reason))
+        self.on_close(self)
+        
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            # Already closed by the client
+            pass
+        
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "protocol": self.protocol or "json",
+            "topics": sorted(self.topics),
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
 
 
 class ConnectionManager:
-    """Manages WebSocket connections"""
+    """Manages WebSocket connections; broadcasts only enqueue, so slow clients don't block anyone"""
     
-    def __init__(self):
+    def __init__(self, max_queue: Optional[int] = None, policy: Optional[str] = None,
+                 send_timeout: Optional[float] = None):
+        self.max_queue = max_queue or int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+        self.policy = policy or os.getenv("WS_SLOW_CONSUMER_POLICY", "coalesce")
+        if self.policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"WS_SLOW_CONSUMER_POLICY must be one of {', '.join(SLOW_CONSUMER_POLICIES)}")
+        self.send_timeout = send_timeout or float(os.getenv("WS_SEND_TIMEOUT", "10"))
         # Store active connections
-        self.active_connections: Set[WebSocket] = set()
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.connections_by_id: Dict[str, ClientConnection] = {}
+        # Topic -> subscribed connections, so events only reach interested clients
+        self.topics: Dict[str, Set[ClientConnection]] = {}
+        # Totals of connections that have gone away
+        self.closed_stats = {"dropped": 0, "coalesced": 0, "slow_disconnects": 0}
+        metrics.WS_CONNECTIONS.set_function(lambda: len(self.connections))
+        metrics.WS_QUEUE_DEPTH.set_function(
+            lambda: [((c.id,), len(c.queue)) for c in self.connections.values()]
+        )
+        
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        """Accept a WebSocket connection, agreeing on a wire format"""
+        protocol = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=protocol)
+        connection = ClientConnection(websocket, self.max_queue, self.policy, self.send_timeout,
+                                      on_close=self._forget, protocol=protocol)
+        self.connections[websocket] = connection
+        self.connections_by_id[connection.id] = connection
+        log.info("WebSocket connected", extra={"connection_id": connection.id, "connections": len(self.connections)})
         
-    async def connect(self, websocket: WebSocket):
-        """Accept a WebSocket connection"""
-        await websocket.accept()
-        self.active_connections.add(websocket)
-        print(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        # Tell the client its ID so it can be subscribed to a run when starting it
+        connection.enqueue(OutboundMessage(EncodedMessage({"type": "welcome", "connection_id": connection.id})))
+        return connection
         
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        self.active_connections.discard(websocket)
-        print(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
-        
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        """Send a message to a specific WebSocket connection"""
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            print(f"Error sending personal message: {e}")
-            self.disconnect(websocket)
+        connection = self.connections.get(websocket)
+        if connection:
+            connection.close()
             
-    async def broadcast(self, message: str):
-        """Broadcast a message to all connected WebSocket clients"""
-        if not self.active_connections:
-            print(f"⚠️  No active WebSocket connections to send message to")
+    def _forget(self, connection: ClientConnection):
+        if self.connections.pop(connection.websocket, None) is None:
             return
+        self.connections_by_id.pop(connection.id, None)
+        for topic in list(connection.topics):
+            self.unsubscribe(connection, topic)
+        self.closed_stats["dropped"] += connection.dropped
+        self.closed_stats["coalesced"] += connection.coalesced
+        self.closed_stats["slow_disconnects"] += int(connection.too_slow)
+        if connection.too_slow:
+            metrics.WS_SLOW_DISCONNECTS.inc()
+        log.info("WebSocket disconnected", extra={"connection_id": connection.id, "connections": len(self.connections)})
         
-        print(f"📡 Broadcasting to {len(self.active_connections)} connection(s)...")
+    def subscribe(self, connection: ClientConnection, topic: str) -> bool:
+        """Route a topic's messages to a connection"""
+        if connection.closed:
+            return False
+        if topic not in connection.topics and len(connection.topics) >= MAX_SUBSCRIPTIONS:
+            return False
+        connection.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(connection)
+        return True
+    
+    def unsubscribe(self, connection: ClientConnection, topic: str):
+        connection.topics.discard(topic)
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.topics[topic]
+    
+    def subscribers(self, *topics: str) -> Set[ClientConnection]:
+        """Connections subscribed to any of the topics"""
+        result: Set[ClientConnection] = set()
+        for topic in topics:
+            result |= self.topics.get(topic, set())
+        return result
         
-        # Create a list of connections to remove (disconnected ones)
-        disconnected = set()
-        sent_count = 0
+    async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
+        """Send a message to a specific WebSocket connection"""
+        connection = self.connections.get(websocket)
+        if connection:
+            connection.enqueue(OutboundMessage(EncodedMessage(message)))
+            
+    async def broadcast(self, message: EncodedMessage, droppable: bool = False,
+                        coalesce_key: Optional[Tuple] = None, topic: Optional[str] = None):
+        """Queue a message for the subscribers of a topic, or for every client when there is no topic"""
+        if topic is None:
+            recipients = list(self.connections.values())
+        else:
+            recipients = list(self.subscribers(topic, ALL_RUNS_TOPIC))
         
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-                sent_count += 1
-            except Exception as e:
-                print(f"❌ Error broadcasting to connection: {e}")
-                disconnected.add(connection)
+        if not recipients:
+            return
         
-        print(f"✅ Successfully sent message to {sent_count} connection(s)")
-                
-        # Remove disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection)
+        outbound = OutboundMessage(message, droppable=droppable, coalesce_key=coalesce_key)
+        for connection in recipients:
+            connection.enqueue(outbound)
             
     async def send_websocket_message(self, message: WebSocketMessage):
         """Send a structured WebSocket message"""
+        started = time.perf_counter()
         try:
-            # Use model_dump with mode='json' for proper serialization
-            import json as json_lib
-            message_dict = message.model_dump(mode='json')
-            message_json = json_lib.dumps(message_dict)
-            await self.broadcast(message_json)
-        except Exception as e:
-            print(f"Error in send_websocket_message: {e}")
-            import traceback
-            traceback.print_exc()
+            # Serialized at most once per wire format, however many clients are connected
+            encoded = EncodedMessage(message)
+            
+            # Thinking updates are the only messages a slow client can do without;
+            # streamed deltas can be dropped but not replaced, since each carries new text
+            thinking = message.type == MessageType.AGENT_THINKING
+            coalesce = thinking and not message.data.get("stream")
+            await self.broadcast(
+                encoded,
+                droppable=thinking,
+                coalesce_key=("thinking", message.run_id, message.task) if coalesce else None,
+                topic=run_topic(message.run_id) if message.run_id else None
+            )
+            metrics.WS_BROADCAST_DURATION.observe(time.perf_counter() - started)
+        except Exception:
+            log.exception("Error in send_websocket_message", extra={"seq": message.seq})
         
     def get_connection_count(self) -> int:
         """Get the number of active connections"""
-        return len(self.active_connections)
+        return len(self.connections)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depths and drop counters across connections"""
+        connections = [connection.get_stats() for connection in self.connections.values()]
+        return {
+            "connections": len(connections),
+            "topics": len(self.topics),
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "queued": sum(c["queue_depth"] for c in connections),
+            "max_queue_depth": max((c["max_queue_depth"] for c in connections), default=0),
+            "dropped": self.closed_stats["dropped"] + sum(c["dropped"] for c in connections),
+            "coalesced": self.closed_stats["coalesced"] + sum(c["coalesced"] for c in connections),
+            "slow_disconnects": self.closed_stats["slow_disconnects"],
+            "per_connection": connections,
+        }
 
 
 class WebSocketHandler:
@@ -85,11 +311,16 @@ class WebSocketHandler:
     def __init__(self):
         self.manager = ConnectionManager()
         self.logger_callback = None
+        self.run_lookup = None
         
     def set_logger_callback(self, callback):
         """Set the callback for logger messages"""
         self.logger_callback = callback
         
+    def set_run_lookup(self, lookup: Callable[[str], Any]):
+        """Set the function that finds a run by ID, for replaying missed messages"""
+        self.run_lookup = lookup
+        
     async def handle_websocket(self, websocket: WebSocket):
         """Handle WebSocket connection"""
         await self.manager.connect(websocket)
@@ -108,7 +339,7 @@ class WebSocketHandler:
         except WebSocketDisconnect:
             self.manager.disconnect(websocket)
         except Exception as e:
-            print(f"WebSocket error: {e}")
+            log.info("WebSocket error: %s", e)
             self.manager.disconnect(websocket)
             
     async def _handle_client_message(self, message_data: Dict, websocket: WebSocket):
@@ -118,23 +349,80 @@ class WebSocketHandler:
         if message_type == "ping":
             # Respond to ping with pong
             await self.manager.send_personal_message(
-                json.dumps({"type": "pong", "timestamp": message_data.get("timestamp")}),
+                {"type": "pong", "timestamp": message_data.get("timestamp")},
                 websocket
             )
         elif message_type == "get_status":
             # Send current status
+            connection = self.manager.connections.get(websocket)
             status = {
                 "type": "status",
                 "connections": self.manager.get_connection_count(),
+                "queue": connection.get_stats() if connection else None,
                 "timestamp": message_data.get("timestamp")
             }
-            await self.manager.send_personal_message(
-                json.dumps(status),
-                websocket
-            )
+            await self.manager.send_personal_message(status, websocket)
+        elif message_type in ("subscribe", "unsubscribe"):
+            await self._handle_subscription(message_type, message_data, websocket)
         else:
             await self.send_error(websocket, f"Unknown message type: {message_type}")
             
+    async def _handle_subscription(self, message_type: str, message_data: Dict, websocket: WebSocket):
+        """Subscribe to or unsubscribe from a run ({"run_id": ...}) or a topic ({"topic": ...})"""
+        connection = self.manager.connections.get(websocket)
+        run_id = message_data.get("run_id")
+        topic = run_topic(run_id) if run_id else message_data.get("topic")
+        if not connection or not isinstance(topic, str) or not topic:
+            await self.send_error(websocket, f"{message_type} needs a run_id or topic")
+            return
+        
+        if message_type == "subscribe":
+            last_seq = message_data.get("last_seq")
+            if run_id and isinstance(last_seq, int) and topic not in connection.topics:
+                # Queue what the client missed before any new message can reach it
+                self._resume(connection, run_id, last_seq)
+            if not self.manager.subscribe(connection, topic):
+                await self.send_error(websocket, f"Too many subscriptions (max {MAX_SUBSCRIPTIONS})")
+                return
+        else:
+            self.manager.unsubscribe(connection, topic)
+        
+        await self.manager.send_personal_message(
+            {"type": f"{message_type}d", "topic": topic, "run_id": run_id},
+            websocket
+        )
+        
+    def _resume(self, connection: ClientConnection, run_id: str, last_seq: int):
+        """Send the messages of a run after last_seq, or a snapshot when they are no longer buffered"""
+        run = self.run_lookup(run_id) if self.run_lookup else None
+        if not run:
+            return
+        
+        missed = run.logger.messages_since(last_seq)
+        if missed is None:
+            snapshot = run.snapshot()
+            connection.enqueue(OutboundMessage(EncodedMessage({
+                "type": "snapshot",
+                "run_id": run_id,
+                "seq": snapshot["seq"],
+                "data": snapshot
+            })))
+            return
+        for message in missed:
+            connection.enqueue(OutboundMessage(EncodedMessage(message)))
+        
+    def subscribe_connection(self, connection_id: str, run_id: str, last_seq: Optional[int] = None) -> bool:
+        """Subscribe a connection, by the ID from its welcome message, to a run.
+        
+        With last_seq, the messages after it are replayed first.
+        """
+        connection = self.manager.connections_by_id.get(connection_id)
+        if not connection:
+            return False
+        if last_seq is not None and run_topic(run_id) not in connection.topics:
+            self._resume(connection, run_id, last_seq)
+        return self.manager.subscribe(connection, run_topic(run_id))
+            
     async def send_error(self, websocket: WebSocket, error_message: str):
         """Send error message to specific WebSocket"""
         error_data = {
@@ -142,10 +430,7 @@ class WebSocketHandler:
             "message": error_message,
             "timestamp": str(asyncio.get_event_loop().time())
         }
-        await self.manager.send_personal_message(
-            json.dumps(error_data),
-            websocket
-        )
+        await self.manager.send_personal_message(error_data, websocket)
         
     async def send_message_to_all(self, message: WebSocketMessage):
         """Send message to all connected clients"""
@@ -154,5 +439,9 @@ class WebSocketHandler:
     def get_connection_count(self) -> int:
         """Get number of active connections"""
         return self.manager.get_connection_count()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get send queue statistics"""
+        return self.manager.get_stats()
 
 
@@ -0,0 +1,96 @@
+"""
+Wire formats for WebSocket messages.
+
+A message is serialized once and the encoded payload is shared by every
+connection that negotiated the same format. Clients pick a format with the
+WebSocket subprotocol header:
+
+- no subprotocol: JSON text frames
+- ``crew.v1.deflate``: JSON text frames, with large messages sent as
+  zlib-deflated binary frames (browsers decode them with DecompressionStream)
+"""
+
+import json
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON = "json"
+DEFLATE = "crew.v1.deflate"
+
+# Messages smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(os.getenv("WS_COMPRESS_MIN_BYTES", "1024"))
+
+
+def supported_subprotocols() -> List[str]:
+    """Subprotocols this server can speak, best first"""
+    return [DEFLATE]
+
+
+def negotiate(requested: List[str]) -> Optional[str]:
+    """Pick the client's most preferred subprotocol that the server supports"""
+    supported = supported_subprotocols()
+    for protocol in requested:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def dumps(data: Any) -> str:
+    """Fast JSON encoding, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(data, separators=(",", ":"), default=str)
+
+
+class EncodedMessage:
+    """A message serialized lazily, at most once per wire format"""
+
+    __slots__ = ("_message", "_data", "_encoded")
+
+    def __init__(self, message: Union[BaseModel, Dict[str, Any]]):
+        self._message = message
+        self._data: Optional[Dict[str, Any]] = None
+        self._encoded: Dict[Optional[str], Union[str, bytes]] = {}
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """The message as JSON-compatible data"""
+        if self._data is None:
+            if isinstance(self._message, BaseModel):
+                self._data = self._message.model_dump(mode="json")
+            else:
+                self._data = self._message
+        return self._data
+
+    def json(self) -> str:
+        if JSON not in self._encoded:
+            if isinstance(self._message, BaseModel):
+                # pydantic-core serializes straight to JSON without building a dict first
+                self._encoded[JSON] = self._message.model_dump_json()
+            else:
+                self._encoded[JSON] = dumps(self._message)
+        return self._encoded[JSON]
+
+    def encode(self, protocol: Optional[str]) -> Union[str, bytes]:
+        """Payload for a connection using the given subprotocol (str: text frame, bytes: binary frame)"""
+        if protocol in self._encoded:
+            return self._encoded[protocol]
+
+        if protocol == DEFLATE:
+            text = self.json()
+            raw = text.encode("utf-8")
+            payload: Union[str, bytes] = zlib.compress(raw, 6) if len(raw) >= COMPRESS_MIN_BYTES else text
+        else:
+            payload = self.json()
+
+        self._encoded[protocol] = payload
+        return payload
@@ -6,6 +6,10 @@ class FeatureDevelopmentApp {
     constructor() {
         this.isRunning = false;
         this.currentExecution = null;
+        this.currentRunId = null;
+        this.outputCache = new Map();
+        // Updates are handled one at a time, in arrival order (see enqueueUpdate)
+        this.updateQueue = Promise.resolve();
         
         this.initializeElements();
         this.initializeEventListeners();
@@ -63,7 +67,11 @@ class FeatureDevelopmentApp {
         });
         
         window.wsClient.on('crew_update', (data) => {
-            this.handleCrewUpdate(data);
+            this.enqueueUpdate(() => this.handleCrewUpdate(data));
+        });
+        
+        window.wsClient.on('snapshot', (data) => {
+            this.enqueueUpdate(() => this.applySnapshot(data));
         });
         
         // Connect WebSocket
@@ -95,6 +103,10 @@ class FeatureDevelopmentApp {
         
         try {
             this.isRunning = true;
+            if (this.currentRunId) {
+                window.wsClient.unsubscribe(this.currentRunId);
+            }
+            this.currentRunId = null;
             this.updateUI();
             this.logActivity('🚀 Starting crew execution...', 'info');
             
@@ -110,7 +122,9 @@ class FeatureDevelopmentApp {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
-                    feature_request: featureRequest
+                    feature_request: featureRequest,
+                    // Lets the server subscribe us before the run emits its first event
+                    subscriber_id: window.wsClient.connectionId
                 })
             });
             
@@ -120,7 +134,11 @@ class FeatureDevelopmentApp {
             }
             
             const result = await response.json();
-            this.logActivity(`Crew execution started: ${result.message}`, 'success');
+            this.currentRunId = result.run_id;
+            // Idempotent; also covers starting before the socket was connected
+            window.wsClient.subscribe(result.run_id);
+            // A run we attached to replays its earlier messages to us
+            this.logActivity(`${result.message} (run ${result.run_id})`, 'success');
             
         } catch (error) {
             console.error('Error starting crew:', error);
@@ -138,7 +156,8 @@ class FeatureDevelopmentApp {
         }
         
         try {
-            const response = await fetch('/api/stop-crew', {
+            const query = this.currentRunId ? `?run_id=${encodeURIComponent(this.currentRunId)}` : '';
+            const response = await fetch(`/api/stop-crew${query}`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -181,7 +200,39 @@ class FeatureDevelopmentApp {
         this.showNotification('All data cleared', 'success');
     }
     
-    handleCrewUpdate(data) {
+    enqueueUpdate(handle) {
+        // An output fetched by reference must not let later updates overtake it
+        this.updateQueue = this.updateQueue
+            .then(handle)
+            .catch(error => console.error('Error handling update:', error));
+        return this.updateQueue;
+    }
+    
+    async applySnapshot(snapshot) {
+        // Sent instead of a replay when we missed more messages than the server keeps
+        if (this.currentRunId && snapshot.run_id !== this.currentRunId) {
+            return;
+        }
+        
+        const state = snapshot.data;
+        window.outputDisplay.clearAll();
+        window.taskProgress.reset();
+        this.logActivity('🔄 Resynchronized with the run after missing updates', 'info');
+        
+        for (const [task, agents] of Object.entries(state.outputs || {})) {
+            for (const [agent, output] of Object.entries(agents)) {
+                await this.handleAgentOutput({ agent, task, data: output });
+            }
+        }
+        for (const completed of state.completed_tasks || []) {
+            window.taskProgress.onTaskComplete(completed.task, completed.agent, state.progress);
+        }
+        if (state.crew_complete) {
+            this.handleCrewComplete(state.crew_complete);
+        }
+    }
+    
+    async handleCrewUpdate(data) {
         console.log('🎯 Crew update received:', data.type, data);
         
         if (!data || !data.type) {
@@ -189,6 +240,11 @@ class FeatureDevelopmentApp {
             return;
         }
         
+        // Ignore events from other users' runs
+        if (data.run_id && this.currentRunId && data.run_id !== this.currentRunId) {
+            return;
+        }
+        
         switch (data.type) {
             case 'agent_start':
                 this.handleAgentStart(data);
@@ -197,7 +253,7 @@ class FeatureDevelopmentApp {
                 this.handleAgentThinking(data);
                 break;
             case 'agent_output':
-                this.handleAgentOutput(data);
+                await this.handleAgentOutput(data);
                 break;
             case 'task_complete':
                 this.handleTaskComplete(data);
@@ -221,34 +277,69 @@ class FeatureDevelopmentApp {
     }
     
     handleAgentThinking(data) {
+        // Streamed tokens go straight to the output panel, not the activity log
+        if (data.data.stream) {
+            window.outputDisplay.appendStream(data.agent, data.task, data.data.delta);
+            return;
+        }
+        
         const message = `💭 ${data.agent} is thinking: ${data.data.thought}`;
         this.logActivity(message, 'info');
         
         window.taskProgress.onAgentThinking(data.agent, data.data.thought);
     }
     
-    handleAgentOutput(data) {
+    async handleAgentOutput(data) {
         const message = `✅ ${data.agent} completed ${data.task}`;
         this.logActivity(message, 'success');
         
+        // Large outputs arrive as a reference to fetch
+        let output = data.data.output;
+        if (output === undefined && data.data.output_ref) {
+            try {
+                output = await this.fetchOutput(data.data.output_ref);
+            } catch (error) {
+                console.error('Error fetching output:', error);
+                this.logActivity(`Error loading output of ${data.task}: ${error.message}`, 'error');
+                return;
+            }
+        }
+        
         // Update output display
         window.outputDisplay.updateOutput(
             data.agent,
             data.task,
-            data.data.output,
+            output,
             data.data.output_type
         );
         
         window.taskProgress.onAgentOutput(
             data.agent,
             data.task,
-            data.data.output,
+            output,
             data.data.output_type
         );
     }
     
+    async fetchOutput(ref) {
+        // Outputs are immutable, so the hash identifies the text
+        if (this.outputCache.has(ref.sha256)) {
+            return this.outputCache.get(ref.sha256);
+        }
+        
+        const response = await fetch(ref.url);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const text = await response.text();
+        this.outputCache.set(ref.sha256, text);
+        return text;
+    }
+    
     handleTaskComplete(data) {
-        const message = `🎯 Task ${data.task} completed by ${data.agent}`;
+        const usage = data.data && data.data.usage;
+        const tokens = usage ? ` (${usage.total_tokens} tokens, ${usage.llm_calls} LLM calls)` : '';
+        const message = `🎯 Task ${data.task} completed by ${data.agent}${tokens}`;
         this.logActivity(message, 'success');
         
         window.taskProgress.onTaskComplete(
@@ -267,8 +358,24 @@ class FeatureDevelopmentApp {
             this.logActivity(message, 'success');
             this.showNotification('Crew execution completed successfully!', 'success');
             
+            const cache = data.data.cache;
+            if (cache && (cache.hits || cache.misses)) {
+                this.logActivity(`🗄️ LLM cache: ${cache.hits} hits, ${cache.misses} misses`, 'info');
+            }
+            
+            const usage = data.data.usage;
+            if (usage && usage.total_tokens) {
+                const cost = usage.cost !== undefined ? `, $${usage.cost.toFixed(4)}` : '';
+                this.logActivity(`🔢 Tokens: ${usage.prompt_tokens} prompt, ${usage.completion_tokens} completion${cost}`, 'info');
+            }
+            
+            const schedule = data.data.schedule;
+            if (schedule) {
+                this.logActivity(`🧭 Critical path ${schedule.critical_path_time.toFixed(2)}s of ${schedule.total_task_time.toFixed(2)}s task time: ${schedule.critical_path.join(' → ')}`, 'info');
+            }
+            
             // Show the final HTML output if available
-            if (data.data.final_result) {
+            if (data.data.final_result || data.data.final_result_ref) {
                 this.logActivity('📄 Final HTML output generated and ready for preview!', 'success');
                 // Switch to HTML output tab
                 const htmlTab = document.querySelector('[data-tab="html-output"]');
@@ -276,6 +383,11 @@ class FeatureDevelopmentApp {
                     htmlTab.click();
                 }
             }
+        } else if (data.data.budget_exceeded) {
+            this.logActivity(`💸 Crew execution stopped after ${data.data.execution_time.toFixed(2)}s: ${data.data.budget_exceeded}`, 'warning');
+            this.showNotification(data.data.budget_exceeded, 'warning');
+        } else if (data.data.stopped) {
+            this.logActivity(`⏹️ Crew execution stopped after ${data.data.execution_time.toFixed(2)}s`, 'warning');
         } else {
             const message = `❌ Crew execution failed: ${data.data.error_message}`;
             this.logActivity(message, 'error');
@@ -10,6 +10,8 @@ class OutputDisplay {
             'backend_api': null,
             'html': null
         };
+        // Text streamed so far for outputs that are still being written
+        this.streams = {};
         
         this.initializeTabs();
         this.initializeOutputPanels();
@@ -61,7 +63,7 @@ class OutputDisplay {
         }
     }
     
-    updateOutput(agentName, taskName, output, outputType) {
+    mapTaskToOutputType(taskName, outputType) {
         // Map task names to output types
         const taskMapping = {
             'product_design_task': 'product_spec',
@@ -70,7 +72,44 @@ class OutputDisplay {
             'frontend_development_task': 'html'
         };
         
-        const mappedType = taskMapping[taskName] || outputType;
+        return taskMapping[taskName] || outputType;
+    }
+    
+    appendStream(agentName, taskName, delta) {
+        const mappedType = this.mapTaskToOutputType(taskName);
+        if (!this.outputs.hasOwnProperty(mappedType) || this.outputs[mappedType]) return;
+        
+        const panel = document.getElementById(mappedType.replace('_', '-'));
+        if (!panel) return;
+        
+        let stream = this.streams[mappedType];
+        if (!stream || !panel.contains(stream.element)) {
+            panel.innerHTML = '';
+            
+            const header = document.createElement('div');
+            header.className = 'output-header';
+            header.innerHTML = `
+                <div class="output-meta">
+                    <span class="agent-name">${agentName}</span>
+                    <span class="output-type">WRITING...</span>
+                </div>
+            `;
+            
+            const element = document.createElement('pre');
+            element.className = 'output-content';
+            panel.appendChild(header);
+            panel.appendChild(element);
+            
+            stream = this.streams[mappedType] = { element };
+        }
+        
+        // Append as a text node so streamed markup is never parsed
+        stream.element.appendChild(document.createTextNode(delta));
+    }
+    
+    updateOutput(agentName, taskName, output, outputType) {
+        const mappedType = this.mapTaskToOutputType(taskName, outputType);
+        delete this.streams[mappedType];
         
         if (this.outputs.hasOwnProperty(mappedType)) {
             this.outputs[mappedType] = {
@@ -326,6 +365,7 @@ class OutputDisplay {
             'backend_api': null,
             'html': null
         };
+        this.streams = {};
         
         // Reset all panels to placeholder state
         document.querySelectorAll('.output-panel').forEach(panel => {
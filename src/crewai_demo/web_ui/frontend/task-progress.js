@@ -69,14 +69,7 @@ class TaskProgress {
     }
     
     setAgentActive(agentName, taskName) {
-        // Reset all tasks to pending first
-        Object.values(this.tasks).forEach(task => {
-            if (task.status === 'active') {
-                task.status = 'pending';
-                this.updateTaskUI(task);
-            }
-        });
-        
+        // Independent tasks run in parallel, so other active tasks stay active
         // Set current task as active
         const task = this.tasks[taskName];
         if (task) {
@@ -11,6 +11,13 @@ class WebSocketClient {
         this.heartbeatInterval = null;
         this.isConnecting = false;
         this.messageHandlers = new Map();
+        // Server-assigned ID of this connection and the runs we want events for
+        this.connectionId = null;
+        this.subscriptions = new Set();
+        // Last sequence number seen per run, to resume after a reconnect
+        this.lastSeq = new Map();
+        // Binary frames decode asynchronously; chaining keeps messages in order
+        this.decodeQueue = Promise.resolve();
         
         // Bind methods
         this.connect = this.connect.bind(this);
@@ -31,10 +38,11 @@ class WebSocketClient {
                 const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
                 const wsUrl = `${protocol}//${window.location.host}/ws`;
                 
-                this.ws = new WebSocket(wsUrl);
+                this.ws = new WebSocket(wsUrl, this.preferredProtocols());
+                this.ws.binaryType = 'arraybuffer';
                 
                 this.ws.onopen = () => {
-                    console.log('WebSocket connected');
+                    console.log('WebSocket connected', this.ws.protocol ? `(${this.ws.protocol})` : '');
                     this.isConnecting = false;
                     this.reconnectAttempts = 0;
                     this.updateConnectionStatus(true);
@@ -50,12 +58,13 @@ class WebSocketClient {
                 this.ws.onclose = (event) => {
                     console.log('WebSocket disconnected:', event.code, event.reason);
                     this.isConnecting = false;
+                    this.connectionId = null;
                     this.updateConnectionStatus(false);
                     this.stopHeartbeat();
                     this.emit('disconnected', event);
                     
-                    // Attempt to reconnect if not a clean close
-                    if (!event.wasClean && this.reconnectAttempts < this.maxReconnectAttempts) {
+                    // Attempt to reconnect if not a clean close, or if the server asked us to try again later
+                    if ((!event.wasClean || event.code === 1013) && this.reconnectAttempts < this.maxReconnectAttempts) {
                         this.scheduleReconnect();
                     }
                 };
@@ -94,36 +103,94 @@ class WebSocketClient {
         }
     }
     
+    subscribe(runId) {
+        this.subscriptions.add(runId);
+        this.sendSubscribe(runId);
+    }
+    
+    sendSubscribe(runId) {
+        // The server replays messages after last_seq (or sends a snapshot) if we are not yet subscribed
+        this.send({ type: 'subscribe', run_id: runId, last_seq: this.lastSeq.get(runId) || 0 });
+    }
+    
+    unsubscribe(runId) {
+        this.subscriptions.delete(runId);
+        this.lastSeq.delete(runId);
+        this.send({ type: 'unsubscribe', run_id: runId });
+    }
+    
+    preferredProtocols() {
+        // Wire formats we can decode, best first; plain JSON needs no subprotocol
+        const protocols = [];
+        if (typeof DecompressionStream !== 'undefined') {
+            protocols.push('crew.v1.deflate');
+        }
+        return protocols;
+    }
+    
+    async decode(payload, protocol) {
+        if (typeof payload === 'string') {
+            return JSON.parse(payload);
+        }
+        // crew.v1.deflate: large messages arrive as zlib-compressed JSON
+        const stream = new Blob([payload]).stream().pipeThrough(new DecompressionStream('deflate'));
+        return JSON.parse(await new Response(stream).text());
+    }
+    
     handleMessage(event) {
-        try {
-            const data = JSON.parse(event.data);
-            
-            // Debug logging
-            console.log('📨 WebSocket message received:', data.type, data);
-            
-            // Handle different message types
-            switch (data.type) {
-                case 'pong':
-                    // Heartbeat response
-                    break;
-                case 'status':
-                    this.emit('status', data);
-                    break;
-                case 'agent_start':
-                case 'agent_thinking':
-                case 'agent_output':
-                case 'task_complete':
-                case 'crew_complete':
-                case 'error':
-                    console.log('📤 Emitting crew_update event:', data.type);
-                    this.emit('crew_update', data);
-                    break;
-                default:
-                    console.log('⚠️ Unknown message type:', data.type, data);
+        const protocol = event.target.protocol;
+        this.decodeQueue = this.decodeQueue
+            .then(() => this.decode(event.data, protocol))
+            .then(data => this.dispatch(data))
+            .catch(error => {
+                console.error('❌ Error parsing WebSocket message:', error, event.data);
+            });
+    }
+    
+    dispatch(data) {
+        if (data.run_id && typeof data.seq === 'number' && data.type !== 'snapshot') {
+            // Skip messages we already have, e.g. replayed after a reconnect
+            if (data.seq <= (this.lastSeq.get(data.run_id) || 0)) {
+                return;
             }
-            
-        } catch (error) {
-            console.error('❌ Error parsing WebSocket message:', error, event.data);
+            this.lastSeq.set(data.run_id, data.seq);
+        }
+        
+        // Debug logging
+        console.log('📨 WebSocket message received:', data.type, data);
+        
+        // Handle different message types
+        switch (data.type) {
+            case 'pong':
+                // Heartbeat response
+                break;
+            case 'welcome':
+                this.connectionId = data.connection_id;
+                // A new connection starts without subscriptions
+                this.subscriptions.forEach(runId => this.sendSubscribe(runId));
+                this.emit('welcome', data);
+                break;
+            case 'subscribed':
+            case 'unsubscribed':
+                break;
+            case 'snapshot':
+                this.lastSeq.set(data.run_id, data.seq);
+                this.emit('snapshot', data);
+                break;
+            case 'status':
+                this.emit('status', data);
+                break;
+            case 'agent_start':
+            case 'agent_thinking':
+            case 'agent_output':
+            case 'task_complete':
+            case 'crew_complete':
+            case 'error':
+                console.log('📤 Emitting crew_update event:', data.type);
+                this.emit('crew_update', data);
+                break;
+            default:
+                console.log('⚠️ Unknown message type:', data.type, data);
         }
     }
     
@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+"""
+Load generator for the /ws endpoint.
+
+Opens N WebSocket clients that speak the websocket-client.js protocol. Each
+client reads its welcome message, subscribes to the "runs" topic like a
+dashboard, sends ping heartbeats and optionally get_status. Some clients can
+be slow consumers that pause after every message. While they are connected,
+crew runs are started through /api/start-crew. The report covers delivery
+latency percentiles per client, lost messages (gaps in each run's seq),
+server CPU and memory, and the server's own drop counters.
+
+With --spawn-server the tool starts the web server itself. The server gets a
+mock LLM (see mock_llm_server) and a temporary run directory, so runs cost
+nothing and emit events at a controlled pace:
+
+    ws_load --spawn-server --clients 500 --slow-clients 50 --runs 4 --llm-tokens-per-second 80
+
+Delivery latency is the receive time minus the message's timestamp, so the
+server and the load generator need the same clock (the same host, or synced
+clocks).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import websockets
+
+from crewai_demo.cassette import ReplayPace
+from crewai_demo.mock_llm_server import MockLLMServer
+from crewai_demo.stats import percentile
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# Subprotocols of web_ui.backend.wire_format
+PROTOCOLS = {"json": None, "deflate": "crew.v1.deflate"}
+# Concurrent WebSocket handshakes while ramping up
+CONNECT_CONCURRENCY = 100
+
+
+@dataclass
+class ClientStats:
+    """What one simulated client saw"""
+
+    index: int
+    slow: bool
+    connection_id: Optional[str] = None
+    connected: bool = False
+    received: int = 0
+    # Seconds from a run message's timestamp to its arrival
+    latencies: List[float] = field(default_factory=list)
+    pong_rtts: List[float] = field(default_factory=list)
+    # Run ID -> sequence numbers received
+    seqs: Dict[str, Set[int]] = field(default_factory=dict)
+    close_code: Optional[int] = None
+    error: Optional[str] = None
+
+
+def _decode(payload: Any, protocol: Optional[str]) -> Dict[str, Any]:
+    if isinstance(payload, str):
+        return json.loads(payload)
+    return json.loads(zlib.decompress(payload))
+
+
+def _message_time(timestamp: Any) -> Optional[float]:
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return None
+
+
+async def run_client(url: str, stats: ClientStats, args: argparse.Namespace,
+                     stop: asyncio.Event, handshakes: asyncio.Semaphore):
+    protocol = PROTOCOLS[args.protocol]
+    try:
+        async with handshakes:
+            ws = await websockets.connect(url, subprotocols=[protocol] if protocol else None, max_size=None,
+                                          # A slow consumer stops reading, so the server's sends back up
+                                          max_queue=1 if stats.slow else 32, open_timeout=30)
+    except Exception as e:
+        stats.error = f"connect: {type(e).__name__}: {e}"
+        return
+    stats.connected = True
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(args.ping_interval)
+            await ws.send(json.dumps({"type": "ping", "timestamp": time.time() * 1000}))
+
+    async def poll_status():
+        while True:
+            await asyncio.sleep(args.status_interval)
+            await ws.send(json.dumps({"type": "get_status", "timestamp": time.time() * 1000}))
+
+    async def read():
+        async for payload in ws:
+            received_at = time.time()
+            data = _decode(payload, ws.subprotocol)
+            stats.received += 1
+            message_type = data.get("type")
+            if message_type == "welcome":
+                stats.connection_id = data.get("connection_id")
+                await ws.send(json.dumps({"type": "subscribe", "topic": "runs"}))
+            elif message_type == "pong" and isinstance(data.get("timestamp"), (int, float)):
+                stats.pong_rtts.append(received_at - data["timestamp"] / 1000)
+            elif data.get("run_id") and isinstance(data.get("seq"), int) and message_type != "snapshot":
+                stats.seqs.setdefault(data["run_id"], set()).add(data["seq"])
+                sent_at = _message_time(data.get("timestamp"))
+                if sent_at is not None:
+                    stats.latencies.append(received_at - sent_at)
+            if stats.slow:
+                await asyncio.sleep(args.slow_delay_ms / 1000)
+
+    tasks = [asyncio.create_task(read()), asyncio.create_task(heartbeat())]
+    if args.status_interval:
+        tasks.append(asyncio.create_task(poll_status()))
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait([stopped, tasks[0]], return_when=asyncio.FIRST_COMPLETED)
+        if tasks[0].done() and not tasks[0].cancelled() and tasks[0].exception():
+            error = tasks[0].exception()
+            if not isinstance(error, websockets.ConnectionClosed):
+                stats.error = f"{type(error).__name__}: {error}"
+    finally:
+        for task in tasks + [stopped]:
+            task.cancel()
+        await asyncio.gather(*tasks, stopped, return_exceptions=True)
+        # The server closes slow clients with 1013; anything else after this point is ours
+        stats.close_code = ws.close_code
+        await ws.close()
+
+
+class ProcessSampler:
+    """CPU and resident memory of a process, sampled at an interval (psutil, or /proc on Linux)"""
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_bytes: List[int] = []
+        self._process = psutil.Process(pid) if psutil is not None else None
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _read(self) -> Optional[Tuple[float, int]]:
+        """CPU seconds used so far and current RSS, or None when unavailable"""
+        try:
+            if self._process is not None:
+                processes = [self._process] + self._process.children(recursive=True)
+                cpu = rss = 0
+                for process in processes:
+                    times = process.cpu_times()
+                    cpu += times.user + times.system
+                    rss += process.memory_info().rss
+                return cpu, rss
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{self.pid}/status") as f:
+                rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            return (int(fields[11]) + int(fields[12])) / self._ticks, rss_kb * 1024
+        except Exception:
+            return None
+
+    async def run(self):
+        previous = self._read()
+        previous_time = time.monotonic()
+        while previous is not None:
+            await asyncio.sleep(self.interval)
+            current = self._read()
+            now = time.monotonic()
+            if current is None:
+                return
+            self.cpu_percent.append((current[0] - previous[0]) / (now - previous_time) * 100)
+            self.rss_bytes.append(current[1])
+            previous, previous_time = current, now
+
+    def summary(self) -> Optional[Dict[str, float]]:
+        if not self.cpu_percent:
+            return None
+        return {
+            "cpu_percent_mean": round(sum(self.cpu_percent) / len(self.cpu_percent), 1),
+            "cpu_percent_max": round(max(self.cpu_percent), 1),
+            "rss_mb_peak": round(max(self.rss_bytes) / 1024 / 1024, 1),
+            "rss_mb_end": round(self.rss_bytes[-1] / 1024 / 1024, 1),
+        }
+
+
+def _http(method: str, url: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, Dict[str, Any]]:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, {"detail": e.read().decode("utf-8", "replace")}
+
+
+async def start_runs(base_url: str, count: int, interval: float) -> Tuple[List[str], int]:
+    """Start count runs, interval seconds apart; returns their IDs and how many were rejected"""
+    run_ids: List[str] = []
+    rejected = 0
+    for i in range(count):
+        if i:
+            await asyncio.sleep(interval)
+        status, response = await asyncio.to_thread(_http, "POST", f"{base_url}/api/start-crew", {
+            "feature_request": f"Load test feature {i + 1}: a settings page with profile, password and notification options.",
+            "idempotency_key": uuid.uuid4().hex,
+        })
+        if status == 200:
+            run_ids.append(response["run_id"])
+        else:
+            rejected += 1
+            print(f"Run {i + 1} rejected ({status}): {response.get('detail')}", file=sys.stderr)
+    return run_ids, rejected
+
+
+async def wait_for_runs(base_url: str, run_ids: List[str], timeout: float) -> Dict[str, str]:
+    """Final status of each run, polling until none is queued or running"""
+    deadline = time.monotonic() + timeout
+    statuses: Dict[str, str] = {}
+    while True:
+        for run_id in run_ids:
+            if statuses.get(run_id) in (None, "queued", "running"):
+                _, response = await asyncio.to_thread(_http, "GET", f"{base_url}/api/status?run_id={run_id}")
+                statuses[run_id] = response.get("status") or "unknown"
+        if all(status not in ("queued", "running") for status in statuses.values()) or time.monotonic() > deadline:
+            return statuses
+        await asyncio.sleep(1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(args: argparse.Namespace, run_dir: str) -> Tuple[subprocess.Popen, MockLLMServer, str]:
+    """Start a mock LLM server here and the web server in a subprocess using it"""
+    llm = MockLLMServer(("127.0.0.1", 0), None, ReplayPace(args.llm_latency_ms, args.llm_tokens_per_second),
+                        fallback_tokens=args.llm_tokens)
+    threading.Thread(target=llm.serve_forever, daemon=True).start()
+    llm_url = f"http://127.0.0.1:{llm.server_address[1]}/v1"
+
+    port = _free_port()
+    env = dict(os.environ, MODEL="openai/mock", BASE_URL=llm_url, OPENAI_API_BASE=llm_url, OPENAI_API_KEY="mock",
+               LLM_CACHE="off", LLM_CASSETTE_MODE="off", CREW_RUNS_DIR=run_dir,
+               RUN_STORE_PATH=os.path.join(run_dir, "runs.sqlite3"), LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+               OTEL_SDK_DISABLED="true", CREWAI_DISABLE_TELEMETRY="true")
+    env.pop("API_BASE", None)
+    env.pop("AZURE_API_BASE", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "crewai_demo.web_ui.backend.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Web server exited with status {server.returncode}")
+        try:
+            if _http("GET", f"{base_url}/api/health")[0] == 200:
+                return server, llm, base_url
+        except OSError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("Web server did not become healthy within 60s")
+
+
+def build_report(clients: List[ClientStats], statuses: Dict[str, str], rejected: int,
+                 server_stats: Dict[str, Any], resources: Optional[Dict[str, float]], duration: float) -> Dict[str, Any]:
+    # A run's messages are numbered 1..n; the highest seq any client saw stands in for n
+    expected_per_run: Dict[str, int] = {}
+    for client in clients:
+        for run_id, seqs in client.seqs.items():
+            expected_per_run[run_id] = max(expected_per_run.get(run_id, 0), max(seqs))
+
+    def group(members: List[ClientStats]) -> Dict[str, Any]:
+        expected = len(members) * sum(expected_per_run.values())
+        received = sum(len(seqs) for client in members for seqs in client.seqs.values())
+        latencies = [latency for client in members for latency in client.latencies]
+        client_p95 = [percentile(client.latencies, 95) for client in members if client.latencies]
+        return {
+            "clients": len(members),
+            "run_messages_expected": expected,
+            "run_messages_lost": expected - received,
+            "loss_percent": round((expected - received) / expected * 100, 3) if expected else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p95": round(percentile(latencies, 95) * 1000, 2),
+                "p99": round(percentile(latencies, 99) * 1000, 2),
+                "max": round(max(latencies, default=0) * 1000, 2),
+            },
+            # How the clients' own p95 latencies are spread
+            "client_p95_ms": {
+                "median": round(percentile(client_p95, 50) * 1000, 2),
+                "worst": round(max(client_p95, default=0) * 1000, 2),
+            },
+        }
+
+    connected = [client for client in clients if client.connected]
+    rtts = [rtt for client in clients for rtt in client.pong_rtts]
+    return {
+        "duration_seconds": round(duration, 1),
+        "clients": len(clients),
+        "connected": len(connected),
+        "connect_errors": sum(1 for client in clients if not client.connected),
+        "closed_by_server_too_slow": sum(1 for client in clients if client.close_code == 1013),
+        "errors": sorted({client.error for client in clients if client.error})[:10],
+        "runs": {"started": len(statuses), "rejected": rejected, "statuses": statuses,
+                 "messages": expected_per_run},
+        "all": group(connected),
+        "normal": group([client for client in connected if not client.slow]),
+        "slow": group([client for client in connected if client.slow]),
+        "pong_rtt_ms": {
+            "p50": round(percentile(rtts, 50) * 1000, 2),
+            "p95": round(percentile(rtts, 95) * 1000, 2),
+        },
+        "server_resources": resources,
+        "server_websocket_stats": {key: server_stats.get(key) for key in
+                                   ("connections", "dropped", "coalesced", "slow_disconnects", "max_queue_depth")},
+        "per_client": [
+            {
+                "index": client.index,
+                "slow": client.slow,
+                "connection_id": client.connection_id,
+                "received": client.received,
+                "lost": sum(expected_per_run[run_id] - len(client.seqs.get(run_id, ()))
+                            for run_id in expected_per_run) if client.connected else None,
+                "latency_ms_p50": round(percentile(client.latencies, 50) * 1000, 2),
+                "latency_ms_p95": round(percentile(client.latencies, 95) * 1000, 2),
+                "close_code": client.close_code,
+                "error": client.error,
+            }
+            for client in clients
+        ],
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"Clients: {report['connected']}/{report['clients']} connected, {report['connect_errors']} failed to connect, "
+          f"{report['closed_by_server_too_slow']} closed by the server as too slow")
+    runs = report["runs"]
+    print(f"Runs: {runs['started']} started, {runs['rejected']} rejected, "
+          + ", ".join(f"{run_id}: {status}" for run_id, status in runs["statuses"].items()))
+    for name in ("all", "normal", "slow"):
+        group = report[name]
+        if not group["clients"]:
+            continue
+        latency = group["latency_ms"]
+        print(f"{name:>6}: {group['clients']} clients, lost {group['run_messages_lost']}/{group['run_messages_expected']} "
+              f"({group['loss_percent']}%), latency p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+              f"p99 {latency['p99']} ms, max {latency['max']} ms; per-client p95 median "
+              f"{group['client_p95_ms']['median']} ms, worst {group['client_p95_ms']['worst']} ms")
+    print(f"Pong RTT: p50 {report['pong_rtt_ms']['p50']} ms, p95 {report['pong_rtt_ms']['p95']} ms")
+    if report["server_resources"]:
+        resources = report["server_resources"]
+        print(f"Server: CPU mean {resources['cpu_percent_mean']}%, max {resources['cpu_percent_max']}%; "
+              f"RSS peak {resources['rss_mb_peak']} MB, end {resources['rss_mb_end']} MB")
+    print(f"Server WebSocket stats: {report['server_websocket_stats']}")
+    for error in report["errors"]:
+        print(f"Client error: {error}")
+
+
+async def run_load(args: argparse.Namespace, base_url: str, server_pid: Optional[int]) -> Dict[str, Any]:
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://") + "/ws"
+    stop = asyncio.Event()
+    handshakes = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    clients = [ClientStats(index=i, slow=i < args.slow_clients) for i in range(args.clients)]
+    sampler = ProcessSampler(server_pid, args.sample_interval) if server_pid else None
+    sampler_task = asyncio.create_task(sampler.run()) if sampler else None
+    started = time.monotonic()
+
+    client_tasks = []
+    for stats in clients:
+        client_tasks.append(asyncio.create_task(run_client(ws_url, stats, args, stop, handshakes)))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.clients)
+    # Let the clients connect and subscribe before anything is emitted
+    while any(not stats.connection_id and not stats.error for stats in clients) \
+            and time.monotonic() - started < args.ramp + 30:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(0.5)
+
+    run_ids, rejected = await start_runs(base_url, args.runs, args.run_interval)
+    statuses = await wait_for_runs(base_url, run_ids, args.run_timeout)
+    # Give the last messages time to reach slow clients
+    await asyncio.sleep(args.drain)
+    _, server_stats = await asyncio.to_thread(_http, "GET", f"{base_url}/api/websocket/stats")
+
+    stop.set()
+    await asyncio.gather(*client_tasks, return_exceptions=True)
+    if sampler_task:
+        sampler_task.cancel()
+    return build_report(clients, statuses, rejected, server_stats,
+                        sampler.summary() if sampler else None, time.monotonic() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the /ws endpoint with simulated UI clients")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Web server to test (ignored with --spawn-server)")
+    parser.add_argument("--spawn-server", action="store_true",
+                        help="Start the web server with a mock LLM instead of using --url")
+    parser.add_argument("--server-pid", type=int, help="PID of the web server, for CPU and memory (implied by --spawn-server)")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--slow-clients", type=int, default=0, help="How many of the clients are slow consumers")
+    parser.add_argument("--slow-delay-ms", type=float, default=200, help="Pause of slow clients after each message")
+    parser.add_argument("--protocol", choices=sorted(PROTOCOLS), default="json")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds over which clients connect")
+    parser.add_argument("--ping-interval", type=float, default=30, help="Heartbeat interval, as websocket-client.js")
+    parser.add_argument("--status-interval", type=float, default=0, help="get_status interval; 0 to never send it")
+    parser.add_argument("--runs", type=int, default=1, help="Crew runs to start once the clients are connected")
+    parser.add_argument("--run-interval", type=float, default=1, help="Seconds between starting runs")
+    parser.add_argument("--run-timeout", type=float, default=600, help="Give up waiting for runs after this long")
+    parser.add_argument("--drain", type=float, default=3, help="Seconds to keep reading after the runs finish")
+    parser.add_argument("--sample-interval", type=float, default=1, help="Seconds between server CPU/memory samples")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Mock LLM time to first token (--spawn-server)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50, help="Mock LLM token rate (--spawn-server)")
+    parser.add_argument("--llm-tokens", type=int, default=300, help="Tokens per mock LLM answer (--spawn-server)")
+    parser.add_argument("--output", help="Write the full report, with per-client results, as JSON")
+    args = parser.parse_args(argv)
+    args.slow_clients = min(args.slow_clients, args.clients)
+
+    server = llm = None
+    with tempfile.TemporaryDirectory() as run_dir:
+        try:
+            if args.spawn_server:
+                server, llm, base_url = spawn_server(args, run_dir)
+                server_pid = server.pid
+            else:
+                base_url, server_pid = args.url.rstrip("/"), args.server_pid
+            report = asyncio.run(run_load(args, base_url, server_pid))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+            if llm is not None:
+                llm.shutdown()
+                llm.server_close()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
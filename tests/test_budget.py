@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+from crewai_demo.budget import (
+    CHARS_PER_TOKEN, DEFAULT_COMPLETION_TOKENS, PROMPT_OVERHEAD_CHARS, RunBudget, estimate_usage,
+)
+from crewai_demo.run_context import BudgetExceededError, RunCancelledError, RunContext
+
+# Stands in for CrewAI's NOT_SPECIFIED: a task that didn't set its context
+NOT_SPECIFIED = object()
+
+
+def test_within_budget_passes():
+    run = RunContext(run_id="run")
+    run.record_usage("a", "Agent", 40, 50)
+    RunBudget(run_tokens=100, task_tokens=100).check(run, "a")
+    assert not run.cancelled
+
+
+def test_task_token_budget():
+    run = RunContext(run_id="run")
+    run.record_usage("a", "Agent", 60, 50)
+    run.record_usage("b", "Agent", 10, 10)
+    budget = RunBudget(task_tokens=100)
+    # Another task's usage doesn't count against this one
+    budget.check(run, "b")
+
+    with pytest.raises(BudgetExceededError, match="Task token budget exceeded: 110 of 100"):
+        budget.check(run, "a")
+    assert run.cancelled
+    assert run.budget_exceeded.startswith("Task token budget")
+
+
+def test_run_token_budget_sums_every_task():
+    run = RunContext(run_id="run")
+    run.record_usage("a", "Agent", 30, 30)
+    run.record_usage("b", "Agent", 30, 30)
+    with pytest.raises(BudgetExceededError, match="Run token budget exceeded: 120 of 100"):
+        RunBudget(run_tokens=100).check(run, "a")
+
+
+def test_task_time_budget(monkeypatch):
+    run = RunContext(run_id="run")
+    budget = RunBudget(task_seconds=10)
+    budget.check(run, "a")
+    monkeypatch.setattr(run, "task_elapsed", lambda task_id: 11)
+    with pytest.raises(BudgetExceededError, match="Task time budget exceeded"):
+        budget.check(run, "a")
+
+
+def test_stopped_run_raises_even_within_budget():
+    run = RunContext(run_id="run")
+    run.cancel()
+    with pytest.raises(RunCancelledError) as error:
+        RunBudget().check(run, "a")
+    assert not isinstance(error.value, BudgetExceededError)
+
+
+def make_task(description, context, max_iter=2):
+    agent = SimpleNamespace(role="Role", goal="Goal", backstory="Backstory", max_iter=max_iter)
+    return SimpleNamespace(agent=agent, description=description, expected_output="Output", context=context)
+
+
+def prompt_tokens(task, context_tokens=0):
+    text = " ".join([task.agent.role, task.agent.goal, task.agent.backstory, task.description, task.expected_output])
+    return (len(text) + PROMPT_OVERHEAD_CHARS) // CHARS_PER_TOKEN + context_tokens
+
+
+def test_estimate_context_follows_the_task_graph():
+    first = make_task("First {topic}", None)
+    explicit = make_task("Explicit", [first])
+    # No explicit context: the outputs of every earlier task, as in a sequential crew
+    implicit = make_task("Implicit", NOT_SPECIFIED)
+    crew = SimpleNamespace(tasks=[first, explicit, implicit])
+    history = {"explicit": {"prompt_tokens": 500, "completion_tokens": 200}}
+
+    report = estimate_usage(crew, ["first", "explicit", "implicit"], {"topic": "x"}, history=history)
+    tasks = report["tasks"]
+
+    first.description = "First x"
+    assert tasks["first"]["expected_tokens"] == prompt_tokens(first) + DEFAULT_COMPLETION_TOKENS
+    assert tasks["first"]["source"] == "estimate"
+    assert tasks["explicit"] == dict(tasks["explicit"], expected_tokens=700, source="history")
+    assert tasks["implicit"]["expected_tokens"] == (
+        prompt_tokens(implicit, DEFAULT_COMPLETION_TOKENS + 200) + DEFAULT_COMPLETION_TOKENS
+    )
+    assert report["expected_tokens"] == sum(task["expected_tokens"] for task in tasks.values())
+
+
+def test_estimate_worst_case_and_budget():
+    task = make_task("Only", None, max_iter=2)
+    crew = SimpleNamespace(tasks=[task])
+    prompt = prompt_tokens(task)
+
+    report = estimate_usage(crew, ["only"], {}, budget=RunBudget(run_tokens=10))
+    completion = DEFAULT_COMPLETION_TOKENS
+    # Three calls, each resending the conversation so far
+    assert report["tasks"]["only"]["max_llm_calls"] == 3
+    assert report["max_tokens"] == 3 * prompt + (0 + 1 + 2) * completion + 3 * completion
+    assert report["budget"]["run_tokens"] == 10
+    assert report["within_budget"] is False
+
+    report = estimate_usage(crew, ["only"], {}, budget=RunBudget(run_tokens=prompt + completion))
+    assert report["within_budget"] is True
@@ -0,0 +1,53 @@
+import pytest
+
+from crewai_demo.cassette import Cassette, CassetteMissError, ReplayPace, request_key
+
+MESSAGES = [{"role": "system", "content": "You are helpful"}, {"role": "user", "content": "Hi"}]
+
+
+def test_request_key_matches_on_messages_and_tools():
+    assert request_key(MESSAGES) == request_key([dict(m) for m in MESSAGES])
+    # A bare prompt is sent as a single user message
+    assert request_key("Hi") == request_key([{"role": "user", "content": "Hi"}])
+    # No tools and an empty tool list are the same request
+    assert request_key(MESSAGES, None) == request_key(MESSAGES, [])
+
+    assert request_key(MESSAGES) != request_key(MESSAGES[1:])
+    assert request_key(MESSAGES) != request_key(MESSAGES, [{"type": "function", "function": {"name": "search"}}])
+
+
+def test_request_key_ignores_fields_other_than_role_and_content():
+    with_extras = [dict(m, name="agent", cache_control={"type": "ephemeral"}) for m in MESSAGES]
+    assert request_key(with_extras) == request_key(MESSAGES)
+
+
+def test_record_then_replay_in_recorded_order(tmp_path):
+    path = str(tmp_path / "cassettes" / "llm.jsonl")
+    recorder = Cassette(path, mode="record")
+    recorder.record("gpt-4o-mini", MESSAGES, None, "first", prompt_tokens=10, completion_tokens=2)
+    recorder.record("gpt-4o-mini", MESSAGES, None, "second")
+    recorder.record("gpt-4o-mini", "Other", None, "other")
+
+    cassette = Cassette(path, mode="replay")
+    assert len(cassette) == 3
+    recording = cassette.replay(MESSAGES)
+    assert (recording.response, recording.prompt_tokens, recording.completion_tokens) == ("first", 10, 2)
+    # The last response repeats
+    assert cassette.replay(MESSAGES).response == "second"
+    assert cassette.replay(MESSAGES).response == "second"
+    assert cassette.replay("Other").response == "other"
+
+    with pytest.raises(CassetteMissError):
+        cassette.replay("Never recorded")
+
+
+def test_replay_of_a_missing_cassette(tmp_path):
+    with pytest.raises(FileNotFoundError, match="LLM_CASSETTE_MODE=record"):
+        Cassette(str(tmp_path / "missing.jsonl"))
+
+
+def test_pace_splits_into_token_sized_chunks():
+    pace = ReplayPace(tokens_per_second=1_000_000)
+    chunks = list(pace.chunks("abcdefghij", completion_tokens=5))
+    assert chunks == ["ab", "cd", "ef", "gh", "ij"]
+    assert list(ReplayPace().chunks("abcdefghij")) == ["abcdefghij"]
@@ -0,0 +1,86 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from crewai import Agent, Task
+
+from crewai_demo.dag_crew import DagCrew, TaskGraph
+from crewai_demo.run_context import RunContext, current_run
+
+
+def make_task(key, context=None):
+    task = SimpleNamespace(key=key, description=f"task {key}")
+    if context is not None:
+        task.context = context
+    else:
+        # CrewAI's NOT_SPECIFIED: truthy, not a list
+        task.context = object()
+    return task
+
+
+def test_explicit_context_and_default_context_dependencies():
+    research = make_task("research", context=[])
+    design = make_task("design", context=[research])
+    pricing = make_task("pricing", context=[research])
+    summary = make_task("summary")
+    graph = TaskGraph([research, design, pricing, summary])
+
+    assert graph.dependencies == [[], [0], [0], [0, 1, 2]]
+    assert graph.ready(done=set(), started=set()) == [0]
+    assert graph.ready(done={0}, started={0}) == [1, 2]
+    assert graph.ready(done={0, 1}, started={0, 1, 2}) == []
+
+
+def test_dependency_on_a_later_task_is_rejected():
+    later = make_task("later", context=[])
+    early = make_task("early", context=[later])
+    with pytest.raises(ValueError, match="depends on a later task"):
+        TaskGraph([early, later])
+
+
+def test_critical_path_follows_the_slowest_chain():
+    a = make_task("a", context=[])
+    b = make_task("b", context=[a])
+    c = make_task("c", context=[a])
+    d = make_task("d", context=[b, c])
+    graph = TaskGraph([a, b, c, d])
+
+    path, length = graph.critical_path({0: 1.0, 1: 5.0, 2: 2.0, 3: 1.0})
+    assert path == [0, 1, 3]
+    assert length == pytest.approx(7.0)
+    assert TaskGraph([]).critical_path({}) == ([], 0.0)
+
+
+def test_failing_task_stops_running_siblings(monkeypatch):
+    agent = Agent(role="Analyst", goal="Analyze", backstory="Analyst", llm="gpt-4o-mini")
+    tasks = [Task(description=f"Task {i}", expected_output="Text", agent=agent, context=[]) for i in range(2)]
+    crew = DagCrew(agents=[agent], tasks=tasks)
+    sibling_started = threading.Event()
+    sibling_stopped = threading.Event()
+
+    def run_graph_task(self, index, task, dep_outputs):
+        if index == 0:
+            sibling_started.wait(2)
+            raise RuntimeError("task failed")
+        sibling_started.set()
+        # A long LLM call that checks for cancellation, like a streamed response
+        run = current_run.get()
+        for _ in range(200):
+            if run.cancelled:
+                sibling_stopped.set()
+                run.check_cancelled()
+            time.sleep(0.05)
+
+    monkeypatch.setattr(DagCrew, "_run_graph_task", run_graph_task)
+    run = RunContext(run_id="dag")
+    current_run.set(run)
+    try:
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match="task failed"):
+            crew._execute_tasks(tasks)
+        assert time.monotonic() - start < 2
+    finally:
+        current_run.set(None)
+    assert run.cancelled
+    assert sibling_stopped.wait(2)
@@ -0,0 +1,67 @@
+import time
+
+from crewai_demo.llm_cache import LLMResponseCache, cache_key
+
+
+def table_size(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+
+
+def tracked_size(cache):
+    return cache._conn.execute("SELECT total FROM llm_cache_size").fetchone()[0]
+
+
+def test_key_covers_model_params_and_messages():
+    messages = [{"role": "user", "content": "hi"}]
+    key = cache_key("gpt-4o-mini", {"temperature": 0}, messages)
+    assert key == cache_key("gpt-4o-mini", {"temperature": 0}, [dict(m) for m in messages])
+    assert key != cache_key("gpt-4o", {"temperature": 0}, messages)
+    assert key != cache_key("gpt-4o-mini", {"temperature": 1}, messages)
+
+
+def test_get_returns_stored_response(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("a") is None
+    cache.put("a", "m", "response")
+    assert cache.get("a") == "response"
+
+
+def test_least_recently_used_entries_are_evicted_beyond_the_cap(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    cache.put("a", "m", "x" * 10)
+    time.sleep(0.01)
+    cache.put("b", "m", "x" * 10)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "m", "x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] == 20
+
+
+def test_size_total_follows_inserts_replacements_and_deletes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMResponseCache(path, max_bytes=1000)
+    cache.put("a", "m", "x" * 100)
+    cache.put("b", "m", "x" * 50)
+    cache.put("a", "m", "x" * 30)
+    assert tracked_size(cache) == table_size(cache) == 80
+
+    cache.put("c", "m", "x" * 950)
+    assert tracked_size(cache) == table_size(cache) <= 1000
+
+    cache.clear()
+    assert tracked_size(cache) == 0
+
+    # A second connection to the same file shares the total
+    cache.put("d", "m", "x" * 10)
+    assert tracked_size(LLMResponseCache(path)) == 10
+
+
+def test_expired_entries_are_not_returned(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.01)
+    cache.put("a", "m", "response")
+    time.sleep(0.05)
+    assert cache.get("a") is None
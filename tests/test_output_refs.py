@@ -0,0 +1,88 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from crewai_demo.web_ui.backend.output_refs import output_ref, output_response
+
+OUTPUT = "".join(f"line {i}\n" for i in range(1000))
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/output")
+    def get_output(request: Request):
+        return output_response(request, OUTPUT)
+
+    return TestClient(app)
+
+
+def test_small_outputs_are_sent_inline():
+    assert output_ref("run", "task", "short") is None
+    ref = output_ref("run", "task", OUTPUT)
+    assert ref["size"] == len(OUTPUT)
+    assert ref["url"] == "/api/runs/run/outputs/task"
+
+
+def test_revalidation_with_etag(client):
+    response = client.get("/output", headers=IDENTITY)
+    assert response.status_code == 200
+    assert response.text == OUTPUT
+    etag = response.headers["etag"]
+
+    response = client.get("/output", headers={**IDENTITY, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_gzip_has_its_own_etag(client):
+    identity_etag = client.get("/output", headers=IDENTITY).headers["etag"]
+
+    response = client.get("/output", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    gzip_etag = response.headers["etag"]
+    assert gzip_etag != identity_etag
+    assert response.text == OUTPUT
+
+    # A cached identity body doesn't validate the gzip representation, and vice versa
+    assert client.get("/output", headers={"Accept-Encoding": "gzip", "If-None-Match": identity_etag}).status_code == 200
+    assert client.get("/output", headers={**IDENTITY, "If-None-Match": gzip_etag}).status_code == 200
+    assert client.get("/output", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}).status_code == 304
+
+
+def test_byte_ranges(client):
+    response = client.get("/output", headers={**IDENTITY, "Range": "bytes=5-9"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 5-9/{len(OUTPUT)}"
+    assert response.text == OUTPUT[5:10]
+
+    response = client.get("/output", headers={**IDENTITY, "Range": "bytes=-4"})
+    assert response.status_code == 206
+    assert response.text == OUTPUT[-4:]
+
+    response = client.get("/output", headers={**IDENTITY, "Range": f"bytes={len(OUTPUT)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(OUTPUT)}"
+
+
+def test_ranges_are_of_the_identity_body_even_when_gzip_is_accepted(client):
+    response = client.get("/output", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.text == OUTPUT[:10]
+
+
+def test_if_range_only_matches_the_identity_etag(client):
+    identity_etag = client.get("/output", headers=IDENTITY).headers["etag"]
+    gzip_etag = client.get("/output", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    response = client.get("/output", headers={**IDENTITY, "Range": "bytes=0-9", "If-Range": identity_etag})
+    assert response.status_code == 206
+
+    # A partial gzip body can't be resumed with identity offsets; send the whole output
+    response = client.get("/output", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9", "If-Range": gzip_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == gzip_etag
+    assert response.text == OUTPUT
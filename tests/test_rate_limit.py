@@ -0,0 +1,158 @@
+from types import SimpleNamespace
+
+import pytest
+
+from crewai_demo import rate_limit
+from crewai_demo.rate_limit import (
+    AdaptiveConcurrency, CallStats, LLMRateLimiter, RateLimitedError, SQLiteTokenBucket, TokenBucket,
+    estimate_tokens, retry_after,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens(400, 100) == 200
+    assert estimate_tokens(400) == 100 + rate_limit.DEFAULT_COMPLETION_TOKENS
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket("requests", per_minute=60)
+    assert bucket.take(60) == 0
+    assert bucket.take(1) == pytest.approx(1.0)
+    clock.now += 2
+    assert bucket.take(2) == 0
+    # More than a minute's worth waits for a full bucket
+    assert bucket.take(1000) == pytest.approx(60.0)
+
+
+def test_token_bucket_adjust_corrects_an_estimate(clock):
+    bucket = TokenBucket("tokens", per_minute=100)
+    bucket.take(50)
+    bucket.adjust(80)
+    assert bucket.take(1) == pytest.approx(31 * 60 / 100)
+    bucket.adjust(-1000)
+    # Never above capacity
+    assert bucket.take(100) == 0
+
+
+def test_sqlite_token_buckets_share_their_level(tmp_path, clock):
+    path = str(tmp_path / "limits.sqlite3")
+    first = SQLiteTokenBucket("requests", 60, path)
+    second = SQLiteTokenBucket("requests", 60, path)
+    assert first.take(40) == 0
+    assert second.take(40) == pytest.approx(20.0)
+    second.adjust(-30)
+    assert first.take(40) == 0
+
+
+def test_concurrency_grows_additively_and_backs_off_multiplicatively(monkeypatch):
+    concurrency = AdaptiveConcurrency(max_limit=8, min_limit=2, latency_target=5.0, backoff=0.5)
+    concurrency.limit = 4.0
+    for _ in range(4):
+        concurrency.acquire()
+        concurrency.release(latency=0.1)
+    assert 4.9 < concurrency.limit < 5.0
+
+    concurrency.acquire()
+    concurrency.release(latency=0.1, rate_limited=True)
+    assert concurrency.limit == pytest.approx(2.45, abs=0.05)
+    # A burst of 429s from the same moment counts once
+    concurrency.acquire()
+    concurrency.release(latency=0.1, rate_limited=True)
+    assert concurrency.limit == pytest.approx(2.45, abs=0.05)
+
+    monkeypatch.setattr(concurrency, "_last_decrease", float("-inf"))
+    concurrency.acquire()
+    # Slow calls back off too, never below min_limit
+    concurrency.release(latency=10.0)
+    assert concurrency.limit == 2.0
+    assert concurrency.in_flight == 0
+
+
+def test_concurrency_wait_can_be_cancelled(monkeypatch):
+    monkeypatch.setattr(rate_limit, "POLL_SECONDS", 0.01)
+    concurrency = AdaptiveConcurrency(max_limit=1)
+    concurrency.acquire()
+
+    def check():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        concurrency.acquire(check)
+    assert concurrency.in_flight == 1
+    assert concurrency.waiting == 0
+
+
+def test_retries_429s_after_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(LLMRateLimiter, "_sleep", staticmethod(lambda seconds, check: sleeps.append(seconds)))
+    limiter = LLMRateLimiter(tokens_per_minute=10_000, max_concurrency=2)
+    errors = [RateLimitError(retry_after=3), RuntimeError("wrapped")]
+    errors[1].__cause__ = RateLimitError()
+
+    def send():
+        if errors:
+            raise errors.pop(0)
+        return "response"
+
+    stats = CallStats()
+    assert limiter.call(send, estimated_tokens=100, stats=stats, used_tokens=lambda: 40) == "response"
+    assert stats.rate_limited == 2
+    assert sleeps[0] == 3
+    # Exponential backoff with jitter on the second attempt
+    assert 1.0 <= sleeps[1] <= 2.0
+    assert limiter.concurrency.in_flight == 0
+    # Turned-away requests gave their tokens back and the estimate was corrected to the 40 used
+    assert limiter.tokens._tokens == pytest.approx(10_000 - 40, abs=1)
+
+
+def test_gives_up_after_its_retries(monkeypatch):
+    monkeypatch.setattr(LLMRateLimiter, "_sleep", staticmethod(lambda seconds, check: None))
+    limiter = LLMRateLimiter(max_concurrency=1, retries=2)
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise RateLimitError()
+
+    stats = CallStats()
+    with pytest.raises(RateLimitedError):
+        limiter.call(send, 10, stats)
+    assert len(calls) == 3
+    assert stats.rate_limited == 3
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_other_errors_are_not_retried():
+    limiter = LLMRateLimiter(max_concurrency=1)
+
+    def send():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(send, 10, CallStats())
+    assert limiter.concurrency.in_flight == 0
+    assert retry_after(ValueError()) is None
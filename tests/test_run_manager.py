@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from crewai_demo.web_ui.backend import run_manager as run_manager_module
+from crewai_demo.web_ui.backend.models import CrewExecutionResult
+from crewai_demo.web_ui.backend.run_manager import RunManager, RunQueueFullError
+
+
+class FakeExecutor:
+    """Stands in for EnhancedCrewExecutor; a run lasts until finish() or stop_execution()"""
+
+    def __init__(self, logger, output_dir=None, process_pool=None, trace_exporter=None, budget=None):
+        self.done = asyncio.Event()
+        self.stopped = False
+        # How long a stopped crew takes to unwind
+        self.unwind = asyncio.Event()
+        self.unwind.set()
+
+    def finish(self):
+        self.done.set()
+
+    def stop_execution(self, force: bool = False):
+        self.stopped = True
+        self.done.set()
+
+    async def execute_crew(self, feature_request: str) -> CrewExecutionResult:
+        await self.done.wait()
+        if self.stopped:
+            await self.unwind.wait()
+        return CrewExecutionResult(success=not self.stopped, outputs=[], execution_time=0.0)
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    monkeypatch.setenv("TRACE_EXPORT", "off")
+    monkeypatch.setattr(run_manager_module, "EnhancedCrewExecutor", FakeExecutor)
+    return lambda **kwargs: RunManager(runs_dir=str(tmp_path), **kwargs)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_runs_beyond_the_slots_wait_in_the_queue(manager):
+    async def scenario():
+        runs = manager(max_concurrent_runs=2, max_queued_runs=1)
+        first, _ = runs.submit("first")
+        second, _ = runs.submit("second")
+        third, _ = runs.submit("third")
+        await settle()
+        assert (first.status, second.status, third.status) == ("running", "running", "queued")
+        assert (runs.running_count(), runs.queued_count()) == (2, 1)
+
+        with pytest.raises(RunQueueFullError):
+            runs.submit("fourth")
+
+        first.executor.finish()
+        await runs.wait(first.run_id)
+        await settle()
+        assert first.status == "completed"
+        assert third.status == "running"
+
+        second.executor.finish()
+        third.executor.finish()
+        await runs.wait(third.run_id)
+        assert runs.running_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_stopping_a_queued_run_ends_its_task(manager):
+    async def scenario():
+        runs = manager(max_concurrent_runs=1, max_queued_runs=1)
+        running, _ = runs.submit("running")
+        queued, _ = runs.submit("queued")
+        await settle()
+
+        runs.stop(queued.run_id)
+        await settle()
+        assert queued.status == "stopped"
+        assert queued.task.done()
+        await runs.wait(queued.run_id)
+        assert running.status == "running"
+
+        running.executor.finish()
+        await runs.wait(running.run_id)
+
+    asyncio.run(scenario())
+
+
+def test_stopped_run_holds_its_slot_until_the_crew_unwinds(manager):
+    async def scenario():
+        runs = manager(max_concurrent_runs=1, max_queued_runs=0, max_finished_runs=0)
+        run, _ = runs.submit("slow to stop")
+        await settle()
+        run.executor.unwind.clear()
+
+        runs.stop(run.run_id)
+        await settle()
+        assert run.status == "stopped"
+        assert runs.running_count() == 1
+        with pytest.raises(RunQueueFullError):
+            runs.submit("another")
+
+        # Pruning other finished runs leaves it alone while it holds the slot
+        runs._prune_finished()
+        assert runs.get(run.run_id) is run
+
+        run.executor.unwind.set()
+        await runs.wait(run.run_id)
+        assert runs.running_count() == 0
+        assert runs.get(run.run_id) is None
+
+    asyncio.run(scenario())
+
+
+def test_identical_requests_join_the_in_flight_run(manager):
+    async def scenario():
+        runs = manager(max_concurrent_runs=1, max_queued_runs=0)
+        run, existing = runs.submit("Build a  Login page")
+        assert not existing
+        # Case and whitespace don't make a different request
+        same, existing = runs.submit("build a login PAGE ")
+        assert existing and same is run
+        # The request is coalesced even with the queue full
+        assert runs.submit("Build a login page")[0] is run
+
+        run.executor.finish()
+        await runs.wait(run.run_id)
+        again, existing = runs.submit("Build a login page")
+        assert not existing and again is not run
+        again.executor.finish()
+        await runs.wait(again.run_id)
+
+    asyncio.run(scenario())
+
+
+def test_idempotency_key_matches_a_different_request(manager):
+    async def scenario():
+        runs = manager(max_concurrent_runs=2, max_queued_runs=0)
+        run, _ = runs.submit("first wording", idempotency_key="abc")
+        retry, existing = runs.submit("second wording", idempotency_key="abc")
+        assert existing and retry is run
+
+        runs.stop(run.run_id)
+        await runs.wait(run.run_id)
+        # A stopped run is no longer joined
+        fresh, existing = runs.submit("first wording", idempotency_key="abc")
+        assert not existing and fresh is not run
+        fresh.executor.finish()
+        await runs.wait(fresh.run_id)
+
+    asyncio.run(scenario())
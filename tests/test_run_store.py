@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from crewai_demo.web_ui.backend.models import AgentOutput
+from crewai_demo.web_ui.backend.run_store import RunStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RunStore(str(tmp_path / "runs.sqlite3"))
+    yield store
+    store.close()
+
+
+def add_runs(store, count, start=datetime(2024, 1, 1), step=timedelta(minutes=1)):
+    for i in range(count):
+        store.create_run(f"run{i:02d}", f"request {i}", f"hash{i % 2}", start + i * step, f"runs/run{i:02d}")
+
+
+def test_pages_cover_every_run_newest_first(store):
+    add_runs(store, 7)
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.list_runs(limit=3, cursor=cursor)
+        seen.extend(run["run_id"] for run in page)
+        if cursor is None:
+            break
+    assert seen == [f"run{i:02d}" for i in reversed(range(7))]
+
+
+def test_runs_created_at_the_same_time_are_not_skipped(store):
+    add_runs(store, 5, step=timedelta(0))
+    first, cursor = store.list_runs(limit=2)
+    rest, last_cursor = store.list_runs(limit=10, cursor=cursor)
+    ids = [run["run_id"] for run in first + rest]
+    assert sorted(ids) == [f"run{i:02d}" for i in range(5)]
+    assert len(set(ids)) == 5 and last_cursor is None
+
+
+def test_filters_by_status_and_feature_hash(store):
+    add_runs(store, 4)
+    store.update_status("run01", "completed", finished_at=datetime(2024, 1, 2))
+    completed, _ = store.list_runs(status="completed")
+    assert [run["run_id"] for run in completed] == ["run01"]
+    assert completed[0]["finished_at"] == datetime(2024, 1, 2)
+    same_request, _ = store.list_runs(feature_hash="hash0")
+    assert [run["run_id"] for run in same_request] == ["run02", "run00"]
+
+
+def test_malformed_cursor_raises_value_error(store):
+    with pytest.raises(ValueError):
+        store.list_runs(cursor="not a cursor")
+
+
+def test_unfinished_runs_of_a_previous_process_are_marked_failed(store):
+    add_runs(store, 3)
+    store.update_status("run00", "completed")
+    store.update_status("run01", "running")
+    assert store.mark_interrupted() == 2
+    assert store.get_run("run01")["status"] == "failed"
+    assert store.get_run("run00")["status"] == "completed"
+
+
+def save_output(store, run_id, task_name, text, output_type="product_spec"):
+    store.save_output(run_id, AgentOutput(agent_name="Product Manager", task_name=task_name, output=text,
+                                          timestamp=datetime(2024, 1, 1), output_type=output_type))
+
+
+def test_search_matches_all_words_and_highlights_them(store):
+    add_runs(store, 2)
+    save_output(store, "run00", "spec", "Users sign in with a password and a remember me option.")
+    save_output(store, "run01", "spec", "Users sign in with a magic link.")
+
+    results = store.search("password remember")
+    assert [result["run_id"] for result in results] == ["run00"]
+    assert "<mark>password</mark>" in results[0]["snippet"]
+    assert results[0]["feature_request"] == "request 0"
+    assert {result["run_id"] for result in store.search("sign")} == {"run00", "run01"}
+
+
+def test_search_phrases_filters_and_escaping(store):
+    add_runs(store, 2)
+    save_output(store, "run00", "spec", "Add a <b>remember me</b> checkbox")
+    save_output(store, "run00", "html", "<form>remember the user</form>", output_type="html")
+    save_output(store, "run01", "spec", "me remember")
+
+    assert [result["run_id"] for result in store.search('"remember me"')] == ["run00"]
+    assert [result["output_type"] for result in store.search("remember", output_type="html")] == ["html"]
+    assert [result["run_id"] for result in store.search("remember", run_id="run01")] == ["run01"]
+    assert "&lt;b&gt;" in store.search('"remember me"')[0]["snippet"]
+    # Query syntax characters are searched for as text instead of failing
+    assert store.search('remember AND (me OR "') is not None
+    assert store.search("   ") == []
+
+
+def test_search_follows_updated_outputs(store):
+    add_runs(store, 1)
+    save_output(store, "run00", "spec", "first draft about passwords")
+    save_output(store, "run00", "spec", "second draft about passkeys")
+    assert store.search("passwords") == []
+    assert len(store.search("passkeys")) == 1
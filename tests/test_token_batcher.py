@@ -0,0 +1,64 @@
+import threading
+import time
+
+from crewai_demo.web_ui.backend.token_batcher import TokenBatcher
+
+
+def make_batcher(**kwargs):
+    flushed = []
+    batcher = TokenBatcher(lambda key, text: flushed.append((key, text)), **kwargs)
+    return batcher, flushed
+
+
+def test_flushes_after_max_tokens():
+    batcher, flushed = make_batcher(interval=60, max_tokens=3)
+    for token in ["a", "b", "c", "d"]:
+        batcher.add("task", token)
+    assert flushed == [("task", "abc")]
+
+    batcher.flush()
+    assert flushed == [("task", "abc"), ("task", "d")]
+    # Nothing left to send
+    batcher.flush()
+    assert len(flushed) == 2
+
+
+def test_keys_are_batched_separately():
+    batcher, flushed = make_batcher(interval=60, max_tokens=2)
+    batcher.add("one", "a")
+    batcher.add("two", "x")
+    batcher.add("one", "b")
+    assert flushed == [("one", "ab")]
+
+    batcher.flush("two")
+    assert flushed == [("one", "ab"), ("two", "x")]
+
+
+def test_flush_stale_sends_batches_older_than_the_interval():
+    batcher, flushed = make_batcher(interval=0.05, max_tokens=100)
+    batcher.add("task", "a")
+    batcher.flush_stale()
+    assert flushed == []
+
+    time.sleep(0.06)
+    batcher.flush_stale()
+    assert flushed == [("task", "a")]
+
+
+def test_tokens_from_many_threads_arrive_complete():
+    batcher, flushed = make_batcher(interval=60, max_tokens=7)
+
+    def produce(key):
+        for i in range(200):
+            batcher.add(key, f"{i},")
+
+    threads = [threading.Thread(target=produce, args=(f"task{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.flush()
+
+    for n in range(4):
+        text = "".join(batch for key, batch in flushed if key == f"task{n}")
+        assert text == "".join(f"{i}," for i in range(200))
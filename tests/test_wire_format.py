@@ -0,0 +1,25 @@
+import json
+import zlib
+
+from crewai_demo.web_ui.backend import wire_format
+from crewai_demo.web_ui.backend.wire_format import DEFLATE, EncodedMessage, negotiate
+
+
+def test_negotiate_picks_a_supported_subprotocol():
+    assert negotiate(["crew.v1.msgpack", DEFLATE]) == DEFLATE
+    assert negotiate(["crew.v1.msgpack"]) is None
+    assert negotiate([]) is None
+
+
+def test_deflate_compresses_only_large_messages(monkeypatch):
+    monkeypatch.setattr(wire_format, "COMPRESS_MIN_BYTES", 100)
+    small = EncodedMessage({"type": "ping"})
+    assert json.loads(small.encode(DEFLATE)) == {"type": "ping"}
+
+    large = EncodedMessage({"type": "agent_output", "output": "x" * 500})
+    payload = large.encode(DEFLATE)
+    assert isinstance(payload, bytes)
+    assert json.loads(zlib.decompress(payload)) == {"type": "agent_output", "output": "x" * 500}
+    # Encoded once per format
+    assert large.encode(DEFLATE) is payload
+    assert json.loads(large.encode(None))["output"] == "x" * 500
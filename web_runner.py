@@ -30,7 +30,9 @@ def main():
     model = os.getenv("MODEL", "ollama/llama3:latest")
     api_base = os.getenv("API_BASE", "http://localhost:11434")
     
-    if openai_key:
+    if os.getenv("LLM_CASSETTE_MODE", "off").lower() == "replay":
+        print(f"✅ Replaying LLM cassette: {os.getenv('LLM_CASSETTE_PATH', 'cassettes/llm.jsonl')}")
+    elif openai_key:
         print("✅ OpenAI API key found - using OpenAI")
     elif "ollama" in model.lower():
         print(f"✅ Using Ollama model: {model}")